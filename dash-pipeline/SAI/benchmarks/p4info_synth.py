@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+#
+# Synthesize P4Info JSON programs, shaped like the DASH pipeline, to benchmark sai_api_gen.py.
+#
+# Usage: ./p4info_synth.py [--tables 100] [--keys 3] [--key-types exact,lpm,ternary,list,range_list]
+#                          [--actions 2] [--params 4] [--counters 0.5] [--tables-per-api 4] output.json
+#
+
+import argparse
+import json
+
+TABLE_ID_BASE = 33554432
+ACTION_ID_BASE = 16777216
+COUNTER_ID_BASE = 318767104
+KEY_TYPES = ['exact', 'lpm', 'ternary', 'list', 'range_list']
+
+# P4 field and bitwidth used for each match type, all accepted by sai_api_gen.py
+KEY_FIELDS = {
+    'exact': ('meta.field_%d', 32),
+    'lpm': ('meta.dst_addr_%d', 128),
+    'ternary': ('meta.field_%d', 32),
+    'list': ('meta.field_%d', 16),
+    'range_list': ('meta.port_%d', 16),
+}
+
+
+def make_key(key_id, match_type):
+    field, bitwidth = KEY_FIELDS[match_type]
+    key = {'id': key_id, 'name': '%s:key_%d' % (field % key_id, key_id), 'bitwidth': bitwidth}
+    if match_type in ('list', 'range_list'):
+        key['otherMatchType'] = match_type
+    else:
+        key['matchType'] = match_type.upper()
+    return key
+
+
+def make_p4info(tables=100, keys=3, key_types=KEY_TYPES, actions=2, params=4, counters=0.5, tables_per_api=4):
+    """ Build a P4Info program with the given shape.
+        Tables with a single key are SAI objects (keyed by <table>_id), the others are entries
+        using key_types in turn. The first param of every action references the previous table,
+        so object name resolution is exercised too. counters is the fraction of tables with a
+        direct counter. """
+    p4_tables = []
+    p4_actions = [{'preamble': {'id': ACTION_ID_BASE, 'name': 'NoAction', 'alias': 'NoAction'}}]
+    p4_counters = []
+    counter_step = int(1 / counters) if counters > 0 else 0
+    for i in range(tables):
+        table_name = 'table_%d' % i
+        if keys == 1:
+            match_fields = [{'id': 1, 'name': 'meta.%s_id:%s_id' % (table_name, table_name),
+                             'bitwidth': 16, 'matchType': 'EXACT'}]
+        else:
+            match_fields = [make_key(k + 1, key_types[(i + k) % len(key_types)]) for k in range(keys)]
+
+        action_refs = []
+        for a in range(actions):
+            action_id = ACTION_ID_BASE + len(p4_actions)
+            action_name = 'set_%s_action_%d' % (table_name, a)
+            action_params = [{'id': p + 1, 'name': 'param_%d' % p, 'bitwidth': 32} for p in range(params)]
+            if action_params:
+                action_params[0] = {'id': 1, 'name': 'table_%d_id' % max(i - 1, 0), 'bitwidth': 16}
+            p4_actions.append({'preamble': {'id': action_id, 'name': 'dash_ingress.' + action_name, 'alias': action_name},
+                               'params': action_params})
+            action_refs.append({'id': action_id})
+        action_refs.append({'id': ACTION_ID_BASE, 'scope': 'DEFAULT_ONLY'})
+
+        table_id = TABLE_ID_BASE + i
+        p4_tables.append({'preamble': {'id': table_id,
+                                       'name': 'dash_ingress.%s|dash_api_%d' % (table_name, i // tables_per_api),
+                                       'alias': table_name},
+                          'matchFields': match_fields,
+                          'actionRefs': action_refs})
+        if counter_step and i % counter_step == 0:
+            p4_counters.append({'preamble': {'id': COUNTER_ID_BASE + i, 'name': table_name + '_counter'},
+                                'directTableId': table_id})
+    return {'tables': p4_tables, 'actions': p4_actions, 'directCounters': p4_counters}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic P4Info generator')
+    parser.add_argument('output', type=str, help='Path of the P4Info JSON file to write')
+    parser.add_argument('--tables', type=int, default=100, help='Number of P4 tables')
+    parser.add_argument('--keys', type=int, default=3, help='Match keys per table, 1 makes every table a SAI object')
+    parser.add_argument('--key-types', type=str, default=','.join(KEY_TYPES), help='Comma separated match types used in turn')
+    parser.add_argument('--actions', type=int, default=2, help='Actions per table')
+    parser.add_argument('--params', type=int, default=4, help='Params per action')
+    parser.add_argument('--counters', type=float, default=0.5, help='Fraction of tables with a direct counter')
+    parser.add_argument('--tables-per-api', type=int, default=4, help='Number of tables in each SAI API')
+    args = parser.parse_args()
+
+    key_types = args.key_types.split(',')
+    for key_type in key_types:
+        if key_type not in KEY_TYPES:
+            parser.error('unsupported key type ' + key_type)
+
+    program = make_p4info(args.tables, args.keys, key_types, args.actions, args.params, args.counters, args.tables_per_api)
+    with open(args.output, 'w') as f:
+        json.dump(program, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
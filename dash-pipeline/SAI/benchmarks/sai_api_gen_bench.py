@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+#
+# Run the phases of sai_api_gen.py against synthetic P4Info programs and record
+# wall time and peak memory of each phase as JSON lines, one per configuration.
+#
+# Usage: ./sai_api_gen_bench.py [--tables 100,1000] [--keys 3] [--key-types ...] [--actions 2]
+#                               [--params 4] [--counters 0.5] [--jobs 1] [--output results.ndjson]
+#
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SAI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, SAI_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import sai_api_gen
+import p4info_synth
+
+# Minimal SAI headers holding the markers patched by sai_api_gen.py
+SAI_HEADERS = {
+    './SAI/experimental/saiextensions.h': '/* new experimental object type includes */\n'
+                                          '    /* Add new experimental APIs above this line */\n',
+    './SAI/experimental/saitypesextensions.h': '    /* Add new experimental object types above this line */\n',
+    './SAI/inc/saiobject.h': '/* new experimental object type includes */\n'
+                             '    /* Add new experimental entries above this line */\n',
+}
+
+
+class PhaseRecorder:
+    """ Record wall time and, if tracemalloc is running, peak Python memory of consecutive phases """
+
+    def __init__(self):
+        self.phases = {}
+
+    def run(self, name, func, *args):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = func(*args)
+        phase = {'wall_ms': round((time.perf_counter() - start) * 1000, 3)}
+        if tracemalloc.is_tracing():
+            phase['peak_kib'] = round((tracemalloc.get_traced_memory()[1] - base) / 1024, 1)
+        self.phases[name] = phase
+        return result
+
+
+def setup_workdir(workdir):
+    """ Lay out the directories sai_api_gen.py expects relative to its working directory """
+    os.symlink(os.path.join(SAI_DIR, 'templates'), os.path.join(workdir, 'templates'))
+    os.makedirs(os.path.join(workdir, 'lib'))
+    for path, content in SAI_HEADERS.items():
+        path = os.path.join(workdir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+
+def prepare_sai_apis(p4info, sai_apis, all_table_names):
+    table_names_hash = sai_api_gen.get_inputs_hash(all_table_names)
+    for sai_api in sai_apis:
+        sai_api_gen.resolve_object_names(sai_api, p4info)
+        p4info_slice = p4info.get_slice([table['id'] for table in sai_api[sai_api_gen.TABLES_TAG]])
+        sai_api_gen.get_inputs_hash(p4info_slice, table_names_hash)
+
+
+def render_and_write(output, sai_apis, jobs, split_tables):
+    for sai_api_files, _ in sai_api_gen.render_sai_apis(sai_apis, jobs, split_tables):
+        sai_api_gen.write_sai_files(output, sai_api_files)
+
+
+def write_shared_files(output, sai_apis, split_tables):
+    sai_api_gen.write_sai_makefile(output, sai_api_gen.get_sai_sources(sai_apis, split_tables))
+    sai_api_gen.write_sai_fixed_api_files(output, [sai_api['app_name'] for sai_api in sai_apis])
+
+
+def run_generator(program, jobs, split_tables):
+    """ Same phases as sai_api_gen.py main(), run in the current directory """
+    recorder = PhaseRecorder()
+    output = sai_api_gen.OutputWriter()
+    p4info = recorder.run('index P4Info', sai_api_gen.P4InfoIndex, program)
+    sai_apis, all_table_names = recorder.run('generate_sai_apis', sai_api_gen.generate_sai_apis, program, [], p4info)
+    recorder.run('resolve and hash', prepare_sai_apis, p4info, sai_apis, all_table_names)
+    recorder.run('load templates', sai_api_gen.preload_templates)
+    recorder.run('render SAI APIs', render_and_write, output, sai_apis, jobs, split_tables)
+    recorder.run('patch SAI headers', sai_api_gen.patch_sai_headers, output, sai_apis)
+    recorder.run('shared files', write_shared_files, output, sai_apis, split_tables)
+    return recorder.phases, len(sai_apis), len(output.changed)
+
+
+def get_git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=SAI_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench(args, tables):
+    config = {'tables': tables, 'keys': args.keys, 'key_types': args.key_types.split(','), 'actions': args.actions,
+              'params': args.params, 'counters': args.counters, 'tables_per_api': args.tables_per_api,
+              'jobs': args.jobs, 'split_tables': args.split_tables}
+    program = p4info_synth.make_p4info(tables, args.keys, config['key_types'], args.actions, args.params,
+                                       args.counters, args.tables_per_api)
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='sai_api_gen_bench_')
+    try:
+        setup_workdir(workdir)
+        os.chdir(workdir)
+        # Templates are compiled once per process, start every configuration from a cold cache
+        sai_api_gen.set_jinja_cache(sai_api_gen.SAI_LIB_DIR)
+        if args.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        phases, sai_api_count, file_count = run_generator(program, args.jobs, args.split_tables)
+        total_ms = round((time.perf_counter() - start) * 1000, 3)
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'revision': get_git_revision(),
+            'python': platform.python_version(), 'config': config,
+            'sai_apis': sai_api_count, 'files': file_count, 'phases': phases, 'total_ms': total_ms}
+
+
+def bench_process(args, tables, conn):
+    result = bench(args, tables)
+    # ru_maxrss is a high-water mark of the whole process, this one only ran this configuration
+    result['max_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if args.jobs > 1:
+        result['jobs_max_rss_kib'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    conn.send(result)
+
+
+def bench_isolated(args, tables):
+    """ Run bench() in a fresh interpreter, so that max_rss_kib is the peak of this configuration alone """
+    ctx = multiprocessing.get_context('spawn')
+    receiver, sender = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=bench_process, args=(args, tables, sender))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = None
+    process.join()
+    if result is None:
+        raise RuntimeError('benchmark of %d tables failed, exit code %s' % (tables, process.exitcode))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='sai_api_gen.py benchmark on synthetic P4Info')
+    parser.add_argument('--tables', type=str, default='100,1000', help='Comma separated numbers of P4 tables, one run each')
+    parser.add_argument('--keys', type=int, default=3, help='Match keys per table, 1 makes every table a SAI object')
+    parser.add_argument('--key-types', type=str, default=','.join(p4info_synth.KEY_TYPES), help='Comma separated match types used in turn')
+    parser.add_argument('--actions', type=int, default=2, help='Actions per table')
+    parser.add_argument('--params', type=int, default=4, help='Params per action')
+    parser.add_argument('--counters', type=float, default=0.5, help='Fraction of tables with a direct counter')
+    parser.add_argument('--tables-per-api', type=int, default=4, help='Number of tables in each SAI API')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Number of processes rendering SAI APIs')
+    parser.add_argument('--split-tables', action='store_true', help='Generate one libsai source per SAI table')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='Do not trace memory; tracing makes the phases slower')
+    parser.add_argument('--output', type=str, help='Append the results to this file instead of printing them')
+    args = parser.parse_args()
+
+    for tables in [int(tables) for tables in args.tables.split(',')]:
+        line = json.dumps(bench_isolated(args, tables))
+        if args.output:
+            with open(args.output, 'a') as f:
+                f.write(line + '\n')
+        else:
+            print(line)
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
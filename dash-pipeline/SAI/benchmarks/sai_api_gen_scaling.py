@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#
+# Check that building the SAI API model from P4Info stays near-linear
+# as the number of P4 tables and actions grows.
+#
+# Usage: ./sai_api_gen_scaling.py [--sizes 250,500,1000,2000,4000] [--max-exponent 1.25]
+#
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import sai_api_gen
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import p4info_synth
+
+
+def build_sai_model(program):
+    """ The P4Info processing done by sai_api_gen.py before rendering """
+    p4info = sai_api_gen.P4InfoIndex(program)
+    sai_apis, all_table_names = sai_api_gen.generate_sai_apis(program, [], p4info)
+    table_names_hash = sai_api_gen.get_inputs_hash(all_table_names)
+    for sai_api in sai_apis:
+        sai_api_gen.resolve_object_names(sai_api, p4info)
+        p4info_slice = p4info.get_slice([table['id'] for table in sai_api['tables']])
+        sai_api_gen.get_inputs_hash(p4info_slice, table_names_hash)
+    return sai_apis
+
+
+def measure(table_count, repeat):
+    best = None
+    for _ in range(repeat):
+        # Object tables with two actions, each referencing the previous table
+        program = p4info_synth.make_p4info(table_count, keys=1, actions=2, params=2)
+        start = time.perf_counter()
+        build_sai_model(program)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def get_scaling_exponent(samples):
+    """ Least-squares slope of log(time) over log(size) """
+    xs = [math.log(size) for size, _ in samples]
+    ys = [math.log(seconds) for _, seconds in samples]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    return sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / sum((x - x_mean) ** 2 for x in xs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='sai_api_gen.py P4Info scaling benchmark')
+    parser.add_argument('--sizes', type=str, default='250,500,1000,2000,4000', help='Comma separated numbers of P4 tables')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per size, the fastest one is kept')
+    parser.add_argument('--max-exponent', type=float, default=1.25, help='Fail if time grows faster than size^max-exponent')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    samples = []
+    print('  tables  actions  time(ms)  us/table')
+    for size in sizes:
+        seconds = measure(size, args.repeat)
+        samples.append((size, seconds))
+        print('%8d %8d %9.2f %9.2f' % (size, 2 * size, seconds * 1000, seconds * 1e6 / size))
+
+    exponent = get_scaling_exponent(samples)
+    print('Scaling exponent: %.2f (max %.2f)' % (exponent, args.max_exponent))
+    if exponent > args.max_exponent:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,13 @@ try:
     import argparse
     import shutil
     import copy
-    from jinja2 import Template, Environment, FileSystemLoader
+    import hashlib
+    import concurrent.futures
+    import difflib
+    import functools
+    import sys
+    import time
+    from jinja2 import Template, Environment, FileSystemLoader, FileSystemBytecodeCache
 except ImportError as ie:
     print("Import failed for " + ie.name)
     exit(1)
@@ -28,6 +34,22 @@ PARAM_ACTIONS = 'paramActions'
 OBJECT_NAME_TAG = 'objectName'
 SCOPE_TAG = 'scope'
 
+MANIFEST_VERSION = 1
+SAI_API_TEMPLATES = ['templates/saiapi.h.j2', 'templates/saiapi.cpp.j2']
+SAI_SHARED_TEMPLATES = ['templates/Makefile.j2', 'templates/utils.cpp.j2', 'templates/utils.h.j2', 'templates/saifixedapis.cpp.j2']
+SAI_PATCHED_HEADERS = ['./SAI/experimental/saiextensions.h', './SAI/experimental/saitypesextensions.h', './SAI/inc/saiobject.h']
+# Templates rendered without trim_blocks/lstrip_blocks, whitespace around their tags is significant
+UNTRIMMED_TEMPLATES = ['templates/Makefile.j2']
+# Output directory of the libsai sources
+SAI_LIB_DIR = './lib'
+# Bytecode cache of the compiled templates, under the output directory
+JINJA_CACHE_DIR = '.jinja_cache'
+
+# One environment per process and whitespace mode, so every template is only compiled once
+jinja_envs = {}
+# Directory of the bytecode cache, None to not cache the compiled templates
+jinja_cache_dir = None
+
 def get_sai_key_type(key_size, key_header, key_field):
     if key_size == 1:
         return 'bool', "booldata"
@@ -145,27 +167,67 @@ def extract_action_data(program):
     return action_data
 
 
-def table_with_counters(program, table_id):
-    for counter in program['directCounters']:
-        if counter['directTableId'] == table_id:
-            return 'true'
-    return 'false'
-
-def fill_action_params(table_params, param_names, action):
+class P4InfoIndex:
+    """ Dictionary lookups over a P4Info program, so generation does not scan it repeatedly """
+
+    def __init__(self, program):
+        self.tables = {}
+        self.table_positions = {}
+        for position, table in enumerate(program[TABLES_TAG]):
+            self.tables[table[PREAMBLE_TAG]['id']] = table
+            self.table_positions[table[PREAMBLE_TAG]['id']] = position
+        self.p4_actions = {}
+        self.action_positions = {}
+        for position, action in enumerate(program[ACTIONS_TAG]):
+            self.p4_actions[action[PREAMBLE_TAG]['id']] = action
+            self.action_positions[action[PREAMBLE_TAG]['id']] = position
+        self.actions = extract_action_data(program)
+        self.counters = {}
+        for counter in program['directCounters']:
+            self.counters.setdefault(counter['directTableId'], []).append(counter)
+        # SAI table name -> position of its last occurrence, used to resolve object references
+        self.sai_table_names = {}
+        self.sai_table_count = 0
+
+    def table_with_counters(self, table_id):
+        return 'true' if table_id in self.counters else 'false'
+
+    def add_sai_table_name(self, name):
+        self.sai_table_names[name] = self.sai_table_count
+        self.sai_table_count += 1
+
+    def find_object_name(self, table_ref):
+        """ Find the SAI table name that table_ref ends with, preferring the last generated table """
+        object_name = None
+        for start in range(len(table_ref)):
+            position = self.sai_table_names.get(table_ref[start:])
+            if position is not None and (object_name is None or position > self.sai_table_names[object_name]):
+                object_name = table_ref[start:]
+        return object_name
+
+    def get_slice(self, table_ids):
+        """ Only keep the P4Info tables, actions and direct counters of the given tables """
+        table_ids = sorted(set(table_ids), key=self.table_positions.get)
+        tables = [self.tables[table_id] for table_id in table_ids]
+        action_ids = set([action['id'] for table in tables for action in table[ACTION_REFS_TAG]])
+        actions = [self.p4_actions[action_id] for action_id in sorted(action_ids, key=self.action_positions.get)]
+        counters = [counter for table_id in table_ids for counter in self.counters.get(table_id, [])]
+        return {TABLES_TAG: tables, ACTIONS_TAG: actions, 'directCounters': counters}
+
+
+def fill_action_params(table_params, params_by_name, action):
     for param in action[PARAMS_TAG]:
         # skip v4/v6 selector
         if 'v4_or_v6' in param[NAME_TAG]:
            continue
-        if param[NAME_TAG] not in param_names:
-            param_names.append(param[NAME_TAG])
+        if param[NAME_TAG] not in params_by_name:
+            params_by_name[param[NAME_TAG]] = param
             param[PARAM_ACTIONS] = [action[NAME_TAG]]
             table_params.append(param)
         else:
             # ensure that same param passed to multiple actions of the
             # same P4 table does not generate more than 1 SAI attribute
-            for tbl_param in table_params:
-                if tbl_param[NAME_TAG] == param[NAME_TAG]:
-                    tbl_param[PARAM_ACTIONS].append(action[NAME_TAG])
+            params_by_name[param[NAME_TAG]][PARAM_ACTIONS].append(action[NAME_TAG])
 
     for param in action[PARAMS_TAG]:
         # mark presence of v4/v6 selector in the parent param
@@ -176,10 +238,13 @@ def fill_action_params(table_params, param_names, action):
                     param2["v4_or_v6_id"] = param['id']
                     break
 
-def generate_sai_apis(program, ignore_tables):
+def generate_sai_apis(program, ignore_tables, p4info=None):
+    if p4info is None:
+        p4info = P4InfoIndex(program)
     sai_apis = []
+    sai_apis_by_name = {}
     table_names = []
-    all_actions = extract_action_data(program)
+    all_actions = p4info.actions
     tables = sorted(program[TABLES_TAG], key=lambda k: k[PREAMBLE_TAG][NAME_TAG])
     for table in tables:
         sai_table_data = dict()
@@ -198,7 +263,7 @@ def generate_sai_apis(program, ignore_tables):
         else:
             sai_table_data[NAME_TAG] = table_name
         sai_table_data['id'] =  table[PREAMBLE_TAG]['id']
-        sai_table_data['with_counters'] = table_with_counters(program, sai_table_data['id'])
+        sai_table_data['with_counters'] = p4info.table_with_counters(sai_table_data['id'])
 
         if ':' in table_name:
             stage, group_name = table_name.split(':')
@@ -229,11 +294,11 @@ def generate_sai_apis(program, ignore_tables):
                 (key['match_type'] == 'list' and key['sai_list_type'] == 'sai_ip_prefix_list_t'):
                     sai_table_data['ipaddr_family_attr'] = 'true'
 
-        param_names = []
+        params_by_name = {}
         for action in table[ACTION_REFS_TAG]:
             action_id = action["id"]
             if all_actions[action_id][NAME_TAG] != NOACTION and not (SCOPE_TAG in action and action[SCOPE_TAG] == 'DEFAULT_ONLY'):
-                fill_action_params(sai_table_data[ACTION_PARAMS_TAG], param_names, all_actions[action_id])
+                fill_action_params(sai_table_data[ACTION_PARAMS_TAG], params_by_name, all_actions[action_id])
                 sai_table_data[ACTIONS_TAG].append(all_actions[action_id])
 
         if len(sai_table_data['keys']) == 1 and sai_table_data['keys'][0]['sai_key_name'].endswith(table_name.split('.')[-1] + '_id'):
@@ -245,17 +310,14 @@ def generate_sai_apis(program, ignore_tables):
             sai_table_data['name'] = sai_table_data['name'] + '_entry'
 
         table_names.append(sai_table_data[NAME_TAG])
-        is_new_api = True
-        for sai_api in sai_apis:
-            if sai_api['app_name'] == api_name:
-                sai_api[TABLES_TAG].append(sai_table_data)
-                is_new_api = False
-                break
-
-        if is_new_api:
+        p4info.add_sai_table_name(sai_table_data[NAME_TAG])
+        if api_name in sai_apis_by_name:
+            sai_apis_by_name[api_name][TABLES_TAG].append(sai_table_data)
+        else:
             new_api = dict()
             new_api['app_name'] = api_name
             new_api[TABLES_TAG] = [sai_table_data]
+            sai_apis_by_name[api_name] = new_api
             sai_apis.append(new_api)
 
     return sai_apis, table_names
@@ -273,165 +335,432 @@ def get_uniq_sai_api(sai_api):
     sai_api[TABLES_TAG] = tables
     return sai_api
 
-def write_sai_impl_files(sai_api):
-    env = Environment(loader=FileSystemLoader('.'), trim_blocks=True, lstrip_blocks=True)
-    env.add_extension('jinja2.ext.loopcontrols')
-    env.add_extension('jinja2.ext.do')
-    sai_impl_tm = env.get_template('/templates/saiapi.cpp.j2')
-    sai_impl_str = sai_impl_tm.render(tables = sai_api[TABLES_TAG], app_name = sai_api['app_name'])
-
-    with open('./lib/sai' + sai_api['app_name'].replace('_', '') + '.cpp', 'w') as o:
-        o.write(sai_impl_str)
-
-def write_sai_makefile(sai_api_name_list, sai_api_full_name_list):
-    env = Environment(loader=FileSystemLoader('.'))
-    makefile_tm = env.get_template('/templates/Makefile.j2')
-    makefile_str = makefile_tm.render(api_names = sai_api_name_list)
-
-    with open('./lib/Makefile', 'w') as o:
-        o.write(makefile_str)
-
-def write_sai_fixed_api_files(sai_api_full_name_list):
-    env = Environment(loader=FileSystemLoader('.'))
-
+def get_file_digest(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def get_file_digests(paths):
+    return {path: get_file_digest(path) for path in paths}
+
+def get_inputs_hash(*inputs):
+    """ Hash JSON-serializable generator inputs together with the generator itself """
+    h = hashlib.sha256()
+    h.update(get_file_digest(os.path.abspath(__file__)).encode())
+    for item in inputs:
+        h.update(json.dumps(item, sort_keys=True).encode())
+    return h.hexdigest()
+
+def get_sai_table_names(sai_api):
+    """ SAI table names of an API in table order, once per group of P4 tables (e.g. ACL stages) """
+    names = []
+    for table in sai_api[TABLES_TAG]:
+        if table[NAME_TAG] not in names:
+            names.append(table[NAME_TAG])
+    return names
+
+def get_sai_api_outputs(sai_api, split_tables=False):
+    """ Header and implementation paths of a SAI API, followed by one source per table with split_tables """
+    api_name = sai_api['app_name'].replace('_', '')
+    outputs = ['./SAI/experimental/saiexperimental' + api_name + '.h', SAI_LIB_DIR + '/sai' + api_name + '.cpp']
+    if split_tables:
+        outputs += [SAI_LIB_DIR + '/sai' + api_name + '_' + table_name + '.cpp' for table_name in get_sai_table_names(sai_api)]
+    return outputs
+
+def get_sai_sources(sai_apis, split_tables=False):
+    """ Sorted file names of all generated libsai sources, as listed in lib/Makefile """
+    return sorted([os.path.basename(path) for sai_api in sai_apis for path in get_sai_api_outputs(sai_api, split_tables)[1:]])
+
+def get_sai_shared_outputs():
+    return [SAI_LIB_DIR + '/' + filename for filename in ['Makefile', 'utils.cpp', 'utils.h', 'saifixedapis.cpp']]
+
+def load_manifest(path):
+    empty_manifest = {'version': MANIFEST_VERSION, 'apis': {}, 'shared': {}}
+    if not os.path.isfile(path):
+        return empty_manifest
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except ValueError:
+        print('Ignoring corrupted manifest ' + path)
+        return empty_manifest
+    if manifest.get('version') != MANIFEST_VERSION:
+        return empty_manifest
+    return manifest
+
+def save_manifest(path, manifest):
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def is_up_to_date(entry, inputs_hash):
+    """ Entry inputs are unchanged and its outputs were not modified or removed since the last run """
+    if entry is None or entry.get('hash') != inputs_hash:
+        return False
+    return get_file_digests(entry['outputs']) == entry['outputs']
+
+def set_jinja_cache(output_dir):
+    """ Cache the compiled templates in output_dir, or not at all if output_dir is None.
+        Drops the environments already created, so call it before loading the templates. """
+    global jinja_cache_dir
+    jinja_cache_dir = os.path.join(output_dir, JINJA_CACHE_DIR) if output_dir is not None else None
+    jinja_envs.clear()
+
+def get_jinja_env(trim_blocks):
+    if trim_blocks not in jinja_envs:
+        bytecode_cache = None
+        if jinja_cache_dir is not None:
+            os.makedirs(jinja_cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(jinja_cache_dir)
+        env = Environment(loader=FileSystemLoader('.'), trim_blocks=trim_blocks, lstrip_blocks=trim_blocks,
+                          bytecode_cache=bytecode_cache)
+        env.add_extension('jinja2.ext.loopcontrols')
+        env.add_extension('jinja2.ext.do')
+        jinja_envs[trim_blocks] = env
+    return jinja_envs[trim_blocks]
+
+def get_template(template_name):
+    return get_jinja_env(template_name not in UNTRIMMED_TEMPLATES).get_template(template_name)
+
+def preload_templates():
+    """ Compile (or load from the bytecode cache) all templates up front.
+        Pool workers forked afterwards inherit the compiled templates.
+        Returns a dict of template name -> load time in seconds. """
+    load_times = {}
+    for template_name in SAI_API_TEMPLATES + SAI_SHARED_TEMPLATES:
+        start = time.perf_counter()
+        get_template(template_name)
+        load_times[template_name] = time.perf_counter() - start
+    return load_times
+
+def render_template(template_name, timings=None, **params):
+    """ Render a template, appending (template_name, seconds) to timings if given """
+    template = get_template(template_name)
+    start = time.perf_counter()
+    rendered = template.render(**params)
+    if timings is not None:
+        timings.append((template_name, time.perf_counter() - start))
+    return rendered
+
+def render_sai_impl_file(sai_api, timings=None, tables=None, emit_tables=True, emit_api=True):
+    """ Render the implementation of the given tables (all tables of the API by default).
+        emit_tables selects the table functions, emit_api the API struct. """
+    if tables is None:
+        tables = sai_api[TABLES_TAG]
+    return render_template('templates/saiapi.cpp.j2', timings, tables = tables, app_name = sai_api['app_name'],
+                           emit_tables = emit_tables, emit_api = emit_api)
+
+def render_sai_header_file(sai_api, timings=None):
+    return render_template('templates/saiapi.h.j2', timings, sai_api = sai_api)
+
+def render_sai_api_files(sai_api, split_tables=False):
+    """ Render the header and implementation of one SAI API.
+        With split_tables, each table gets its own translation unit and the implementation
+        file only holds the API struct dispatching to them.
+        Returns the (path, content) pairs and the (template_name, seconds) render timings.
+        Nothing is written here, so it can run in a worker process. """
+    outputs = get_sai_api_outputs(sai_api, split_tables)
+    header_path, impl_path = outputs[:2]
+    timings = []
+    sai_api_files = [(header_path, render_sai_header_file(get_uniq_sai_api(sai_api), timings))]
+    if not split_tables:
+        sai_api_files.append((impl_path, render_sai_impl_file(sai_api, timings)))
+        return sai_api_files, timings
+
+    sai_api_files.append((impl_path, render_sai_impl_file(sai_api, timings, emit_tables=False)))
+    for table_path, table_name in zip(outputs[2:], get_sai_table_names(sai_api)):
+        tables = [table for table in sai_api[TABLES_TAG] if table[NAME_TAG] == table_name]
+        sai_api_files.append((table_path, render_sai_impl_file(sai_api, timings, tables, emit_api=False)))
+    return sai_api_files, timings
+
+def render_sai_apis(sai_apis, jobs, split_tables=False):
+    """ Render all SAI APIs, in a process pool when jobs > 1. Results keep the order of sai_apis. """
+    render = functools.partial(render_sai_api_files, split_tables=split_tables)
+    if jobs > 1 and len(sai_apis) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(render, sai_apis))
+    return [render(sai_api) for sai_api in sai_apis]
+
+class OutputWriter:
+    """ Write generated files only when their content changes, so unchanged outputs keep their mtime.
+        With dry_run nothing is written; with diff a unified diff of every change is printed. """
+
+    def __init__(self, dry_run=False, diff=False):
+        self.dry_run = dry_run
+        self.diff = diff
+        self.changed = []
+        self.unchanged = []
+
+    def write(self, path, content):
+        """ Returns True if the file was (or, in dry run, would be) changed """
+        data = content.encode()
+        old_data = None
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                old_data = f.read()
+        if old_data == data:
+            self.unchanged.append(path)
+            return False
+
+        self.changed.append(path)
+        if self.diff:
+            old_lines = old_data.decode().splitlines(True) if old_data is not None else []
+            from_file = 'a/' + os.path.normpath(path) if old_data is not None else '/dev/null'
+            for line in difflib.unified_diff(old_lines, content.splitlines(True), from_file, 'b/' + os.path.normpath(path)):
+                sys.stdout.write(line if line.endswith('\n') else line + '\n\\ No newline at end of file\n')
+        if not self.dry_run:
+            with open(path, 'wb') as o:
+                o.write(data)
+        return True
+
+def write_sai_makefile(output, sai_api_sources, timings=None):
+    makefile_str = render_template('templates/Makefile.j2', timings, sources = sai_api_sources)
+    output.write(SAI_LIB_DIR + '/Makefile', makefile_str)
+
+def write_sai_fixed_api_files(output, sai_api_full_name_list, timings=None):
     for filename in ['utils.cpp', 'utils.h', 'saifixedapis.cpp']:
-        env = Environment(loader=FileSystemLoader('.'), trim_blocks=True, lstrip_blocks=True)
-        sai_impl_tm = env.get_template('/templates/%s.j2' % filename)
-        sai_impl_str = sai_impl_tm.render(tables = sai_api[TABLES_TAG], app_name = sai_api['app_name'], api_names = sai_api_full_name_list)
-
-        with open('./lib/%s' % filename, 'w') as o:
-            o.write(sai_impl_str)
-
-
-def write_sai_files(sai_api):
-    # The main file
-    with open('templates/saiapi.h.j2', 'r') as sai_header_tm_file:
-        sai_header_tm_str = sai_header_tm_file.read()
-
-    env = Environment(loader=FileSystemLoader('.'), trim_blocks=True, lstrip_blocks=True)
-    env.add_extension('jinja2.ext.loopcontrols')
-    env.add_extension('jinja2.ext.do')
-    sai_header_tm = env.get_template('templates/saiapi.h.j2')
-    sai_header_str = sai_header_tm.render(sai_api = sai_api)
-
-    with open('./SAI/experimental/saiexperimental' + sai_api['app_name'].replace('_', '') + '.h', 'w') as o:
-        o.write(sai_header_str)
-
-    # The SAI Extensions
-    with open('./SAI/experimental/saiextensions.h', 'r') as f:
+        sai_impl_str = render_template('templates/%s.j2' % filename, timings, api_names = sai_api_full_name_list)
+        output.write('%s/%s' % (SAI_LIB_DIR, filename), sai_impl_str)
+
+def write_sai_files(output, sai_api_files):
+    for path, content in sai_api_files:
+        output.write(path, content)
+
+def get_sai_header_insertions(sai_apis):
+    """ Collect the entries all SAI APIs need in the shared SAI headers.
+        Returns a dict of header path -> list of (marker, position, key_line, new_lines) in API order.
+        key_line is the line used to detect an entry which is already present. """
+    insertions = {header: [] for header in SAI_PATCHED_HEADERS}
+    for sai_api in sai_apis:
+        sai_api = get_uniq_sai_api(sai_api)
+        api_name = sai_api['app_name'].replace('_', '')
+
+        # The SAI Extensions
+        new_line = '    SAI_API_' + sai_api['app_name'].upper() + ',\n'
+        insertions['./SAI/experimental/saiextensions.h'].append(('Add new experimental APIs above this line', 'before', new_line, [new_line + '\n']))
+        new_line = '#include "saiexperimental' + api_name + '.h"\n'
+        insertions['./SAI/experimental/saiextensions.h'].append(('new experimental object type includes', 'after', new_line, [new_line]))
+
+        # The SAI Type Extensions
+        for table in sai_api[TABLES_TAG]:
+            new_line = '    SAI_OBJECT_TYPE_' + table[NAME_TAG].upper() + ',\n'
+            insertions['./SAI/experimental/saitypesextensions.h'].append(('Add new experimental object types above this line', 'before', new_line, [new_line + '\n']))
+
+        # The SAI object struct for entries
+        for table in sai_api[TABLES_TAG]:
+            if table['is_object'] == 'false':
+                new_line = '    sai_' + table[NAME_TAG] + '_t ' + table[NAME_TAG] + ';\n'
+                insertions['./SAI/inc/saiobject.h'].append(('Add new experimental entries above this line', 'before', new_line,
+                    ['    /** @validonly object_type == SAI_OBJECT_TYPE_' + table[NAME_TAG].upper() + ' */\n', new_line + '\n']))
+        new_line = '#include "../experimental/saiexperimental' + api_name + '.h"\n'
+        insertions['./SAI/inc/saiobject.h'].append(('new experimental object type includes', 'after', new_line, [new_line]))
+
+    return insertions
+
+def patch_sai_header(output, path, insertions):
+    """ Apply all insertions to one header with a single read and at most one write.
+        Entries are placed as if they were inserted one by one: 'before' entries keep their order
+        above the marker, 'after' entries end up right below the marker in reverse order.
+        Returns the key lines which were added. """
+    with open(path, 'r') as f:
         lines = f.readlines()
 
-    new_lines = []
-    for line in lines:
-        if 'Add new experimental APIs above this line' in line:
-            new_line = '    SAI_API_' + sai_api['app_name'].upper() + ',\n'
-            if new_line not in lines:
-                new_lines.append(new_line + '\n')
-        if 'new experimental object type includes' in line:
-            new_lines.append(line)
-            new_line = '#include "saiexperimental' + sai_api['app_name'].replace('_', '') + '.h"\n'
-            if new_line not in lines:
-                new_lines.append(new_line)
+    present_lines = set(lines)
+    lines_before = {}
+    lines_after = {}
+    added = []
+    for marker, position, key_line, new_lines in insertions:
+        if key_line in present_lines:
             continue
+        present_lines.add(key_line)
+        if position == 'before':
+            lines_before.setdefault(marker, []).extend(new_lines)
+        else:
+            lines_after.setdefault(marker, []).insert(0, ''.join(new_lines))
+        added.append(key_line.strip())
 
-        new_lines.append(line)
-
-    with open('./SAI/experimental/saiextensions.h', 'w') as f:
-        f.write(''.join(new_lines))
-
-    # The SAI Type Extensions
-    with open('./SAI/experimental/saitypesextensions.h', 'r') as f:
-        lines = f.readlines()
-
-    new_lines = []
-    for line in lines:
-        if 'Add new experimental object types above this line' in line:
-            
-            for table in sai_api[TABLES_TAG]:
-                new_line = '    SAI_OBJECT_TYPE_' + table[NAME_TAG].upper() + ',\n'
-                if new_line not in lines:
-                    new_lines.append(new_line + '\n')
-
-        new_lines.append(line)
-
-    with open('./SAI/experimental/saitypesextensions.h', 'w') as f:
-        f.write(''.join(new_lines))
-
-    # The SAI object struct for entries
-    with open('./SAI/inc/saiobject.h', 'r') as f:
-        lines = f.readlines()
+    if not added:
+        return added
 
-    new_lines = []
+    patched_lines = []
     for line in lines:
-        if 'Add new experimental entries above this line' in line:
-            for table in sai_api[TABLES_TAG]:
-                if table['is_object'] == 'false':
-                    new_line = '    sai_' + table[NAME_TAG] + '_t ' + table[NAME_TAG] + ';\n'
-                    if new_line not in lines:
-                        new_lines.append('    /** @validonly object_type == SAI_OBJECT_TYPE_' + table[NAME_TAG].upper() + ' */\n')
-                        new_lines.append(new_line + '\n')
-        if 'new experimental object type includes' in line:
-            new_lines.append(line)
-            new_line = '#include "../experimental/saiexperimental' + sai_api['app_name'].replace('_', '') + '.h"\n'
-            if new_line not in lines:
-                new_lines.append(new_line)
-            continue
-
-        new_lines.append(line)
-
-    with open('./SAI/inc/saiobject.h', 'w') as f:
-        f.write(''.join(new_lines))
-
-
-
-# CLI
-parser = argparse.ArgumentParser(description='P4 SAI API generator')
-parser.add_argument('filepath', type=str, help='Path to P4 program RUNTIME JSON file')
-parser.add_argument('apiname', type=str, help='Name of the new SAI API')
-parser.add_argument('--print-sai-lib', type=bool)
-parser.add_argument('--ignore-tables', type=str, default='', help='Comma separated list of tables to ignore')
-args = parser.parse_args()
-
-if not os.path.isfile(args.filepath):
-    print('File ' + args.filepath + ' does not exist')
-    exit(1)
-
-# 
-# Get SAI dictionary from P4 dictionary
-print("Generating SAI API...")
-with open(args.filepath) as json_program_file:
-    json_program = json.load(json_program_file)
-
-sai_apis, all_table_names = generate_sai_apis(json_program, args.ignore_tables.split(','))
-
-sai_api_name_list = []
-sai_api_full_name_list = []
-for sai_api in sai_apis:
+        for marker in lines_before:
+            if marker in line:
+                patched_lines.extend(lines_before[marker])
+        patched_lines.append(line)
+        for marker in lines_after:
+            if marker in line:
+                patched_lines.extend(lines_after[marker])
+
+    output.write(path, ''.join(patched_lines))
+    return added
+
+def patch_sai_headers(output, sai_apis):
+    """ Register all SAI APIs in the shared SAI headers, writing each header at most once.
+        Returns a dict of header path -> list of added lines. """
+    changes = {}
+    for path, insertions in get_sai_header_insertions(sai_apis).items():
+        added = patch_sai_header(output, path, insertions)
+        if added:
+            changes[path] = added
+    return changes
+
+def print_profile(load_times, sai_api_timings, shared_timings, phase_times):
+    """ Print template compile/render times per template and per SAI API for --profile """
+    render_times = {}
+    for timings in list(sai_api_timings.values()) + [shared_timings]:
+        for template_name, seconds in timings:
+            render_times.setdefault(template_name, []).append(seconds)
+
+    print('Template                         compile(ms)  renders  render total(ms)  render max(ms)')
+    for template_name in SAI_API_TEMPLATES + SAI_SHARED_TEMPLATES:
+        renders = render_times.get(template_name, [])
+        print('  %-30s %11.2f  %7d  %16.2f  %14.2f' % (template_name, load_times[template_name] * 1000,
+              len(renders), sum(renders) * 1000, max(renders, default=0) * 1000))
+
+    print('SAI API                          ' + ''.join(['%-20s' % os.path.basename(t) for t in SAI_API_TEMPLATES]) + 'total(ms)')
+    for app_name, timings in sai_api_timings.items():
+        per_template = [sum([seconds for name, seconds in timings if name == t]) for t in SAI_API_TEMPLATES]
+        print('  %-30s ' % app_name + ''.join(['%-20.2f' % (seconds * 1000) for seconds in per_template]) +
+              '%.2f' % (sum(per_template) * 1000))
+
+    print('Phase                            time(ms)')
+    for phase, seconds in phase_times.items():
+        print('  %-30s %8.2f' % (phase, seconds * 1000))
+
+
+def resolve_object_names(sai_api, p4info):
     # Update object name reference for action params
     for table in sai_api[TABLES_TAG]:
         for param in table[ACTION_PARAMS_TAG]:
             if param['type'] == 'sai_object_id_t':
-                table_ref = param[NAME_TAG][:-len("_id")]
-                for table_name in all_table_names:
-                    if table_ref.endswith(table_name):
-                        param[OBJECT_NAME_TAG] = table_name
+                object_name = p4info.find_object_name(param[NAME_TAG][:-len("_id")])
+                if object_name:
+                    param[OBJECT_NAME_TAG] = object_name
     # Update object name reference for keys
     for table in sai_api[TABLES_TAG]:
         for key in table['keys']:
             if 'sai_key_type' in key:
                 if key['sai_key_type'] == 'sai_object_id_t':
-                    table_ref = key['sai_key_name'][:-len("_id")]
-                    for table_name in all_table_names:
-                        if table_ref.endswith(table_name):
-                            key[OBJECT_NAME_TAG] = table_name
-    # Write SAI dictionary into SAI API headers
-    write_sai_files(get_uniq_sai_api(sai_api))
-    write_sai_impl_files(sai_api)
-    sai_api_name_list.append(sai_api['app_name'].replace('_', ''))
-    sai_api_full_name_list.append(sai_api['app_name'])
-
-write_sai_makefile(sai_api_name_list, sai_api_full_name_list)
-write_sai_fixed_api_files(sai_api_full_name_list)
-
-if args.print_sai_lib:
-    print(json.dumps(sai_api, indent=2))
+                    object_name = p4info.find_object_name(key['sai_key_name'][:-len("_id")])
+                    if object_name:
+                        key[OBJECT_NAME_TAG] = object_name
+
+
+def main():
+    # CLI
+    parser = argparse.ArgumentParser(description='P4 SAI API generator')
+    parser.add_argument('filepath', type=str, help='Path to P4 program RUNTIME JSON file')
+    parser.add_argument('apiname', type=str, help='Name of the new SAI API')
+    parser.add_argument('--print-sai-lib', type=bool)
+    parser.add_argument('--ignore-tables', type=str, default='', help='Comma separated list of tables to ignore')
+    parser.add_argument('--incremental', action='store_true', help='Only regenerate SAI APIs whose P4 tables or templates changed since the last run')
+    parser.add_argument('--manifest', type=str, default=SAI_LIB_DIR + '/sai_api_gen_manifest.json', help='Path to the manifest used by --incremental')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Number of processes rendering SAI APIs in parallel, 0 for one per CPU')
+    parser.add_argument('--profile', action='store_true', help='Print compile and render time per template and per SAI API')
+    parser.add_argument('--check', action='store_true', help='Do not write anything, exit with status 1 if any generated file would change')
+    parser.add_argument('--diff', action='store_true', help='Do not write anything, print a unified diff of the generated files instead')
+    parser.add_argument('--split-tables', action='store_true', help='Generate one libsai source per SAI table instead of one per SAI API')
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.filepath):
+        print('File ' + args.filepath + ' does not exist')
+        exit(1)
+
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    output = OutputWriter(dry_run=args.check or args.diff, diff=args.diff)
+    # Keep stdout for the diff only, so it can be fed to patch or git apply
+    log = sys.stderr if args.diff else sys.stdout
+
+    phase_times = {}
+    phase_start = time.perf_counter()
+
+    # 
+    # Get SAI dictionary from P4 dictionary
+    print("Generating SAI API...", file=log)
+    with open(args.filepath) as json_program_file:
+        json_program = json.load(json_program_file)
+
+    p4info = P4InfoIndex(json_program)
+    sai_apis, all_table_names = generate_sai_apis(json_program, args.ignore_tables.split(','), p4info)
+    phase_times['generate_sai_apis'] = time.perf_counter() - phase_start
+    phase_start = time.perf_counter()
+
+    manifest = load_manifest(args.manifest)
+    new_manifest = {'version': MANIFEST_VERSION, 'apis': {}, 'shared': {}}
+    sai_api_templates = [get_file_digest(template) for template in SAI_API_TEMPLATES]
+
+    sai_api_full_name_list = []
+    sai_api_hashes = {}
+    dirty_sai_apis = []
+    # Object references may point to any table, so every SAI API depends on all table names
+    table_names_hash = get_inputs_hash(all_table_names)
+    for sai_api in sai_apis:
+        resolve_object_names(sai_api, p4info)
+        p4info_slice = p4info.get_slice([table['id'] for table in sai_api[TABLES_TAG]])
+        sai_api_hash = get_inputs_hash(p4info_slice, table_names_hash, sai_api_templates, args.split_tables)
+        sai_api_hashes[sai_api['app_name']] = sai_api_hash
+        if not args.incremental or not is_up_to_date(manifest['apis'].get(sai_api['app_name']), sai_api_hash):
+            dirty_sai_apis.append(sai_api)
+        sai_api_full_name_list.append(sai_api['app_name'])
+    phase_times['hash inputs'] = time.perf_counter() - phase_start
+    phase_start = time.perf_counter()
+
+    # --check and --diff write nothing, not even the template cache
+    set_jinja_cache(None if output.dry_run else SAI_LIB_DIR)
+    load_times = preload_templates()
+    phase_times['load templates'] = time.perf_counter() - phase_start
+    phase_start = time.perf_counter()
+
+    # Write SAI dictionary into SAI API headers.
+    # Rendering may run in parallel, but files are merged in API order to match a serial run.
+    sai_api_timings = {}
+    for sai_api, (sai_api_files, timings) in zip(dirty_sai_apis, render_sai_apis(dirty_sai_apis, jobs, args.split_tables)):
+        write_sai_files(output, sai_api_files)
+        sai_api_timings[sai_api['app_name']] = timings
+        if args.incremental:
+            print('  Regenerated ' + sai_api['app_name'], file=log)
+    phase_times['render SAI APIs'] = time.perf_counter() - phase_start
+    phase_start = time.perf_counter()
+
+    # Entries already present are skipped, so all APIs are checked even in incremental mode.
+    # This also restores entries if the SAI submodule headers were reset.
+    for path, added in patch_sai_headers(output, sai_apis).items():
+        print('  Added %d entries to %s' % (len(added), path), file=log)
+    phase_times['patch SAI headers'] = time.perf_counter() - phase_start
+    phase_start = time.perf_counter()
+
+    for sai_api in sai_apis:
+        new_manifest['apis'][sai_api['app_name']] = {'hash': sai_api_hashes[sai_api['app_name']],
+                                                     'outputs': get_file_digests(get_sai_api_outputs(sai_api, args.split_tables))}
+
+    sai_api_sources = get_sai_sources(sai_apis, args.split_tables)
+    shared_hash = get_inputs_hash(sai_api_full_name_list, sai_api_sources, [get_file_digest(template) for template in SAI_SHARED_TEMPLATES])
+    shared_timings = []
+    if not args.incremental or not is_up_to_date(manifest['shared'], shared_hash):
+        write_sai_makefile(output, sai_api_sources, shared_timings)
+        write_sai_fixed_api_files(output, sai_api_full_name_list, shared_timings)
+    new_manifest['shared'] = {'hash': shared_hash, 'outputs': get_file_digests(get_sai_shared_outputs())}
+    if new_manifest != manifest and not output.dry_run:
+        save_manifest(args.manifest, new_manifest)
+    phase_times['shared files'] = time.perf_counter() - phase_start
+
+    if args.profile:
+        print_profile(load_times, sai_api_timings, shared_timings, phase_times)
+
+    if output.dry_run:
+        for path in output.changed:
+            print('  Would change ' + path, file=log)
+    else:
+        print('  Wrote %d changed files, %d unchanged' % (len(output.changed), len(output.unchanged)))
+
+    if args.print_sai_lib:
+        print(json.dumps(sai_api, indent=2))
+
+    if args.check and output.changed:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+// Microbenchmark of ENI creation through libsai.
+// Creates and removes ENIs one by one, then with the bulk API, and prints the latencies.
+// Run it against two libsai builds to compare them, e.g. before and after a generator change.
+//
+// Usage: ./eni_create_bench [count]
+
+#include <algorithm>
+#include <chrono>
+#include <iostream>
+#include <vector>
+#include <stdlib.h>
+#include <string.h>
+
+#include <sai.h>
+
+extern sai_status_t sai_create_vnet(
+        _Out_ sai_object_id_t *vnet_id,
+        _In_ sai_object_id_t switch_id,
+        _In_ uint32_t attr_count,
+        _In_ const sai_attribute_t *attr_list);
+extern sai_status_t sai_remove_vnet(_In_ sai_object_id_t vnet_id);
+
+extern sai_status_t sai_create_dash_acl_group(
+        _Out_ sai_object_id_t *acl_group_id,
+        _In_ sai_object_id_t switch_id,
+        _In_ uint32_t attr_count,
+        _In_ const sai_attribute_t *attr_list);
+extern sai_status_t sai_remove_dash_acl_group(
+        _In_ sai_object_id_t acl_group_id);
+
+extern sai_status_t sai_create_eni(
+        _Out_ sai_object_id_t *eni_id,
+        _In_ sai_object_id_t switch_id,
+        _In_ uint32_t attr_count,
+        _In_ const sai_attribute_t *attr_list);
+extern sai_status_t sai_remove_eni(
+        _In_ sai_object_id_t eni_id);
+
+extern sai_status_t sai_create_enis(
+        _In_ sai_object_id_t switch_id,
+        _In_ uint32_t object_count,
+        _In_ const uint32_t *attr_count,
+        _In_ const sai_attribute_t **attr_list,
+        _In_ sai_bulk_op_error_mode_t mode,
+        _Out_ sai_object_id_t *object_id,
+        _Out_ sai_status_t *object_statuses);
+extern sai_status_t sai_remove_enis(
+        _In_ uint32_t object_count,
+        _In_ const sai_object_id_t *object_id,
+        _In_ sai_bulk_op_error_mode_t mode,
+        _Out_ sai_status_t *object_statuses);
+
+using Clock = std::chrono::steady_clock;
+
+static double elapsedUs(Clock::time_point start)
+{
+    return std::chrono::duration<double, std::micro>(Clock::now() - start).count();
+}
+
+static void printLatencies(const char *name, std::vector<double> &latencies)
+{
+    std::sort(latencies.begin(), latencies.end());
+    double total = 0;
+    for (auto latency : latencies)
+    {
+        total += latency;
+    }
+    std::cout << name
+              << ": count " << latencies.size()
+              << ", mean " << total / latencies.size() << " us"
+              << ", p50 " << latencies[latencies.size() / 2] << " us"
+              << ", p99 " << latencies[latencies.size() * 99 / 100] << " us" << std::endl;
+}
+
+// The ENI attributes of vnet_out, 27 in total
+static std::vector<sai_attribute_t> makeEniAttrs(sai_object_id_t vnet_id, sai_object_id_t acl_group_id)
+{
+    std::vector<sai_attribute_t> attrs;
+    sai_attribute_t attr;
+
+    attr.id = SAI_ENI_ATTR_CPS;
+    attr.value.u32 = 10000;
+    attrs.push_back(attr);
+
+    attr.id = SAI_ENI_ATTR_PPS;
+    attr.value.u32 = 100000;
+    attrs.push_back(attr);
+
+    attr.id = SAI_ENI_ATTR_FLOWS;
+    attr.value.u32 = 100000;
+    attrs.push_back(attr);
+
+    attr.id = SAI_ENI_ATTR_ADMIN_STATE;
+    attr.value.booldata = true;
+    attrs.push_back(attr);
+
+    attr.id = SAI_ENI_ATTR_VM_UNDERLAY_DIP;
+    sai_ip_addr_t u_dip_addr = {.ip4 = 0x010310ac};
+    sai_ip_address_t u_dip = {.addr_family = SAI_IP_ADDR_FAMILY_IPV4,
+                              .addr = u_dip_addr};
+    attr.value.ipaddr = u_dip;
+    attrs.push_back(attr);
+
+    attr.id = SAI_ENI_ATTR_VM_VNI;
+    attr.value.u32 = 9;
+    attrs.push_back(attr);
+
+    attr.id = SAI_ENI_ATTR_VNET_ID;
+    attr.value.u32 = vnet_id;
+    attrs.push_back(attr);
+
+    const sai_attr_id_t acl_group_attrs[] = {
+        SAI_ENI_ATTR_INBOUND_V4_STAGE1_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_INBOUND_V4_STAGE2_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_INBOUND_V4_STAGE3_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_INBOUND_V4_STAGE4_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_INBOUND_V4_STAGE5_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_OUTBOUND_V4_STAGE1_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_OUTBOUND_V4_STAGE2_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_OUTBOUND_V4_STAGE3_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_OUTBOUND_V4_STAGE4_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_OUTBOUND_V4_STAGE5_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_INBOUND_V6_STAGE1_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_INBOUND_V6_STAGE2_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_INBOUND_V6_STAGE3_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_INBOUND_V6_STAGE4_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_INBOUND_V6_STAGE5_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_OUTBOUND_V6_STAGE1_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_OUTBOUND_V6_STAGE2_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_OUTBOUND_V6_STAGE3_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_OUTBOUND_V6_STAGE4_DASH_ACL_GROUP_ID,
+        SAI_ENI_ATTR_OUTBOUND_V6_STAGE5_DASH_ACL_GROUP_ID,
+    };
+    for (auto id : acl_group_attrs)
+    {
+        attr.id = id;
+        attr.value.oid = acl_group_id;
+        attrs.push_back(attr);
+    }
+    return attrs;
+}
+
+int main(int argc, char **argv)
+{
+    uint32_t count = argc > 1 ? atoi(argv[1]) : 1000;
+    sai_object_id_t switch_id = SAI_NULL_OBJECT_ID;
+    sai_attribute_t attr;
+    std::vector<sai_attribute_t> attrs;
+    sai_object_id_t acl_group_id;
+    sai_object_id_t vnet_id;
+    sai_status_t status;
+
+    attr.id = SAI_DASH_ACL_GROUP_ATTR_IP_ADDR_FAMILY;
+    attr.value.s32 = SAI_IP_ADDR_FAMILY_IPV4;
+    attrs.push_back(attr);
+    status = sai_create_dash_acl_group(&acl_group_id, switch_id, attrs.size(), attrs.data());
+    if (status != SAI_STATUS_SUCCESS)
+    {
+        std::cout << "Failed to create Dash ACL group" << std::endl;
+        return 1;
+    }
+
+    attrs.clear();
+    attr.id = SAI_VNET_ATTR_VNI;
+    attr.value.u32 = 9;
+    attrs.push_back(attr);
+    status = sai_create_vnet(&vnet_id, switch_id, attrs.size(), attrs.data());
+    if (status != SAI_STATUS_SUCCESS)
+    {
+        std::cout << "Failed to create VNET table entry" << std::endl;
+        return 1;
+    }
+
+    attrs = makeEniAttrs(vnet_id, acl_group_id);
+    std::vector<sai_object_id_t> eni_ids(count);
+    std::vector<double> latencies;
+
+    // One by one
+    for (uint32_t i = 0; i < count; i++)
+    {
+        auto start = Clock::now();
+        status = sai_create_eni(&eni_ids[i], switch_id, attrs.size(), attrs.data());
+        latencies.push_back(elapsedUs(start));
+        if (status != SAI_STATUS_SUCCESS)
+        {
+            std::cout << "Failed to create ENI object " << i << std::endl;
+            return 1;
+        }
+    }
+    printLatencies("sai_create_eni", latencies);
+
+    latencies.clear();
+    for (uint32_t i = 0; i < count; i++)
+    {
+        auto start = Clock::now();
+        status = sai_remove_eni(eni_ids[i]);
+        latencies.push_back(elapsedUs(start));
+        if (status != SAI_STATUS_SUCCESS)
+        {
+            std::cout << "Failed to remove ENI object " << eni_ids[i] << std::endl;
+            return 1;
+        }
+    }
+    printLatencies("sai_remove_eni", latencies);
+
+    // Bulk
+    std::vector<uint32_t> attr_counts(count, attrs.size());
+    std::vector<const sai_attribute_t *> attr_lists(count, attrs.data());
+    std::vector<sai_status_t> statuses(count);
+
+    auto start = Clock::now();
+    status = sai_create_enis(switch_id, count, attr_counts.data(), attr_lists.data(),
+                             SAI_BULK_OP_ERROR_MODE_STOP_ON_ERROR, eni_ids.data(), statuses.data());
+    double total = elapsedUs(start);
+    if (status != SAI_STATUS_SUCCESS)
+    {
+        std::cout << "Failed to bulk create ENI objects" << std::endl;
+        return 1;
+    }
+    std::cout << "sai_create_enis: count " << count << ", total " << total << " us, mean " << total / count << " us" << std::endl;
+
+    start = Clock::now();
+    status = sai_remove_enis(count, eni_ids.data(), SAI_BULK_OP_ERROR_MODE_STOP_ON_ERROR, statuses.data());
+    total = elapsedUs(start);
+    if (status != SAI_STATUS_SUCCESS)
+    {
+        std::cout << "Failed to bulk remove ENI objects" << std::endl;
+        return 1;
+    }
+    std::cout << "sai_remove_enis: count " << count << ", total " << total << " us, mean " << total / count << " us" << std::endl;
+
+    status = sai_remove_vnet(vnet_id);
+    if (status != SAI_STATUS_SUCCESS)
+    {
+        std::cout << "Failed to remove VNET table entry" << std::endl;
+        return 1;
+    }
+
+    status = sai_remove_dash_acl_group(acl_group_id);
+    if (status != SAI_STATUS_SUCCESS)
+    {
+        std::cout << "Failed to remove Dash ACL group object " << acl_group_id << std::endl;
+        return 1;
+    }
+
+    std::cout << "Done." << std::endl;
+
+    return 0;
+}
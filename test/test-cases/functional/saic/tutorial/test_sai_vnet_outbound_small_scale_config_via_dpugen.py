@@ -23,8 +23,10 @@
 # <this-filename> -a  # Dump create & remove SAI records as JSON to stdout
 # <this-filename> -c  # Dump create SAI records as JSON to stdout
 # <this-filename> -r  # Dump create SAI records as JSON to stdout
+# <this-filename> -a -o config.ndjson.gz --format ndjson --progress  # Stream to a compressed NDJSON file
 #
 import json, argparse
+import sys
 from pathlib import Path
 from pprint import pprint
 import pytest
@@ -33,6 +35,9 @@ from saigen.confbase import *
 from saigen.confutils import *
 
 current_file_dir = Path(__file__).parent
+sys.path.append(str(current_file_dir.parent.parent.parent / 'utils'))
+from record_stack import remove_commands
+from record_writer import RecordWriter, add_output_arguments
 
 # Constants for scale VNET outbound routing configuration
 NUMBER_OF_VIP = 1
@@ -56,13 +61,10 @@ class TestSaiVnetOutbound:
 
     def make_remove_commands(self):
         """ Generate a configuration to remove entries
-            returns iterator (generator) of SAI records
+            returns iterator (generator) of SAI records, in the reverse order of the creation.
+            The names of the generated records are spilled to disk in chunks (see utils/record_stack.py).
         """
-        cleanup_commands = [{'name': cmd['name'], 'op': 'remove'} for cmd in self.make_create_commands()]
-        cleanup_commands = reversed(cleanup_commands)
-        for cmd in cleanup_commands:
-            yield cmd
-        return
+        return remove_commands(self.make_create_commands())
 
     @pytest.mark.ptf
     @pytest.mark.snappi
@@ -92,6 +94,7 @@ if __name__ == '__main__':
     parser.add_argument('-a', action='store_true', help='Generate all SAI records as JSON to stdout')
     parser.add_argument('-c', action='store_true', help='Generate "create" SAI records as JSON to stdout')
     parser.add_argument('-r', action='store_true', help='Generate "remove"" SAI records as JSON to stdout')
+    add_output_arguments(parser)
 
     args = parser.parse_args()
 
@@ -101,11 +104,10 @@ if __name__ == '__main__':
         parser.print_help(sys.stderr)
         sys.exit(1)
 
-    if args.a or args.c:
-        print(json.dumps([cmd for cmd in (TestSaiVnetOutbound().make_create_commands())],
-                         indent=2))
+    with RecordWriter.from_args(args) as writer:
+        if args.a or args.c:
+            writer.write(TestSaiVnetOutbound().make_create_commands())
 
-    if args.a or args.r:
-        print(json.dumps([cmd for cmd in (TestSaiVnetOutbound().make_remove_commands())],
-                         indent=2))
+        if args.a or args.r:
+            writer.write(TestSaiVnetOutbound().make_remove_commands())
 
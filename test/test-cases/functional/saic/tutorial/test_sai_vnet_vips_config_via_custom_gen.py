@@ -7,18 +7,24 @@
 # - in standalone mode, use to generate JSON to stdout, which can be saved to a file or pasted as literal
 #    content into a test-case. Example:
 #    python3 <this-filename> [options]  (use -h for help)
+#    python3 <this-filename> -c -a2 200 -o vips.ndjson.gz --format ndjson --progress  (stream to a compressed file)
 
 import json
 import sys
 from pprint import pprint
 import argparse
+from pathlib import Path
 
 import pytest
 
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / 'utils'))
+from record_stack import ReversibleRecords, remove_commands
+from record_writer import RecordWriter, add_output_arguments
+
 # Constants
 SWITCH_ID = 5
 
-def vip_generate(vip_start=1, a1=192, a2=192, b1=168, b2=168, c1=0, c2=0, d1=1, d2=1):
+def vip_generate(vip_start=1, a1=192, a2=192, b1=168, b2=168, c1=0, c2=0, d1=1, d2=1, reverse=False):
     """
     Return an sequence of vip dictionary entries with incrementing IP addresses.
     Uses generator (yield) technique. Only one element exists in memory at a time.
@@ -30,12 +36,17 @@ def vip_generate(vip_start=1, a1=192, a2=192, b1=168, b2=168, c1=0, c2=0, d1=1,
     b1, b2 - starting, ending values (inclusive) for address octet "B" in the sequence A.B.C.D
     c1, c2 - starting, ending values (inclusive) for address octet "C" in the sequence A.B.C.D
     d1, d2 - starting, ending values (inclusive) for address octet "D" in the sequence A.B.C.D
+    reverse - generate the same sequence, last entry first, e.g. to remove the entries
     """
-    v = vip_start
-    for a in range (a1,a2+1):
-        for b in range(b1, b2+1):
-            for c in range(c1,c2+1):
-                for d in range(d1,d2+1):
+    def octets(first, last):
+        return range(last, first-1, -1) if reverse else range(first, last+1)
+
+    count = (a2-a1+1) * (b2-b1+1) * (c2-c1+1) * (d2-d1+1)
+    v = vip_start + count - 1 if reverse else vip_start
+    for a in octets(a1,a2):
+        for b in octets(b1, b2):
+            for c in octets(c1,c2):
+                for d in octets(d1,d2):
                     yield \
                     {
                         "name": "vip_entry#%d" % v,
@@ -50,7 +61,7 @@ def vip_generate(vip_start=1, a1=192, a2=192, b1=168, b2=168, c1=0, c2=0, d1=1,
                         "SAI_VIP_ENTRY_ACTION_ACCEPT"
                         ]
                     }
-                    v+= 1
+                    v+= -1 if reverse else 1
     return
 
 # create 2x2x2x32 = 256 vips
@@ -67,18 +78,15 @@ def make_create_cmds(vip_start=1,a1=192, a2=193, b1=168, b2=169, c1=1,c2=2,d1=1,
 
 # remove 2x2x2x32 = 256 vips
 def make_remove_cmds(vip_start=1,a1=192, a2=193, b1=168, b2=169, c1=1,c2=2,d1=1,d2=32):
-    """ Return an array of remove commands
-        Entries generated and modifed on the fly; added to array in memory; reversed; then returned.
+    """ Return a generator (iterable) of remove commands
+        Entries generated on the fly, in the reverse order of the create commands.
         vip_start - starting VIP number, successive entries will increment this by 1
         a1, a2 - starting, ending values (inclusive) for address octet "A" in the sequence A.B.C.D
         b1, b2 - starting, ending values (inclusive) for address octet "B" in the sequence A.B.C.D
         c1, c2 - starting, ending values (inclusive) for address octet "C" in the sequence A.B.C.D
         d1, d2 - starting, ending values (inclusive) for address octet "D" in the sequence A.B.C.D
     """
-    cleanup_commands = [{'name': cmd['name'], 'op': 'remove'} for cmd in make_create_cmds(vip_start, a1, a2, b1, b2, c1,c2,d1,d2)]
-    for cmd in reversed(cleanup_commands):
-        yield cmd
-    return
+    return remove_commands(ReversibleRecords(vip_generate, vip_start, a1, a2, b1, b2, c1,c2,d1,d2))
 
 
 class TestSaiDashVipsGenerator:
@@ -116,6 +124,7 @@ if __name__ == '__main__':
     parser.add_argument('-c2', type=int, default=0, help='Ending value for C in VIP ip address sequence A.B.C.D')
     parser.add_argument('-d1', type=int, default=1, help='Starting value for D in VIP ip address sequence A.B.C.D')
     parser.add_argument('-d2', type=int, default=1, help='Ending value for D in VIP ip address sequence A.B.C.D')
+    add_output_arguments(parser)
 
     args = parser.parse_args()
 
@@ -125,19 +134,12 @@ if __name__ == '__main__':
         parser.print_help(sys.stderr)
         sys.exit(1)
 
-    if args.a or args.c:
-        print(json.dumps([item for item in make_create_cmds(args.vip_start, \
-                                                            args.a1, args.a2,\
-                                                            args.b1,args.b2,\
-                                                            args.c1,args.c2,
-                                                            args.d1,args.d2)],
-                         indent=2))
-
-    if args.a or args.r:
-        print (json.dumps([item for item in make_remove_cmds(args.vip_start, \
-                                                            args.a1, args.a2,\
-                                                            args.b1,args.b2,\
-                                                            args.c1,args.c2,
-                                                            args.d1,args.d2)],
-                         indent=2)) 
+    with RecordWriter.from_args(args) as writer:
+        if args.a or args.c:
+            writer.write(make_create_cmds(args.vip_start, args.a1, args.a2, args.b1, args.b2,
+                                          args.c1, args.c2, args.d1, args.d2))
+
+        if args.a or args.r:
+            writer.write(make_remove_cmds(args.vip_start, args.a1, args.a2, args.b1, args.b2,
+                                          args.c1, args.c2, args.d1, args.d2))
 
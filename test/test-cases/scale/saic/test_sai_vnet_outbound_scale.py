@@ -23,6 +23,7 @@
 # <this-filename> -a  # Dump create & remove SAI records as JSON to stdout
 # <this-filename> -c  # Dump create SAI records as JSON to stdout
 # <this-filename> -r  # Dump create SAI records as JSON to stdout
+# <this-filename> -a -o config.ndjson.gz --format ndjson --progress  # Stream to a compressed NDJSON file
 #
 import json, argparse
 from pathlib import Path
@@ -31,8 +32,10 @@ from pprint import pprint
 import pytest
 import saichallenger.common.sai_dataplane.snappi.snappi_traffic_utils as stu
 import sys
-sys.path.append("../utils")
+sys.path.append(str(Path(__file__).parent.parent.parent / 'utils'))
 import vnet2vnet_helper as dh
+from record_stack import remove_commands
+from record_writer import RecordWriter, add_output_arguments
 
 current_file_dir = Path(__file__).parent
 import dpugen
@@ -110,13 +113,10 @@ class TestSaiVnetOutbound:
 
     def make_remove_vnet_config(self):
         """ Generate a configuration to remove entries
-            returns iterator (generator) of SAI records
+            returns iterator (generator) of SAI records, in the reverse order of the creation.
+            The names of the generated records are spilled to disk in chunks (see utils/record_stack.py).
         """
-        cleanup_commands = [{'name': cmd['name'], 'op': 'remove'} for cmd in self.make_create_vnet_config()]
-        cleanup_commands = reversed(cleanup_commands)
-        for cmd in cleanup_commands:
-            yield cmd
-        return
+        return remove_commands(self.make_create_vnet_config())
 
     @pytest.mark.ptf
     @pytest.mark.snappi
@@ -160,6 +160,25 @@ class TestSaiVnetOutbound:
                                                                 name="Custom flow group", show=True)[0],
                     "Test", timeout_seconds=test_duration + 1)
 
+    @pytest.mark.snappi
+    def test_run_traffic_check_synthesized_flows(self, dpu, dataplane):
+        """
+        Test with the flows synthesized from the configuration records.
+        Instead of a flow per VIP, DLE and CA SMAC, the fewest packets going through every table entry
+        and action path of the configuration are sent, with each packet expected back.
+        NOTE: This test does not verify the correctness of the packets transformation.
+        """
+        pkt_count, pps = 1, 10
+        templates = dh.configure_synthesized_packet_flows(dataplane, self.make_create_vnet_config(),
+                                                          pkt_count=pkt_count, pps=pps, duration=0)
+        dataplane.set_config()
+        dataplane.start_traffic()
+        # The flows run at once, the longest template sets the time the traffic takes
+        test_duration = max(template['count'] for template in templates) * pkt_count / pps
+        stu.wait_for(lambda: dh.check_flows_all_packets_metrics(dataplane, dataplane.flows,
+                                                                name="Synthesized flow group", show=True)[0],
+                    "Test", timeout_seconds=test_duration + 5)
+
     @pytest.mark.ptf
     @pytest.mark.snappi
     def test_remove_vnet_config(self, dpu, dataplane):
@@ -175,6 +194,7 @@ if __name__ == '__main__':
     parser.add_argument('-a', action='store_true', help='Generate all SAI records as JSON to stdout')
     parser.add_argument('-c', action='store_true', help='Generate "create" SAI records as JSON to stdout')
     parser.add_argument('-r', action='store_true', help='Generate "remove"" SAI records as JSON to stdout')
+    add_output_arguments(parser)
 
     args = parser.parse_args()
 
@@ -184,11 +204,10 @@ if __name__ == '__main__':
         parser.print_help(sys.stderr)
         sys.exit(1)
 
-    if args.a or args.c:
-        print(json.dumps([cmd for cmd in (TestSaiVnetOutbound().make_create_vnet_config())],
-                         indent=2))
+    with RecordWriter.from_args(args) as writer:
+        if args.a or args.c:
+            writer.write(TestSaiVnetOutbound().make_create_vnet_config())
 
-    if args.a or args.r:
-        print(json.dumps([cmd for cmd in (TestSaiVnetOutbound().make_remove_vnet_config())],
-                         indent=2))
+        if args.a or args.r:
+            writer.write(TestSaiVnetOutbound().make_remove_vnet_config())
 
@@ -325,6 +325,27 @@ def get_all_captures(api, cfg):
     return cap_dict
 
 
+def save_all_captures(api, cfg, directory):
+    """
+    Saves the capture of every port with capture enabled to <directory>/<port name>.pcap and
+    returns a dictionary where port name is the key and value is the path of its capture.
+    The captures can be compared with the expected output of the pushed config with
+    test/test-cases/utils/dash_model/verify.py.
+    """
+    paths = {}
+    for name in get_capture_port_names(cfg):
+        print("Saving capture of port %s" % name)
+        request = api.capture_request()
+        request.port_name = name
+        pcap_bytes = api.get_capture(request)
+
+        paths[name] = os.path.join(directory, "%s.pcap" % name)
+        with open(paths[name], "wb") as f:
+            f.write(pcap_bytes.read())
+
+    return paths
+
+
 def get_capture_port_names(cfg):
     """
     Returns name of ports for which capture is enabled.
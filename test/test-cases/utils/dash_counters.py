@@ -0,0 +1,66 @@
+import ctypes
+import os
+from collections import defaultdict, namedtuple
+
+SAI_STATUS_SUCCESS = 0
+SAI_STATUS_BUFFER_OVERFLOW = -8
+
+TableCounter = namedtuple('TableCounter', 'object_id packets bytes')
+
+
+class DashCounters:
+    """
+    Read the direct counters of the DASH tables in bulk through the dash_get_<table>_counters()
+    functions of the generated libsai, e.g. the per-route counters of a scale test, which read_by_object()
+    can sum per ENI. The eni_meter table has no SAI API (generate_dash_api.sh ignores it), so the
+    eni_counter meters of the ENIs cannot be read here.
+    Must run in the process or on the host of libsai, since it loads the library.
+
+    Parameters:
+        libsai (str): path of libsai.so. Default is $DASH_LIBSAI, else libsai.so from the library path.
+        size_hint (int): number of entries the first read of a table is sized for. Default is 4096.
+    """
+
+    def __init__(self, libsai=None, size_hint=4096):
+        self.lib = ctypes.CDLL(libsai or os.environ.get('DASH_LIBSAI', 'libsai.so'))
+        self.sizes = defaultdict(lambda: size_hint)
+
+    def read(self, table):
+        """
+        Read the counters of all the entries of a table with one call to libsai.
+
+        Parameters:
+            table (str): SAI table name, e.g. 'outbound_routing_entry' or 'dash_acl_rule'.
+
+        Returns:
+            list of TableCounter(object_id, packets, bytes), one per P4 table entry.
+            object_id is the SAI object, or for entry tables the object of their first ID key (e.g. the ENI).
+        """
+        func = getattr(self.lib, f'dash_get_{table}_counters')
+        while True:
+            size = self.sizes[table]
+            count = ctypes.c_uint32(size)
+            object_ids = (ctypes.c_uint64 * size)()
+            packets = (ctypes.c_uint64 * size)()
+            octets = (ctypes.c_uint64 * size)()
+            status = func(ctypes.byref(count), object_ids, packets, octets)
+            if status == SAI_STATUS_BUFFER_OVERFLOW:
+                # The table grew past the buffers, retry with the size libsai asked for
+                self.sizes[table] = count.value
+                continue
+            if status != SAI_STATUS_SUCCESS:
+                raise RuntimeError(f'dash_get_{table}_counters failed with status {status}')
+            return [TableCounter(object_ids[i], packets[i], octets[i]) for i in range(count.value)]
+
+    def read_by_object(self, table):
+        """
+        Same as read(), with the packets and bytes summed by object ID.
+
+        Returns:
+            dict {object_id: (packets, bytes)}
+        """
+        totals = defaultdict(lambda: (0, 0))
+        for counter in self.read(table):
+            packets, octets = totals[counter.object_id]
+            totals[counter.object_id] = (packets + counter.packets, octets + counter.bytes)
+        return dict(totals)
@@ -0,0 +1,15 @@
+"""
+Vectorized reference model of the DASH pipeline, computing the expected headers of batches of
+packets from the SAI configuration records of a test.
+"""
+
+from .conntrack import ConntrackSimulator
+from .headers import HEADERS_DTYPE
+from .inbound import InboundModel
+from .outbound import OutboundModel
+from .pipeline import DROP_REASONS, META_DTYPE
+from .policer import EniPolicer
+from .records import SaiConfig, read_records
+
+__all__ = ['HEADERS_DTYPE', 'META_DTYPE', 'DROP_REASONS', 'ConntrackSimulator', 'EniPolicer', 'InboundModel',
+           'OutboundModel', 'SaiConfig', 'read_records']
@@ -0,0 +1,526 @@
+"""
+DASH ACL rules (dash_acl.p4) loaded from the dash_acl_rule objects of a SaiConfig.
+
+A rule matches when its group matches and every non-empty list of its DIP, SIP, protocol,
+source port and destination port fields holds the packet's value; an empty list is a wildcard.
+Among the matching rules of a group the highest priority wins, as P4Runtime priorities do.
+
+AclRules tries the rules one after the other and is the reference; AclClassifier finds the
+matching rule of large groups with bit vectors, for millions of flows:
+
+    acl = AclClassifier(SaiConfig.from_file('dash_acl_setup_commands.json'))
+    denied, rules = acl.classify(groups, sip, dip, protocol, src_port, dst_port)
+"""
+
+import ipaddress
+from collections import namedtuple
+
+import numpy as np
+
+from .records import to_int
+from .tables import prefix_masks
+
+PERMIT = 0
+PERMIT_AND_CONTINUE = 1
+DENY = 2
+DENY_AND_CONTINUE = 3
+
+ACTIONS = {'permit': PERMIT, 'permit_and_continue': PERMIT_AND_CONTINUE,
+           'deny': DENY, 'deny_and_continue': DENY_AND_CONTINUE}
+
+ACL_STAGES = 3
+
+_MAX_ADDRESS = (1 << 128) - 1
+
+# Highest value of the fields of a rule
+FIELD_MAX = {'sip': _MAX_ADDRESS, 'dip': _MAX_ADDRESS, 'protocol': 0xff, 'src_port': 0xffff, 'dst_port': 0xffff}
+# Sets of tuples kept per rule taken by AclRules.reaching()
+_MAX_BOXES = 64
+
+AclRule = namedtuple('AclRule', 'name oid group priority action dips sips protocols src_ports dst_ports')
+
+
+def _list_items(value):
+    """ Items of a list attribute: a JSON list, or a string "a,b,c" optionally prefixed by its count "3:" """
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value if str(item).strip()]
+    value = str(value).strip()
+    head, sep, tail = value.partition(':')
+    items = [item.strip() for item in tail.split(',') if item.strip()]
+    # The count prefix is told from an IPv6 address by matching the number of items
+    if sep and head.isdigit() and not tail.startswith(':') and int(head) == len(items):
+        return items
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def parse_prefixes(value):
+    """ List attribute of IP prefixes -> (n, 2) uint64 [high, low] words and 128-bit prefix lengths """
+    words, lengths = [], []
+    for item in _list_items(value):
+        network = ipaddress.ip_network(item, strict=False)
+        address = int(network.network_address)
+        words.append((address >> 64, address & 0xffffffffffffffff))
+        lengths.append(network.prefixlen + (96 if network.version == 4 else 0))
+    return np.array(words, dtype=np.uint64).reshape(-1, 2), np.array(lengths, dtype=np.int64)
+
+
+def parse_ranges(value):
+    """ List attribute of ports or port ranges "80,1000-2000" -> (n, 2) uint16 [min, max] """
+    ranges = []
+    for item in _list_items(value):
+        low, _, high = item.partition('-')
+        ranges.append((int(low, 0), int(high or low, 0)))
+    return np.array(ranges, dtype=np.uint16).reshape(-1, 2)
+
+
+def parse_values(value):
+    """ List attribute of integers "6,17" -> uint8 array """
+    return np.array([int(item, 0) for item in _list_items(value)], dtype=np.uint8)
+
+
+def load_rules(config):
+    """ AclRule of every dash_acl_rule of a SaiConfig, in creation order """
+    rules = []
+    for record in config['dash_acl_rule'].values():
+        attrs = record.attrs
+        dips, dip_lengths = parse_prefixes(attrs.get('dip'))
+        sips, sip_lengths = parse_prefixes(attrs.get('sip'))
+        rules.append(AclRule(record.name, record.oid, to_int(attrs.get('dash_acl_group_id')),
+                             to_int(attrs.get('priority')), ACTIONS[attrs.get('action', 'deny')],
+                             (dips, dip_lengths), (sips, sip_lengths), parse_values(attrs.get('protocol')),
+                             parse_ranges(attrs.get('src_port')), parse_ranges(attrs.get('dst_port'))))
+    return rules
+
+
+def _match_prefixes(addresses, prefixes):
+    words, lengths = prefixes
+    if len(lengths) == 0:
+        return np.ones(len(addresses), dtype=bool)
+    high, low = prefix_masks(lengths)
+    match = np.zeros(len(addresses), dtype=bool)
+    for i in range(len(lengths)):
+        match |= ((addresses[:, 0] & high[i]) == words[i, 0]) & ((addresses[:, 1] & low[i]) == words[i, 1])
+    return match
+
+
+def _match_ranges(ports, ranges):
+    if len(ranges) == 0:
+        return np.ones(len(ports), dtype=bool)
+    match = np.zeros(len(ports), dtype=bool)
+    for low, high in ranges:
+        match |= (ports >= low) & (ports <= high)
+    return match
+
+
+class AclRules:
+    """
+    Linear classifier of the DASH ACL rules: the rules are tried in priority order, each one on
+    the whole batch of packets not matched yet.
+
+    Parameters:
+        config (SaiConfig): configuration holding the dash_acl_rule objects.
+    """
+
+    def __init__(self, config):
+        self.rules = load_rules(config)
+        self.names = [rule.name for rule in self.rules]
+        self.actions = np.array([rule.action for rule in self.rules], dtype=np.uint8)
+        # Highest priority first, creation order between equal priorities
+        self.order = sorted(range(len(self.rules)), key=lambda i: -self.rules[i].priority)
+        self.group_rows = {}
+        for row in self.order:
+            self.group_rows.setdefault(self.rules[row].group, []).append(row)
+        self._intervals = {}
+        self._shadows = {}
+
+    def classify(self, groups, sip, dip, protocol, src_port, dst_port):
+        """
+        Run packets through the ACL stages of dash_acl.p4: a stage is applied when its group is
+        not 0 and the previous stages did not stop on a permit or a deny. A miss denies and stops.
+
+        Parameters:
+            groups (array): (n, ACL_STAGES) ACL group OIDs of every packet, 0 for no group.
+            sip, dip, protocol, src_port, dst_port (array): fields of the packets, as for lookup().
+
+        Returns:
+            (denied, rules): bool array, the verdict, True when a stage applied a deny or
+            deny_and_continue action or missed, and (n, ACL_STAGES) int64 rows of the matching
+            rule of every stage, -1 on a miss or when the stage was not applied.
+        """
+        groups = np.asarray(groups, dtype=np.uint64)
+        denied = np.zeros(len(groups), dtype=bool)
+        rules = np.full((len(groups), ACL_STAGES), -1, dtype=np.int64)
+        # Packets still going through the stages, i.e. no permit or deny yet
+        active = np.ones(len(groups), dtype=bool)
+        for stage in range(ACL_STAGES):
+            apply = np.flatnonzero(active & (groups[:, stage] != 0))
+            if len(apply) == 0:
+                continue
+            rule = self.lookup(groups[apply, stage], sip[apply], dip[apply],
+                               protocol[apply], src_port[apply], dst_port[apply])
+            rules[apply, stage] = rule
+            # A miss runs the default action, deny
+            action = np.full(len(rule), DENY, dtype=np.uint8)
+            hit = rule >= 0
+            action[hit] = self.actions[rule[hit]]
+            denied[apply[(action == DENY) | (action == DENY_AND_CONTINUE)]] = True
+            active[apply[(action == PERMIT) | (action == DENY)]] = False
+        return denied, rules
+
+    def lookup(self, group, sip, dip, protocol, src_port, dst_port):
+        """
+        Rows of the matching rules, -1 where no rule of the group matches.
+
+        Parameters:
+            group (array): ACL group OID of every packet.
+            sip, dip (array): (n, 2) uint64 [high, low] words of the overlay IP addresses.
+            protocol, src_port, dst_port (array): IP protocol and L4 ports.
+        """
+        group = np.asarray(group, dtype=np.uint64)
+        result = np.full(len(group), -1, dtype=np.int64)
+        pending = np.arange(len(group))
+        for row in self.order:
+            if len(pending) == 0:
+                break
+            rule = self.rules[row]
+            match = group[pending] == np.uint64(rule.group)
+            if not match.any():
+                continue
+            match &= _match_prefixes(dip[pending], rule.dips)
+            match &= _match_prefixes(sip[pending], rule.sips)
+            if len(rule.protocols):
+                match &= np.isin(protocol[pending], rule.protocols)
+            match &= _match_ranges(src_port[pending], rule.src_ports)
+            match &= _match_ranges(dst_port[pending], rule.dst_ports)
+            result[pending[match]] = row
+            pending = pending[~match]
+        return result
+
+    def rule_intervals(self, row):
+        """ {field: [first, last] intervals} of a rule, the whole range of a wildcard field """
+        intervals = self._intervals.get(row)
+        if intervals is None:
+            rule = self.rules[row]
+            intervals = {'sip': _prefix_intervals(rule.sips), 'dip': _prefix_intervals(rule.dips),
+                         'protocol': [(int(v), int(v)) for v in rule.protocols.tolist()],
+                         'src_port': [tuple(r) for r in rule.src_ports.tolist()],
+                         'dst_port': [tuple(r) for r in rule.dst_ports.tolist()]}
+            for field, items in intervals.items():
+                if not items:
+                    intervals[field] = [(0, FIELD_MAX[field])]
+            self._intervals[row] = intervals
+        return intervals
+
+    def _shadowing(self, row, higher):
+        """ Rows of higher priority matching part of the tuples of a rule """
+        rows = self._shadows.get(row)
+        if rows is None:
+            intervals = self.rule_intervals(row)
+            rows = self._shadows[row] = [other for other in higher if _narrow(intervals, self.rule_intervals(other))]
+        return rows
+
+    def reaching(self, groups, fields=None, rule=None, through=None, count=4, budget=1024):
+        """
+        Sets of 5-tuples going through the ACL stages: permitted, or matching rule when given after
+        the stages before the one of its group continued. Rules are tried depth first by priority,
+        the part of a set taking a rule being the one matching it and no rule of higher priority.
+
+        Parameters:
+            groups (list): ACL group OID of every stage, 0 for no group.
+            fields (dict): [first, last] intervals of the fields ('sip', 'dip', 'protocol',
+                'src_port', 'dst_port') the tuples are taken from, the whole ranges by default.
+            rule (int): row of the rule to reach.
+            through (dict): value of fields every set contains, without narrowing the sets to it.
+            count (int): number of sets.
+            budget (int): number of rules taken.
+
+        Returns:
+            list of {field: [first, last] intervals}, up to count.
+        """
+        fields = {field: list((fields or {}).get(field, [(0, top)])) for field, top in FIELD_MAX.items()}
+        through = through or {}
+        target = None
+        if rule is not None:
+            target = next((stage for stage in range(ACL_STAGES) if groups[stage] == self.rules[rule].group), None)
+            if target is None:
+                return []
+        found = []
+        left = [budget]
+
+        def contains(box):
+            return all(any(first <= value <= last for first, last in box[field]) for field, value in through.items())
+
+        def visit(stage, boxes):
+            while stage < ACL_STAGES and groups[stage] == 0:
+                stage += 1
+            if stage == ACL_STAGES:
+                if target is None:
+                    found.extend(boxes)
+                return
+            rows = self.group_rows.get(groups[stage], [])
+            for index, row in enumerate(rows):
+                action = self.actions[row]
+                if stage == target and row != rule:
+                    continue
+                if target is None and action not in (PERMIT, PERMIT_AND_CONTINUE):
+                    continue
+                if target is not None and stage < target and action not in (PERMIT_AND_CONTINUE, DENY_AND_CONTINUE):
+                    continue
+                if left[0] <= 0 or len(found) >= count:
+                    return
+                taken = [box for box in (_narrow(box, self.rule_intervals(row)) for box in boxes) if box]
+                for higher in self._shadowing(row, rows[:index]):
+                    if not taken:
+                        break
+                    intervals = self.rule_intervals(higher)
+                    taken = [piece for box in taken for piece in _subtract(box, intervals)][:_MAX_BOXES]
+                taken = [box for box in taken if contains(box)]
+                if not taken:
+                    continue
+                left[0] -= 1
+                if stage == target or (target is None and action == PERMIT):
+                    found.extend(taken)
+                else:
+                    visit(stage + 1, taken)
+
+        boxes = [fields]
+        if rule is not None:
+            # Only the tuples of the rule no rule of higher priority takes can reach it
+            rows = self.group_rows[self.rules[rule].group]
+            boxes = [box for box in [_narrow(fields, self.rule_intervals(rule))] if box]
+            for higher in self._shadowing(rule, rows[:rows.index(rule)]):
+                boxes = [piece for box in boxes for piece in _subtract(box, self.rule_intervals(higher))][:_MAX_BOXES]
+        boxes = [box for box in boxes if contains(box)]
+        if boxes:
+            visit(0, boxes)
+        return found[:count]
+
+
+def intersect_intervals(intervals, others):
+    """ Intersection of two lists of [first, last] intervals """
+    result = []
+    for first, last in intervals:
+        for other_first, other_last in others:
+            if max(first, other_first) <= min(last, other_last):
+                result.append((max(first, other_first), min(last, other_last)))
+    return result
+
+
+def _difference(intervals, others):
+    """ [first, last] intervals of a list outside of others """
+    result = []
+    others = sorted(others)
+    for first, last in intervals:
+        for other_first, other_last in others:
+            if first > last:
+                break
+            if other_last < first or other_first > last:
+                continue
+            if other_first > first:
+                result.append((first, other_first - 1))
+            first = max(first, other_last + 1)
+        if first <= last:
+            result.append((first, last))
+    return result
+
+
+def _narrow(box, intervals):
+    """ Part of a set of tuples matching a rule, None when empty """
+    narrowed = {field: intersect_intervals(items, intervals[field]) for field, items in box.items()}
+    return narrowed if all(narrowed.values()) else None
+
+
+def _subtract(box, intervals):
+    """ Sets of tuples making the part of a set not matching a rule, one per field outside of it """
+    inside = _narrow(box, intervals)
+    if inside is None:
+        return [box]
+    pieces = []
+    current = dict(box)
+    for field, items in box.items():
+        outside = _difference(items, intervals[field])
+        if outside:
+            pieces.append({**current, field: outside})
+        current[field] = inside[field]
+    return pieces
+
+
+def _prefix_intervals(prefixes):
+    """ [first, last] 128-bit addresses of each prefix of a rule field """
+    words, lengths = prefixes
+    intervals = []
+    for (high, low), length in zip(words.tolist(), lengths.tolist()):
+        first = (high << 64) | low
+        intervals.append((first, first | (_MAX_ADDRESS >> length)))
+    return intervals
+
+
+def _count_bounds(bound_high, bound_low, high, low):
+    """ Number of the sorted 128-bit bounds lower or equal to each value, as [high, low] words """
+    count = len(bound_high)
+    is_value = np.zeros(count + len(high), dtype=bool)
+    is_value[count:] = True
+    # Values sort after the bounds equal to them
+    order = np.lexsort((is_value, np.concatenate([bound_low, low]), np.concatenate([bound_high, high])))
+    bounds = np.cumsum(~is_value[order])
+    result = np.empty(len(high), dtype=np.int64)
+    values = is_value[order]
+    result[order[values] - count] = bounds[values]
+    return result
+
+
+def _lowest_bit(values):
+    """ Index of the lowest set bit of non-zero uint64 values """
+    lowest = values & (~values + np.uint64(1))
+    # Powers of 2 are exact in float64
+    return np.log2(lowest.astype(np.float64)).astype(np.int64)
+
+
+class _FieldVectors:
+    """
+    One field of the rules of a group: the values of the field cut into elementary intervals at the
+    bounds of the rules' lists, each interval with the bit vector of the rules it matches and the
+    aggregate of this vector, one bit per non-zero word.
+
+    Parameters:
+        intervals (list): for every rule, by priority rank, the [first, last] intervals of its
+            list, empty for a wildcard.
+        words (int): uint64 words of the bit vectors.
+    """
+
+    def __init__(self, intervals, words):
+        self.wildcard = not any(intervals)
+        if self.wildcard:
+            return
+        points = {0}
+        for items in intervals:
+            for first, last in items:
+                points.add(first)
+                if last < _MAX_ADDRESS:
+                    points.add(last + 1)
+        points = sorted(points)
+        index = {point: i for i, point in enumerate(points)}
+        self.vectors = np.zeros((len(points), words), dtype=np.uint64)
+        for rank, items in enumerate(intervals):
+            word, bit = rank >> 6, np.uint64(1 << (rank & 63))
+            if not items:
+                self.vectors[:, word] |= bit
+            for first, last in items:
+                self.vectors[index[first]:index.get(last + 1, len(points)), word] |= bit
+        nonzero = np.zeros((len(points), ((words + 63) >> 6) << 6), dtype=bool)
+        nonzero[:, :words] = self.vectors != 0
+        self.aggregates = np.packbits(nonzero, axis=1, bitorder='little').view('<u8').astype(np.uint64)
+        self.high = np.array([point >> 64 for point in points], dtype=np.uint64)
+        self.low = np.array([point & 0xffffffffffffffff for point in points], dtype=np.uint64)
+        # Narrowest search: a direct table for ports and protocols, 32-bit bounds for IPv4 rules
+        self.bits = 128 if self.high[-1] else 64 if self.low[-1] >> np.uint64(32) else 32 if points[-1] > 0xffff else 16
+        if self.bits == 16:
+            self.table = np.repeat(np.arange(len(points), dtype=np.int32), np.diff(points + [1 << 16]))
+        elif self.bits == 32:
+            self.low = self.low.astype(np.uint32)
+
+    def intervals(self, low, high=None):
+        """ Elementary intervals of the values, given as [high, low] words for the addresses """
+        if self.bits == 128:
+            return _count_bounds(self.high, self.low, high, low) - 1
+        if self.bits == 16 and high is None:
+            return self.table[low]
+        beyond = np.zeros(len(low), dtype=bool) if high is None else high != 0
+        if self.bits != 64:
+            beyond |= (low >> 32) != 0
+            low = low.astype(np.uint32)
+        interval = np.searchsorted(self.low, low, 'right') - 1
+        # Beyond the bounds, in the last interval
+        interval[beyond] = len(self.low) - 1
+        return interval
+
+
+class _GroupVectors:
+    """ Bit vectors of the rules of one ACL group, bit i of a vector standing for rows[i] """
+
+    def __init__(self, rules, rows):
+        self.rows = np.array(rows, dtype=np.int64)
+        words = (len(rows) + 63) >> 6
+        rules = [rules[row] for row in rows]
+        self.dip = _FieldVectors([_prefix_intervals(rule.dips) for rule in rules], words)
+        self.sip = _FieldVectors([_prefix_intervals(rule.sips) for rule in rules], words)
+        self.protocol = _FieldVectors([[(int(v), int(v)) for v in rule.protocols] for rule in rules], words)
+        self.src_port = _FieldVectors([[tuple(r) for r in rule.src_ports.tolist()] for rule in rules], words)
+        self.dst_port = _FieldVectors([[tuple(r) for r in rule.dst_ports.tolist()] for rule in rules], words)
+
+    def lookup(self, sip, dip, protocol, src_port, dst_port):
+        """ Rows of the highest priority matching rules, -1 on a miss """
+        fields = [(field, field.intervals(*args)) for field, args in
+                  ((self.dip, (dip[:, 1], dip[:, 0])), (self.sip, (sip[:, 1], sip[:, 0])),
+                   (self.protocol, (protocol,)), (self.src_port, (src_port,)), (self.dst_port, (dst_port,)))
+                  if not field.wildcard]
+        if not fields:
+            # Every field of every rule is a wildcard
+            return np.full(len(protocol), self.rows[0], dtype=np.int64)
+        # Words of the rules matching in every field, a superset of the words holding a match
+        aggregates = fields[0][0].aggregates[fields[0][1]]
+        for field, interval in fields[1:]:
+            aggregates &= field.aggregates[interval]
+
+        rank = np.full(len(protocol), -1, dtype=np.int64)
+        pending = np.arange(len(protocol))
+        # Try the candidate words by priority, one word of every pending packet at a time
+        while len(pending):
+            candidates = aggregates[pending]
+            column = np.argmax(candidates != 0, axis=1)
+            value = candidates[np.arange(len(pending)), column]
+            candidate = value != 0
+            pending, column, value = pending[candidate], column[candidate], value[candidate]
+            bit = _lowest_bit(value)
+            word = (column << 6) + bit
+            vector = fields[0][0].vectors[fields[0][1][pending], word]
+            for field, interval in fields[1:]:
+                vector &= field.vectors[interval[pending], word]
+            found = vector != 0
+            rank[pending[found]] = (word[found] << 6) + _lowest_bit(vector[found])
+            pending, column, bit = pending[~found], column[~found], bit[~found]
+            aggregates[pending, column] &= ~(np.uint64(1) << bit.astype(np.uint64))
+        return np.where(rank >= 0, self.rows[np.maximum(rank, 0)], -1)
+
+
+class AclClassifier(AclRules):
+    """
+    Bit vector classifier of the DASH ACL rules (T.V. Lakshman, D. Stiliadis, "High-speed policy-based
+    packet forwarding using efficient multi-dimensional range matching"): each field of the rules of a
+    group is cut into elementary intervals holding the bit vector of the rules matching them, by
+    priority. A lookup is a binary search per field, the AND of the five vectors and the search of
+    the first set bit. The vectors are aggregated (F. Baboescu, G. Varghese, "Scalable packet
+    classification"), one bit per word of 64 rules, and only the words set in the AND of the
+    aggregates are read, by priority, until one holds a match.
+
+    Parameters:
+        config (SaiConfig): configuration holding the dash_acl_rule objects.
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.groups = {group: _GroupVectors(self.rules, rows) for group, rows in self.group_rows.items()}
+
+    def lookup(self, group, sip, dip, protocol, src_port, dst_port):
+        """
+        Rows of the matching rules, -1 where no rule of the group matches.
+
+        Parameters:
+            group (array): ACL group OID of every packet.
+            sip, dip (array): (n, 2) uint64 [high, low] words of the overlay IP addresses.
+            protocol, src_port, dst_port (array): IP protocol and L4 ports.
+        """
+        group = np.asarray(group, dtype=np.uint64)
+        result = np.full(len(group), -1, dtype=np.int64)
+        oids, inverse = np.unique(group, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(oids) + 1))
+        for i, oid in enumerate(oids.tolist()):
+            vectors = self.groups.get(oid)
+            if vectors is None:
+                continue
+            rows = order[bounds[i]:bounds[i + 1]]
+            result[rows] = vectors.lookup(sip[rows], dip[rows], protocol[rows], src_port[rows], dst_port[rows])
+        return result
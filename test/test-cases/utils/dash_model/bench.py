@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+#
+# Throughput of the DASH reference model on synthetic traffic, one JSON line per run.
+#
+# Usage: ./bench.py outbound [--config vnet_outbound_setup_commands_simple.json] [--packets 1000000]
+#        ./bench.py inbound [--enis 8] [--routes 6000] [--packets 1000000]
+#        ./bench.py lpm [--enis 8] [--routes 48000] [--lookups 10000000] [--v6]
+#        ./bench.py acl [--rules 4000] [--flows 1000000]
+#        ./bench.py conntrack [--config setup_commands.json] [--pcap trace.pcap | --enis 4 --cps 10000 --duration 10]
+#        ./bench.py codec [--config vnet_outbound_setup_commands_simple.json] [--packets 1000000]
+#        ./bench.py synth [--config setup_commands.json | --enis 8 --routes 64 --mappings 64 --rules 200]
+#        ./bench.py police [--config setup_commands.json | --enis 64] [--cps 1000 --pps 10 --lifetime 2] [--ceiling cps]
+#
+
+import argparse
+import ipaddress
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dash_model import headers as h
+from dash_model import DROP_REASONS, InboundModel, OutboundModel, SaiConfig
+from dash_model.acl import AclClassifier, AclRules
+from dash_model.codec import decode, encode
+from dash_model.conntrack import ConntrackSimulator, pcap_trace, synthetic_trace
+from dash_model.lpm import RouteIndex
+from dash_model.policer import EniPolicer, uniform_profile
+from dash_model.pcap import read_pcap_chunks, write_pcap_chunks
+from dash_model.synth import FlowSynthesizer, expand
+from dash_model.tables import PrefixIndex, prefix_masks
+
+SCALE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'scale', 'saic')
+
+
+def outbound_targets(config):
+    """ (ENI MAC, destination) pairs of the IPv4 CA to PA entries each ENI reaches: the destination is
+        in a route_vnet route of the ENI to the VNET of the entry """
+    macs = {}
+    for r in config['eni_ether_address_map_entry'].values():
+        macs.setdefault(r.attrs['eni_id'], []).append(h.mac_to_int(r.key['address']))
+    routes = [(r.key['eni_id'], ipaddress.ip_network(r.key['destination'], strict=False), r.attrs.get('dst_vnet_id'))
+              for r in config['outbound_routing_entry'].values()
+              if ':' not in r.key['destination'] and r.attrs.get('action', 'route_vnet') == 'route_vnet']
+    targets = set()
+    for r in config['outbound_ca_to_pa_entry'].values():
+        if ':' in r.key['dip']:
+            continue
+        dip = ipaddress.IPv4Address(r.key['dip'])
+        for eni, network, dst_vnet_id in routes:
+            if dst_vnet_id == r.key['dst_vnet_id'] and dip in network:
+                targets.update((mac, int(dip)) for mac in macs.get(eni, []))
+    return sorted(targets)
+
+
+def outbound_packets(config, count, seed=1):
+    """ VXLAN packets from the ENIs of a config to the CA to PA entries they reach, so that they are
+        encapsulated. Without such entries, to random destinations of the routes of any ENI. """
+    rng = np.random.default_rng(seed)
+    vip = next(iter(config['vip_entry'].values())).key['vip']
+    vni = int(next(r for r in config['direction_lookup_entry'].values()
+                   if r.attrs.get('action') == 'set_outbound_direction').key['vni'])
+    targets = outbound_targets(config)
+
+    pkts = h.zeros(count)
+    pkts['valid'] = h.ETHERNET | h.IPV4 | h.UDP | h.VXLAN | h.INNER_ETHERNET | h.INNER_IPV4 | h.INNER_UDP
+    pkts['eth']['type'] = h.IPV4_ETHTYPE
+    pkts['ip']['version'] = 4
+    pkts['ip']['proto'] = h.UDP_PROTO
+    pkts['ip']['ttl'] = 64
+    h.set_ip(pkts['ip']['dst'], slice(None), vip)
+    pkts['l4']['dport'] = h.UDP_PORT_VXLAN
+    pkts['vni'] = vni
+    pkts['inner_eth']['type'] = h.IPV4_ETHTYPE
+    inner = pkts['inner_ip']
+    inner['version'] = 4
+    inner['proto'] = h.UDP_PROTO
+    inner['ttl'] = 64
+    inner['len'] = h.IPV4_HDR_SIZE + h.UDP_HDR_SIZE + 64
+    if targets:
+        target = rng.integers(0, len(targets), count)
+        pkts['inner_eth']['src'] = np.array([mac for mac, _ in targets], dtype=np.uint64)[target]
+        inner['dst'][:, 1] = np.array([dip for _, dip in targets], dtype=np.uint64)[target]
+    else:
+        macs = np.array([h.mac_to_int(r.key['address']) for r in config['eni_ether_address_map_entry'].values()],
+                        dtype=np.uint64)
+        networks = [r.key['destination'] for r in config['outbound_routing_entry'].values()
+                    if ':' not in r.key['destination']]
+        bases = np.array([int(h.ip_words(n.split('/')[0])[2]) for n in networks], dtype=np.uint64)
+        sizes = np.array([1 << (32 - int(n.split('/')[1])) for n in networks], dtype=np.uint64)
+        pkts['inner_eth']['src'] = macs[rng.integers(0, len(macs), count)]
+        route = rng.integers(0, len(networks), count)
+        inner['dst'][:, 1] = bases[route] + rng.integers(0, 1 << 62, count).astype(np.uint64) % sizes[route]
+    inner['src'][:, 1] = rng.integers(0, 1 << 32, count).astype(np.uint64)
+    pkts['inner_l4']['sport'] = rng.integers(0, 1 << 16, count)
+    pkts['inner_l4']['dport'] = rng.integers(0, 1 << 16, count)
+    pkts['inner_l4']['len'] = h.UDP_HDR_SIZE + 64
+    pkts['payload_len'] = 64
+    pkts['ip']['len'] = h.IPV4_HDR_SIZE + h.UDP_HDR_SIZE + h.VXLAN_HDR_SIZE + h.ETHER_HDR_SIZE + inner['len']
+    pkts['l4']['len'] = pkts['ip']['len'] - h.IPV4_HDR_SIZE
+    return pkts
+
+
+def bench_outbound(args):
+    config = SaiConfig.from_file(args.config)
+    start = time.perf_counter()
+    model = OutboundModel(config)
+    build_s = time.perf_counter() - start
+    pkts = outbound_packets(config, args.packets)
+    start = time.perf_counter()
+    _, meta = model.process(pkts)
+    process_s = time.perf_counter() - start
+    dropped = int(meta['dropped'].sum())
+    reasons = np.bincount(meta['drop_reason'], minlength=len(DROP_REASONS))
+    return {'model': 'outbound', 'config': os.path.basename(args.config), 'packets': args.packets,
+            'build_s': round(build_s, 3), 'process_s': round(process_s, 3),
+            'pps': round(args.packets / process_s), 'encapsulated': args.packets - dropped, 'dropped': dropped,
+            'drop_reasons': {DROP_REASONS[i]: int(n) for i, n in enumerate(reasons) if n}}
+
+
+def inbound_records(enis, routes, seed=1):
+    """ ENIs with --routes inbound routes each, of /16, /24 and /32 underlay source prefixes, half of
+        them validating the source PA against the PA validation entry of one host of the prefix """
+    rng = np.random.default_rng(seed)
+    switch = '$SWITCH_ID'
+    pas = set()
+    records = [{'name': 'vip', 'op': 'create', 'type': 'SAI_OBJECT_TYPE_VIP_ENTRY',
+                'key': {'switch_id': switch, 'vip': '172.16.0.1'},
+                'attributes': ['SAI_VIP_ENTRY_ATTR_ACTION', 'SAI_VIP_ENTRY_ACTION_ACCEPT']}]
+    for eni in range(enis):
+        records += [{'name': 'vnet_%d' % eni, 'op': 'create', 'type': 'SAI_OBJECT_TYPE_VNET',
+                     'attributes': ['SAI_VNET_ATTR_VNI', 2000 + eni]},
+                    {'name': 'eni_%d' % eni, 'op': 'create', 'type': 'SAI_OBJECT_TYPE_ENI',
+                     'attributes': ['SAI_ENI_ATTR_ADMIN_STATE', True, 'SAI_ENI_ATTR_VM_UNDERLAY_DIP', '172.17.0.%d' % eni,
+                                    'SAI_ENI_ATTR_VM_VNI', 3000 + eni, 'SAI_ENI_ATTR_VNET_ID', '$vnet_%d' % eni]},
+                    {'name': 'eni_address_%d' % eni, 'op': 'create', 'type': 'SAI_OBJECT_TYPE_ENI_ETHER_ADDRESS_MAP_ENTRY',
+                     'key': {'switch_id': switch, 'address': '00:cc:cc:cc:%02x:%02x' % (eni >> 8, eni & 0xff)},
+                     'attributes': ['SAI_ENI_ETHER_ADDRESS_MAP_ENTRY_ATTR_ENI_ID', '$eni_%d' % eni]}]
+        for route in range(routes):
+            mask = (1 << 32) - (1 << (32 - int(rng.choice([16, 24, 32]))))
+            network = (0x0a000000 | int(rng.integers(0, 1 << 24))) & mask
+            key = {'switch_id': switch, 'eni_id': '$eni_%d' % eni, 'vni': str(100 + route % 16),
+                   'sip': str(ipaddress.IPv4Address(network)), 'sip_mask': str(ipaddress.IPv4Address(mask)),
+                   'priority': int(rng.integers(0, 100))}
+            if rng.random() < 0.5:
+                attrs = ['SAI_INBOUND_ROUTING_ENTRY_ATTR_ACTION', 'SAI_INBOUND_ROUTING_ENTRY_ACTION_VXLAN_DECAP']
+            else:
+                attrs = ['SAI_INBOUND_ROUTING_ENTRY_ATTR_ACTION', 'SAI_INBOUND_ROUTING_ENTRY_ACTION_VXLAN_DECAP_PA_VALIDATE',
+                         'SAI_INBOUND_ROUTING_ENTRY_ATTR_SRC_VNET_ID', '$vnet_%d' % eni]
+                pa = (eni, network | (~mask & 1))
+                if pa not in pas:
+                    pas.add(pa)
+                    records.append({'name': 'pa_%d_%d' % (eni, route), 'op': 'create',
+                                    'type': 'SAI_OBJECT_TYPE_PA_VALIDATION_ENTRY',
+                                    'key': {'switch_id': switch, 'vnet_id': '$vnet_%d' % eni,
+                                            'sip': str(ipaddress.IPv4Address(pa[1]))},
+                                    'attributes': ['SAI_PA_VALIDATION_ENTRY_ATTR_ACTION',
+                                                   'SAI_PA_VALIDATION_ENTRY_ACTION_PERMIT']})
+            records.append({'name': 'inbound_route_%d_%d' % (eni, route), 'op': 'create',
+                            'type': 'SAI_OBJECT_TYPE_INBOUND_ROUTING_ENTRY', 'key': key, 'attributes': attrs})
+    return records
+
+
+def inbound_packets(config, count, seed=1):
+    """ VXLAN packets to the ENIs of a config from the sources of their inbound routes, the host bits
+        of the source being those of the PA validation entry half of the time """
+    rng = np.random.default_rng(seed)
+    vip = next(iter(config['vip_entry'].values())).key['vip']
+    macs = {r.attrs['eni_id']: h.mac_to_int(r.key['address']) for r in config['eni_ether_address_map_entry'].values()}
+    routes = list(config['inbound_routing_entry'].values())
+    route_mac = np.array([macs[r.key['eni_id']] for r in routes], dtype=np.uint64)
+    route_vni = np.array([int(r.key['vni']) for r in routes], dtype=np.uint32)
+    route_sip = np.array([int(ipaddress.IPv4Address(r.key['sip'])) for r in routes], dtype=np.uint64)
+    route_mask = np.array([int(ipaddress.IPv4Address(r.key['sip_mask'])) for r in routes], dtype=np.uint64)
+
+    pkts = h.zeros(count)
+    pkts['valid'] = h.ETHERNET | h.IPV4 | h.UDP | h.VXLAN | h.INNER_ETHERNET | h.INNER_IPV4 | h.INNER_UDP
+    pkts['eth']['type'] = h.IPV4_ETHTYPE
+    pkts['ip']['version'] = 4
+    pkts['ip']['proto'] = h.UDP_PROTO
+    pkts['ip']['ttl'] = 64
+    h.set_ip(pkts['ip']['dst'], slice(None), vip)
+    route = rng.integers(0, len(routes), count)
+    host = np.where(rng.random(count) < 0.5, 1, rng.integers(0, 1 << 32, count).astype(np.uint64))
+    pkts['ip']['src'][:, 1] = route_sip[route] | (host.astype(np.uint64) & ~route_mask[route] & np.uint64(0xffffffff))
+    pkts['l4']['dport'] = h.UDP_PORT_VXLAN
+    pkts['vni'] = route_vni[route]
+    pkts['inner_eth']['dst'] = route_mac[route]
+    pkts['inner_eth']['type'] = h.IPV4_ETHTYPE
+    inner = pkts['inner_ip']
+    inner['version'] = 4
+    inner['proto'] = h.UDP_PROTO
+    inner['ttl'] = 64
+    inner['len'] = h.IPV4_HDR_SIZE + h.UDP_HDR_SIZE + 64
+    inner['src'][:, 1] = rng.integers(0, 1 << 32, count).astype(np.uint64)
+    inner['dst'][:, 1] = rng.integers(0, 1 << 32, count).astype(np.uint64)
+    pkts['inner_l4']['sport'] = rng.integers(0, 1 << 16, count)
+    pkts['inner_l4']['dport'] = rng.integers(0, 1 << 16, count)
+    pkts['inner_l4']['len'] = h.UDP_HDR_SIZE + 64
+    pkts['payload_len'] = 64
+    pkts['ip']['len'] = h.IPV4_HDR_SIZE + h.UDP_HDR_SIZE + h.VXLAN_HDR_SIZE + h.ETHER_HDR_SIZE + inner['len']
+    pkts['l4']['len'] = pkts['ip']['len'] - h.IPV4_HDR_SIZE
+    return pkts
+
+
+def bench_inbound(args):
+    config = SaiConfig(inbound_records(args.enis, args.routes))
+    start = time.perf_counter()
+    model = InboundModel(config)
+    build_s = time.perf_counter() - start
+    pkts = inbound_packets(config, args.packets)
+    start = time.perf_counter()
+    _, meta = model.process(pkts)
+    process_s = time.perf_counter() - start
+    reasons = np.bincount(meta['drop_reason'], minlength=len(DROP_REASONS))
+    return {'model': 'inbound', 'enis': args.enis, 'routes': args.enis * args.routes, 'packets': args.packets,
+            'build_s': round(build_s, 3), 'process_s': round(process_s, 3), 'pps': round(args.packets / process_s),
+            'drop_reasons': {DROP_REASONS[i]: int(n) for i, n in enumerate(reasons) if n}}
+
+
+def bench_lpm(args):
+    """ Routes of --enis ENIs sharing --routes prefixes (/24 and /32 IPv4, /48 and /64 IPv6), lookups of
+        addresses of the routed ranges, checked against the hash based PrefixIndex on a sample """
+    rng = np.random.default_rng(1)
+    enis = rng.integers(1, args.enis + 1, args.routes).astype(np.uint64)
+    lengths = rng.choice([48, 64, 64, 64] if args.v6 else [24, 32, 32, 32], args.routes)
+    addresses = np.zeros((args.routes, 2), dtype=np.uint64)
+    if args.v6:
+        addresses[:, 0] = np.uint64(0xfd00 << 48) | rng.integers(0, 1 << 24, args.routes).astype(np.uint64)
+        addresses[:, 1] = rng.integers(0, 1 << 63, args.routes).astype(np.uint64)
+    else:
+        addresses[:, 1] = np.uint64(0x0a000000) | rng.integers(0, 1 << 20, args.routes).astype(np.uint64)
+    length128 = lengths + (0 if args.v6 else 96)
+    high, low = prefix_masks(length128)
+    addresses[:, 0] &= high
+    addresses[:, 1] &= low
+    # Drop the duplicate routes
+    _, unique = np.unique(np.stack([enis, addresses[:, 0], addresses[:, 1], lengths.astype(np.uint64)], 1),
+                          axis=0, return_index=True)
+    enis, addresses, lengths = enis[unique], addresses[unique], lengths[unique]
+    length128, low = length128[unique], low[unique]
+    routes = len(enis)
+    is_v6 = np.full(routes, args.v6, dtype=np.uint8)
+
+    start = time.perf_counter()
+    index = RouteIndex(enis, is_v6, addresses, lengths)
+    build_s = time.perf_counter() - start
+
+    query = rng.integers(0, routes, args.lookups)
+    query_enis = enis[query]
+    query_addresses = addresses[query]
+    # Random host bits below the route prefixes
+    query_addresses[:, 1] |= rng.integers(0, 1 << 63, args.lookups).astype(np.uint64) & ~low[query]
+    query_v6 = np.full(args.lookups, args.v6, dtype=np.uint8)
+    start = time.perf_counter()
+    rows = index.lookup(query_enis, query_v6, query_addresses)
+    lookup_s = time.perf_counter() - start
+
+    sample = slice(0, min(args.lookups, 100000))
+    reference = PrefixIndex([enis, is_v6], addresses, length128)
+    expected = reference.lookup([query_enis[sample], query_v6[sample]], query_addresses[sample])
+    mismatches = int((rows[sample] != expected).sum())
+
+    start = time.perf_counter()
+    for row in range(min(routes, 1000)):
+        index.delete(int(enis[row]), args.v6, (int(addresses[row, 0]) << 64) | int(addresses[row, 1]), int(lengths[row]))
+        index.insert(int(enis[row]), args.v6, (int(addresses[row, 0]) << 64) | int(addresses[row, 1]), int(lengths[row]), row)
+    update_us = (time.perf_counter() - start) / (2 * min(routes, 1000)) * 1e6
+
+    return {'model': 'lpm', 'family': 'ipv6' if args.v6 else 'ipv4', 'enis': args.enis, 'routes': routes,
+            'lookups': args.lookups, 'build_s': round(build_s, 3), 'lookup_s': round(lookup_s, 3),
+            'mlookups_per_s': round(args.lookups / lookup_s / 1e6, 1), 'update_us': round(update_us, 1),
+            'hits': int((rows >= 0).sum()), 'mismatches': mismatches}
+
+
+def acl_records(rules, seed=1):
+    """ One IPv4 ACL group per stage holding --rules rules with lists of prefixes, protocols and port ranges """
+    rng = np.random.default_rng(seed)
+    actions = ['PERMIT', 'PERMIT_AND_CONTINUE', 'DENY', 'DENY_AND_CONTINUE']
+
+    def prefixes():
+        return ','.join('10.%d.%d.0/%d' % (rng.integers(0, 16), rng.integers(0, 256), rng.choice([14, 16, 20, 24]))
+                        for _ in range(rng.integers(1, 5)))
+
+    records = []
+    for stage in range(1, 4):
+        records.append({'name': 'acl_group_%d' % stage, 'op': 'create', 'type': 'SAI_OBJECT_TYPE_DASH_ACL_GROUP',
+                        'attributes': ['SAI_DASH_ACL_GROUP_ATTR_IP_ADDR_FAMILY', 'SAI_IP_ADDR_FAMILY_IPV4']})
+        for rule in range(rules):
+            attrs = ['SAI_DASH_ACL_RULE_ATTR_DASH_ACL_GROUP_ID', '$acl_group_%d' % stage,
+                     'SAI_DASH_ACL_RULE_ATTR_PRIORITY', int(rng.integers(0, 1 << 16)),
+                     'SAI_DASH_ACL_RULE_ATTR_ACTION', 'SAI_DASH_ACL_RULE_ACTION_' + rng.choice(actions, p=[0.1, 0.4, 0.1, 0.4]),
+                     'SAI_DASH_ACL_RULE_ATTR_DIP', prefixes(),
+                     'SAI_DASH_ACL_RULE_ATTR_SIP', prefixes()]
+            if rng.random() < 0.5:
+                attrs += ['SAI_DASH_ACL_RULE_ATTR_PROTOCOL', rng.choice(['6', '17', '6,17'])]
+            if rng.random() < 0.5:
+                low = int(rng.integers(0, 1 << 16))
+                attrs += ['SAI_DASH_ACL_RULE_ATTR_DST_PORT', '%d-%d' % (low, min(low + rng.integers(0, 4096), 65535))]
+            if rng.random() < 0.2:
+                attrs += ['SAI_DASH_ACL_RULE_ATTR_SRC_PORT', str(rng.integers(0, 1 << 16))]
+            records.append({'name': 'acl_rule_%d_%d' % (stage, rule), 'op': 'create',
+                            'type': 'SAI_OBJECT_TYPE_DASH_ACL_RULE', 'attributes': attrs})
+    return records
+
+
+def bench_acl(args):
+    """ 3 stages of --rules rules each on --flows random 5-tuples of 10.0.0.0/12, checked against
+        the linear classifier on a sample """
+    config = SaiConfig(acl_records(args.rules))
+    start = time.perf_counter()
+    acl = AclClassifier(config)
+    build_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(2)
+    groups = np.tile(np.array([config.oid_of('acl_group_%d' % stage) for stage in range(1, 4)], dtype=np.uint64),
+                     (args.flows, 1))
+    sip = np.zeros((args.flows, 2), dtype=np.uint64)
+    dip = np.zeros((args.flows, 2), dtype=np.uint64)
+    sip[:, 1] = np.uint64(0x0a000000) | rng.integers(0, 1 << 20, args.flows).astype(np.uint64)
+    dip[:, 1] = np.uint64(0x0a000000) | rng.integers(0, 1 << 20, args.flows).astype(np.uint64)
+    protocol = rng.choice(np.array([6, 17], dtype=np.uint8), args.flows)
+    src_port = rng.integers(0, 1 << 16, args.flows).astype(np.uint16)
+    dst_port = rng.integers(0, 1 << 16, args.flows).astype(np.uint16)
+    start = time.perf_counter()
+    denied, rules = acl.classify(groups, sip, dip, protocol, src_port, dst_port)
+    classify_s = time.perf_counter() - start
+
+    sample = slice(0, min(args.flows, 20000))
+    _, expected = AclRules(config).classify(groups[sample], sip[sample], dip[sample], protocol[sample],
+                                            src_port[sample], dst_port[sample])
+    mismatches = int((rules[sample] != expected).any(axis=1).sum())
+
+    return {'model': 'acl', 'rules': args.rules, 'stages': 3, 'flows': args.flows,
+            'build_s': round(build_s, 3), 'classify_s': round(classify_s, 3),
+            'flows_per_s': round(args.flows / classify_s), 'denied': int(denied.sum()),
+            'stage_hits': [int(hits) for hits in (rules >= 0).sum(axis=0)], 'mismatches': mismatches}
+
+
+def bench_conntrack(args):
+    """ Flow tables replayed over a capture, or over synthetic connections of the config ENIs (or of
+        --enis ENIs without config) """
+    config = SaiConfig.from_file(args.config) if args.config else None
+    if args.pcap:
+        trace = pcap_trace(args.pcap, config or SaiConfig())
+    else:
+        enis = [r.oid for r in config['eni'].values()] if config else list(range(1, args.enis + 1))
+        trace = synthetic_trace(enis, args.cps, args.duration, args.packets, args.lifetime, args.open_ratio)
+    sim = ConntrackSimulator(config, args.capacity, args.timeout, interval=args.interval)
+    start = time.perf_counter()
+    report = sim.replay(trace)
+    replay_s = time.perf_counter() - start
+    result = {'model': 'conntrack', 'capacity': args.capacity, 'timeout_s': args.timeout,
+              'replay_s': round(replay_s, 3), 'pps': round(len(trace) / replay_s) if replay_s else 0}
+    result.update(report)
+    return result
+
+
+def bench_codec(args):
+    """ Frames of the outbound VXLAN packets of a config built, with their checksums, and parsed back,
+        in memory and through a pcap file """
+    config = SaiConfig.from_file(args.config)
+    pkts = outbound_packets(config, args.packets)
+    start = time.perf_counter()
+    buffer, offsets, lengths = encode(pkts)
+    encode_s = time.perf_counter() - start
+    start = time.perf_counter()
+    decoded, payload = decode(buffer, offsets, lengths)
+    decode_s = time.perf_counter() - start
+    mismatches = int((encode(decoded, buffer, payload, checksums=False)[0] != buffer).sum())
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'codec.pcap')
+        start = time.perf_counter()
+        write_pcap_chunks(path, [(np.arange(args.packets) * 1e-6, buffer, offsets, lengths)])
+        write_s = time.perf_counter() - start
+        start = time.perf_counter()
+        read = 0
+        for _, chunk, chunk_offsets, chunk_lengths in read_pcap_chunks(path):
+            read += len(decode(chunk, chunk_offsets, chunk_lengths)[0])
+        read_s = time.perf_counter() - start
+
+    return {'model': 'codec', 'config': os.path.basename(args.config), 'packets': args.packets,
+            'bytes': len(buffer), 'encode_s': round(encode_s, 3), 'encode_pps': round(args.packets / encode_s),
+            'decode_s': round(decode_s, 3), 'decode_pps': round(args.packets / decode_s),
+            'pcap_write_s': round(write_s, 3), 'pcap_read_decode_s': round(read_s, 3),
+            'pcap_read_decode_pps': round(read / read_s), 'mismatched_bytes': mismatches}
+
+
+def synth_records(enis, routes, mappings, rules, seed=1):
+    """ ENIs with --routes /26 routes to a VNET of their own, --mappings CA to PA entries of consecutive
+        addresses from the first one of each route, like the dpugen configs, behind 3 IPv4 ACL stages
+        of --rules rules shared by all the ENIs """
+    switch = '$SWITCH_ID'
+    records = acl_records(rules, seed) if rules else []
+    records += [{'name': 'vip', 'op': 'create', 'type': 'SAI_OBJECT_TYPE_VIP_ENTRY',
+                 'key': {'switch_id': switch, 'vip': '221.0.0.2'},
+                 'attributes': ['SAI_VIP_ENTRY_ATTR_ACTION', 'SAI_VIP_ENTRY_ACTION_ACCEPT']},
+                {'name': 'dle', 'op': 'create', 'type': 'SAI_OBJECT_TYPE_DIRECTION_LOOKUP_ENTRY',
+                 'key': {'switch_id': switch, 'vni': 5000},
+                 'attributes': ['SAI_DIRECTION_LOOKUP_ENTRY_ATTR_ACTION',
+                                'SAI_DIRECTION_LOOKUP_ENTRY_ACTION_SET_OUTBOUND_DIRECTION']}]
+    for eni in range(enis):
+        acl = []
+        if rules:
+            for stage in range(1, 4):
+                acl += ['SAI_ENI_ATTR_OUTBOUND_V4_STAGE%d_DASH_ACL_GROUP_ID' % stage, '$acl_group_%d' % stage]
+        records += [{'name': 'vnet_%d' % eni, 'op': 'create', 'type': 'SAI_OBJECT_TYPE_VNET',
+                     'attributes': ['SAI_VNET_ATTR_VNI', 1000 + eni]},
+                    {'name': 'eni_%d' % eni, 'op': 'create', 'type': 'SAI_OBJECT_TYPE_ENI',
+                     'attributes': ['SAI_ENI_ATTR_ADMIN_STATE', True, 'SAI_ENI_ATTR_VM_UNDERLAY_DIP', '221.0.1.%d' % eni,
+                                    'SAI_ENI_ATTR_VM_VNI', 9 + eni, 'SAI_ENI_ATTR_VNET_ID', '$vnet_%d' % eni] + acl},
+                    {'name': 'eni_address_%d' % eni, 'op': 'create', 'type': 'SAI_OBJECT_TYPE_ENI_ETHER_ADDRESS_MAP_ENTRY',
+                     'key': {'switch_id': switch, 'address': '00:1a:c5:00:%02x:%02x' % (eni >> 8, eni & 0xff)},
+                     'attributes': ['SAI_ENI_ETHER_ADDRESS_MAP_ENTRY_ATTR_ENI_ID', '$eni_%d' % eni]}]
+        for route in range(routes):
+            network = 0x0a000000 | (eni << 16) | (route << 6)
+            records.append({'name': 'route_%d_%d' % (eni, route), 'op': 'create',
+                            'type': 'SAI_OBJECT_TYPE_OUTBOUND_ROUTING_ENTRY',
+                            'key': {'switch_id': switch, 'eni_id': '$eni_%d' % eni,
+                                    'destination': '%s/26' % ipaddress.IPv4Address(network)},
+                            'attributes': ['SAI_OUTBOUND_ROUTING_ENTRY_ATTR_ACTION',
+                                           'SAI_OUTBOUND_ROUTING_ENTRY_ACTION_ROUTE_VNET',
+                                           'SAI_OUTBOUND_ROUTING_ENTRY_ATTR_DST_VNET_ID', '$vnet_%d' % eni]})
+            for mapping in range(min(mappings, 64)):
+                records.append({'name': 'ca_%d_%d_%d' % (eni, route, mapping), 'op': 'create',
+                                'type': 'SAI_OBJECT_TYPE_OUTBOUND_CA_TO_PA_ENTRY',
+                                'key': {'switch_id': switch, 'dst_vnet_id': '$vnet_%d' % eni,
+                                        'dip': str(ipaddress.IPv4Address(network + mapping))},
+                                'attributes': ['SAI_OUTBOUND_CA_TO_PA_ENTRY_ATTR_UNDERLAY_DIP', '221.0.2.%d' % eni,
+                                               'SAI_OUTBOUND_CA_TO_PA_ENTRY_ATTR_OVERLAY_DMAC', '00:1b:6e:00:00:01',
+                                               'SAI_OUTBOUND_CA_TO_PA_ENTRY_ATTR_USE_DST_VNET_VNI', True]})
+    return records
+
+
+def bench_synth(args):
+    """ Flow templates covering a config, against the flows of configure_vnet_outbound_packet_flows():
+        one per VIP, direction lookup VNI and ENI MAC, each walking every CA DIP """
+    if args.config:
+        config = SaiConfig.from_file(args.config)
+    else:
+        config = SaiConfig(synth_records(args.enis, args.routes, args.mappings, args.rules))
+    start = time.perf_counter()
+    synth = FlowSynthesizer(config, drops=not args.forwarded)
+    templates = synth.templates()
+    synth_s = time.perf_counter() - start
+    report = synth.report()
+
+    probe, target, _ = synth.cover(expand(templates))
+    _, hit_probe, selected_target, selected = synth.result
+    lost = len(np.setdiff1d(selected_target[np.isin(hit_probe, selected)], target))
+    outbound_vnis = sum(r.attrs.get('action') == 'set_outbound_direction'
+                        for r in config['direction_lookup_entry'].values())
+    baseline = len(config['vip_entry']) * outbound_vnis * len(config['eni_ether_address_map_entry'])
+    result = {'model': 'synth', 'config': os.path.basename(args.config) if args.config else 'synthetic',
+              'synth_s': round(synth_s, 3), 'templates': len(templates), 'packets': int(templates['count'].sum()),
+              'baseline_flows': baseline, 'baseline_packets': baseline * len(config['outbound_ca_to_pa_entry']),
+              'lost_targets': lost}
+    result.update(report)
+    return result
+
+
+def policer_records(enis, cps, pps, flows):
+    """ ENIs whose CPS, PPS and FLOWS limits grow from 1/enis to all of --cps-limit, --pps-limit and
+        --flows-limit, for the ENIs to reach their limits at different rates """
+    records = [{'name': 'vnet', 'op': 'create', 'type': 'SAI_OBJECT_TYPE_VNET', 'attributes': ['SAI_VNET_ATTR_VNI', 1000]}]
+    for eni in range(enis):
+        share = (eni + 1) / enis
+        records.append({'name': 'eni_%d' % eni, 'op': 'create', 'type': 'SAI_OBJECT_TYPE_ENI',
+                        'attributes': ['SAI_ENI_ATTR_CPS', int(cps * share), 'SAI_ENI_ATTR_PPS', int(pps * share),
+                                       'SAI_ENI_ATTR_FLOWS', int(flows * share), 'SAI_ENI_ATTR_ADMIN_STATE', True,
+                                       'SAI_ENI_ATTR_VNET_ID', '$vnet']})
+    return records
+
+
+def bench_police(args):
+    """ Connections and packets the ENIs of a config (or --enis synthetic ENIs) accept and drop, under
+        the same traffic on every ENI, and the ceiling of a rate with --ceiling """
+    if args.config:
+        config = SaiConfig.from_file(args.config)
+    else:
+        config = SaiConfig(policer_records(args.enis, args.cps_limit, args.pps_limit, args.flows_limit))
+    policer = EniPolicer(config, args.burst, args.tick)
+    profile = uniform_profile(policer.eni_ids, args.flows, args.cps, args.lifetime, args.pps)
+    start = time.perf_counter()
+    report = policer.predict(profile, args.duration)
+    predict_s = time.perf_counter() - start
+    result = {'model': 'police', 'config': os.path.basename(args.config) if args.config else 'synthetic',
+              'predict_s': round(predict_s, 3)}
+    if args.ceiling:
+        start = time.perf_counter()
+        result['ceiling'] = policer.ceiling(profile, args.ceiling, args.duration)
+        result['ceiling_s'] = round(time.perf_counter() - start, 3)
+    result.update(report)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DASH reference model benchmark')
+    subparsers = parser.add_subparsers(dest='model', required=True)
+    outbound = subparsers.add_parser('outbound', help='Outbound pipeline on VXLAN traffic of the config ENIs')
+    outbound.add_argument('--config', type=str, default=os.path.join(SCALE_DIR, 'vnet_outbound_setup_commands_simple.json'),
+                          help='SAI records of the configuration, JSON or NDJSON')
+    outbound.add_argument('--packets', type=int, default=1000000, help='Number of packets')
+    outbound.set_defaults(func=bench_outbound)
+    inbound = subparsers.add_parser('inbound', help='Inbound pipeline on a synthetic config of inbound routes')
+    inbound.add_argument('--enis', type=int, default=8, help='Number of ENIs')
+    inbound.add_argument('--routes', type=int, default=6000, help='Number of inbound routes of every ENI')
+    inbound.add_argument('--packets', type=int, default=1000000, help='Number of packets')
+    inbound.set_defaults(func=bench_inbound)
+    lpm = subparsers.add_parser('lpm', help='Outbound routing LPM index on synthetic routes')
+    lpm.add_argument('--enis', type=int, default=8, help='Number of ENIs')
+    lpm.add_argument('--routes', type=int, default=48000, help='Number of routes, over all ENIs')
+    lpm.add_argument('--lookups', type=int, default=10000000, help='Number of lookups')
+    lpm.add_argument('--v6', action='store_true', help='IPv6 routes instead of IPv4')
+    lpm.set_defaults(func=bench_lpm)
+    acl = subparsers.add_parser('acl', help='ACL classifier on synthetic rules and 5-tuples')
+    acl.add_argument('--rules', type=int, default=4000, help='Number of rules of every stage')
+    acl.add_argument('--flows', type=int, default=1000000, help='Number of 5-tuples')
+    acl.set_defaults(func=bench_acl)
+    conntrack = subparsers.add_parser('conntrack', help='ConntrackIn/ConntrackOut flow tables on a TCP trace')
+    conntrack.add_argument('--config', type=str, help='SAI records of the ENIs, for their FLOWS and CPS limits')
+    conntrack.add_argument('--pcap', type=str, help='Capture of VXLAN traffic to replay instead of synthetic connections')
+    conntrack.add_argument('--enis', type=int, default=4, help='Number of ENIs of the synthetic connections without --config')
+    conntrack.add_argument('--cps', type=float, default=10000, help='Connections per second of every ENI')
+    conntrack.add_argument('--duration', type=float, default=10, help='Seconds of synthetic connections')
+    conntrack.add_argument('--packets', type=int, default=6, help='Data packets of a synthetic connection')
+    conntrack.add_argument('--lifetime', type=float, default=1.0, help='Seconds from the SYN to the FIN of a connection')
+    conntrack.add_argument('--open-ratio', type=float, default=0.0, help='Share of the connections never closed')
+    conntrack.add_argument('--capacity', type=int, default=1 << 20, help='Flows of every conntrack table')
+    conntrack.add_argument('--timeout', type=float, default=60, help='Expire time of the flows, seconds')
+    conntrack.add_argument('--interval', type=float, default=1.0, help='Seconds between two occupancy samples')
+    conntrack.set_defaults(func=bench_conntrack)
+    codec = subparsers.add_parser('codec', help='Frames of VXLAN traffic built from and parsed to header arrays')
+    codec.add_argument('--config', type=str, default=os.path.join(SCALE_DIR, 'vnet_outbound_setup_commands_simple.json'),
+                       help='SAI records of the configuration, JSON or NDJSON')
+    codec.add_argument('--packets', type=int, default=1000000, help='Number of packets')
+    codec.set_defaults(func=bench_codec)
+    synth = subparsers.add_parser('synth', help='Flow templates covering the entries and paths of a config')
+    synth.add_argument('--config', type=str, help='SAI records of the configuration, instead of a synthetic one')
+    synth.add_argument('--enis', type=int, default=8, help='Number of ENIs of the synthetic config')
+    synth.add_argument('--routes', type=int, default=64, help='Number of routes of every ENI')
+    synth.add_argument('--mappings', type=int, default=64, help='CA to PA entries of every route, 64 at most')
+    synth.add_argument('--rules', type=int, default=200, help='Number of ACL rules of every stage, 0 for no ACL')
+    synth.add_argument('--forwarded', action='store_true', help='Cover the forwarding paths only')
+    synth.set_defaults(func=bench_synth)
+    police = subparsers.add_parser('police', help='CPS, PPS and FLOWS limits of the ENIs under a traffic profile')
+    police.add_argument('--config', type=str, help='SAI records of the ENIs, instead of synthetic ones')
+    police.add_argument('--enis', type=int, default=64, help='Number of synthetic ENIs')
+    police.add_argument('--cps-limit', type=int, default=20000, help='CPS of the last synthetic ENI')
+    police.add_argument('--pps-limit', type=int, default=200000, help='PPS of the last synthetic ENI')
+    police.add_argument('--flows-limit', type=int, default=40000, help='FLOWS of the last synthetic ENI')
+    police.add_argument('--flows', type=float, default=100, help='Flows of every ENI open from the start')
+    police.add_argument('--cps', type=float, default=1000, help='Connections per second of every ENI')
+    police.add_argument('--lifetime', type=float, default=2.0, help='Seconds a connection lasts')
+    police.add_argument('--pps', type=float, default=10, help='Packets per second of every flow')
+    police.add_argument('--duration', type=float, default=10, help='Seconds of traffic')
+    police.add_argument('--burst', type=float, default=0.1, help='Seconds of its rate a token bucket holds')
+    police.add_argument('--tick', type=float, default=0.001, help='Seconds of a step of the model')
+    police.add_argument('--ceiling', choices=['cps', 'pps'], help='Also search the ceiling of a rate')
+    police.set_defaults(func=bench_police)
+    args = parser.parse_args()
+    print(json.dumps(args.func(args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,462 @@
+"""
+Batch codec between Ethernet frames and the DASH header stack of headers.py.
+
+decode() parses the frames of a buffer as dash_parser.p4 does: Ethernet, IPv4 (with options) or
+IPv6, UDP or TCP, VXLAN on UDP port 4789, then the inner Ethernet, IPv4 or IPv6 and TCP or UDP.
+encode() emits the valid headers of every packet in the order of the deparser and appends its
+payload, with the IPv4, UDP and TCP checksums computed on the whole batch. Frames are referred to
+by their positions and sizes in a buffer, the form pcap.read_pcap_chunks() yields them, so a
+capture is decoded without copying or parsing the frames one at a time:
+
+    for times, buffer, offsets, lengths in read_pcap_chunks('capture.pcap'):
+        pkts, payload = decode(buffer, offsets, lengths)
+        expected, meta = model.process(pkts)
+        frames, offsets, lengths = encode(expected, buffer, payload)
+
+IPv4 options of the outer header are skipped, the model does not keep them, and encode() emits
+20 bytes IPv4 and TCP headers. TCP options and the bytes after the headers are the payload.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from . import headers as h
+from .pcap import copy_segments
+
+CHUNK_SIZE = 16384
+
+# Byte layout of the headers, (field, offset, size)
+_ETHERNET = [('dst', 0, 6), ('src', 6, 6), ('type', 12, 2)]
+_IPV4 = [('tos', 1, 1), ('len', 2, 2), ('id', 4, 2), ('frag', 6, 2), ('ttl', 8, 1), ('proto', 9, 1),
+         ('chksum', 10, 2)]
+_IPV6 = [('len', 4, 2), ('proto', 6, 1), ('ttl', 7, 1)]
+_UDP = [('sport', 0, 2), ('dport', 2, 2), ('len', 4, 2), ('chksum', 6, 2)]
+_TCP = [('sport', 0, 2), ('dport', 2, 2), ('seq', 4, 4), ('ack', 8, 4), ('window', 14, 2), ('chksum', 16, 2),
+        ('urgent', 18, 2)]
+
+_UDP_CHKSUM = 6
+_TCP_CHKSUM = 16
+
+# Unsigned type holding a big endian field of each size
+_WIDTH = {1: 1, 2: 2, 3: 4, 4: 4, 6: 8, 8: 8}
+
+
+def _read(buf, pos, size):
+    """ (n, size) bytes at pos in buf """
+    return sliding_window_view(buf, size)[pos]
+
+
+def _write(out, pos, block):
+    if len(pos):
+        sliding_window_view(out, block.shape[1], writeable=True)[pos] = block
+
+
+def _get(block, offset, size):
+    """ Big endian unsigned field of each row of a block of bytes """
+    width = _WIDTH[size]
+    if width == size:
+        return np.ascontiguousarray(block[:, offset:offset + size]).view('>u%d' % width)[:, 0]
+    word = np.zeros((len(block), width), dtype=np.uint8)
+    word[:, width - size:] = block[:, offset:offset + size]
+    return word.view('>u%d' % width)[:, 0]
+
+
+def _put(block, offset, size, values):
+    width = _WIDTH[size]
+    word = np.ascontiguousarray(values, dtype='>u%d' % width).view(np.uint8).reshape(-1, width)
+    block[:, offset:offset + size] = word[:, width - size:]
+
+
+def _get_ip(block, offset, size):
+    """ Big endian IPv4 or IPv6 address of each row -> (n, 2) uint64 words, an IPv4 one in the low word """
+    words = np.zeros((len(block), 2), dtype=np.uint64)
+    if size == 16:
+        words[:, 0] = _get(block, offset, 8)
+        words[:, 1] = _get(block, offset + 8, 8)
+    else:
+        words[:, 1] = _get(block, offset, 4)
+    return words
+
+
+def _rows(pos, size, end, mask):
+    """ Rows of mask whose header of size bytes at pos is in the frame """
+    return np.nonzero(mask & (pos + size <= end))[0]
+
+
+def _decode_ethernet(buf, eth, pos, end, mask):
+    rows = _rows(pos, h.ETHER_HDR_SIZE, end, mask)
+    block = _read(buf, pos[rows], h.ETHER_HDR_SIZE)
+    for field, offset, size in _ETHERNET:
+        eth[field][rows] = _get(block, offset, size)
+    return rows
+
+
+def _decode_ip(buf, ip, pos, end, ethertype, mask, options):
+    """
+    IPv4 or IPv6 header at pos, returns the rows of both, the mask of the packets whose parsing
+    carries on, the position of the next header and the end of the IP packets.
+    """
+    ipv4 = _rows(pos, h.IPV4_HDR_SIZE, end, mask & (ethertype == h.IPV4_ETHTYPE))
+    block = _read(buf, pos[ipv4], h.IPV4_HDR_SIZE)
+    ip['version'][ipv4] = 4
+    for field, offset, size in _IPV4:
+        ip[field][ipv4] = _get(block, offset, size)
+    ip['src'][ipv4] = _get_ip(block, 12, 4)
+    ip['dst'][ipv4] = _get_ip(block, 16, 4)
+    header_len = np.zeros(len(pos), dtype=np.int64)
+    header_len[ipv4] = (block[:, 0] & 0xf).astype(np.int64) * 4 if options else h.IPV4_HDR_SIZE
+
+    ipv6 = _rows(pos, h.IPV6_HDR_SIZE, end, mask & (ethertype == h.IPV6_ETHTYPE))
+    block = _read(buf, pos[ipv6], h.IPV6_HDR_SIZE)
+    ip['version'][ipv6] = 6
+    word = _get(block, 0, 4)
+    ip['tos'][ipv6] = (word >> 20) & 0xff
+    ip['flow_label'][ipv6] = word & 0xfffff
+    for field, offset, size in _IPV6:
+        ip[field][ipv6] = _get(block, offset, size)
+    ip['src'][ipv6] = _get_ip(block, 8, 16)
+    ip['dst'][ipv6] = _get_ip(block, 24, 16)
+    header_len[ipv6] = h.IPV6_HDR_SIZE
+
+    # The parser rejects IPv4 headers with an ihl below 5, the next headers are not extracted
+    carry_on = header_len >= h.IPV4_HDR_SIZE
+    has_ip = header_len > 0
+    next_pos = pos + np.maximum(header_len, np.where(has_ip, h.IPV4_HDR_SIZE, 0))
+    ip_end = np.where(has_ip, pos + h.ip_packet_len(ip).astype(np.int64), end)
+    return ipv4, ipv6, carry_on, next_pos, ip_end
+
+
+def _decode_l4(buf, l4, pos, end, proto, mask):
+    udp = _rows(pos, h.UDP_HDR_SIZE, end, mask & (proto == h.UDP_PROTO))
+    block = _read(buf, pos[udp], h.UDP_HDR_SIZE)
+    for field, offset, size in _UDP:
+        l4[field][udp] = _get(block, offset, size)
+
+    tcp = _rows(pos, h.TCP_HDR_SIZE, end, mask & (proto == h.TCP_PROTO))
+    block = _read(buf, pos[tcp], h.TCP_HDR_SIZE)
+    for field, offset, size in _TCP:
+        l4[field][tcp] = _get(block, offset, size)
+    word = _get(block, 12, 2)
+    l4['data_offset'][tcp] = word >> 12
+    l4['ecn'][tcp] = (word >> 6) & 0x7
+    l4['flags'][tcp] = word & 0x3f
+    next_pos = pos.copy()
+    next_pos[udp] += h.UDP_HDR_SIZE
+    next_pos[tcp] += h.TCP_HDR_SIZE
+    return udp, tcp, next_pos
+
+
+def _decode_chunk(buf, pkts, offsets, lengths):
+    pos = offsets.copy()
+    end = offsets + lengths
+    valid = np.zeros(len(pkts), dtype=np.uint16)
+
+    def found(rows, bit):
+        valid[rows] |= bit
+        mask = np.zeros(len(pkts), dtype=bool)
+        mask[rows] = True
+        return mask
+
+    eth = found(_decode_ethernet(buf, pkts['eth'], pos, end, np.ones(len(pkts), dtype=bool)), h.ETHERNET)
+    pos[eth] += h.ETHER_HDR_SIZE
+    ipv4, ipv6, carry_on, pos, ip_end = _decode_ip(buf, pkts['ip'], pos, end, pkts['eth']['type'], eth, True)
+    found(ipv4, h.IPV4)
+    found(ipv6, h.IPV6)
+    udp, tcp, pos = _decode_l4(buf, pkts['l4'], pos, end, pkts['ip']['proto'], carry_on)
+    udp = found(udp, h.UDP)
+    found(tcp, h.TCP)
+
+    vxlan = _rows(pos, h.VXLAN_HDR_SIZE, end, udp & (pkts['l4']['dport'] == h.UDP_PORT_VXLAN))
+    block = _read(buf, pos[vxlan], h.VXLAN_HDR_SIZE)
+    pkts['vxlan_flags'][vxlan] = block[:, 0]
+    pkts['vni'][vxlan] = _get(block, 4, 3)
+    pos[vxlan] += h.VXLAN_HDR_SIZE
+    vxlan = found(vxlan, h.VXLAN)
+
+    inner_eth = found(_decode_ethernet(buf, pkts['inner_eth'], pos, end, vxlan), h.INNER_ETHERNET)
+    pos[inner_eth] += h.ETHER_HDR_SIZE
+    inner_ipv4, inner_ipv6, carry_on, pos, inner_ip_end = _decode_ip(
+        buf, pkts['inner_ip'], pos, end, pkts['inner_eth']['type'], inner_eth, False)
+    inner_ip = found(inner_ipv4, h.INNER_IPV4) | found(inner_ipv6, h.INNER_IPV6)
+    inner_udp, inner_tcp, pos = _decode_l4(buf, pkts['inner_l4'], pos, end, pkts['inner_ip']['proto'], carry_on)
+    found(inner_udp, h.INNER_UDP)
+    found(inner_tcp, h.INNER_TCP)
+    pkts['valid'] = valid
+
+    # The payload ends with the innermost IP packet, Ethernet padding is not part of it
+    payload_end = np.minimum(end, np.where(inner_ip, inner_ip_end, ip_end))
+    pkts['payload_len'] = np.clip(payload_end - pos, 0, None)
+    return pos
+
+
+def decode(buffer, offsets, lengths, chunk_size=CHUNK_SIZE):
+    """
+    Parse a batch of Ethernet frames.
+
+    Parameters:
+        buffer (bytes-like): frames of the batch, a bytes, memoryview, mmap or uint8 array.
+        offsets, lengths (arrays): positions and sizes of the frames in buffer.
+        chunk_size (int): number of frames parsed at once.
+
+    Returns:
+        (pkts, payload): headers of the frames (HEADERS_DTYPE) and positions of their payloads in
+        buffer, the payload of pkts[i] being buffer[payload[i]:payload[i] + pkts[i]['payload_len']].
+    """
+    buf = np.frombuffer(buffer, dtype=np.uint8)
+    # Frames that are too short read their missing headers at position 0
+    if len(buf) < h.IPV6_HDR_SIZE:
+        buf = np.concatenate([buf, np.zeros(h.IPV6_HDR_SIZE, dtype=np.uint8)])
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    pkts = h.zeros(len(offsets))
+    payload = np.zeros(len(offsets), dtype=np.int64)
+    for start in range(0, len(offsets), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        payload[chunk] = _decode_chunk(buf, pkts[chunk], offsets[chunk], lengths[chunk])
+    return pkts, payload
+
+
+def decode_frames(frames):
+    """ decode() of a sequence of frames (bytes), e.g. scapy packets converted with bytes() """
+    frames = [bytes(frame) for frame in frames]
+    lengths = np.array([len(frame) for frame in frames], dtype=np.int64)
+    pkts, _ = decode(b''.join(frames), np.cumsum(lengths) - lengths, lengths)
+    return pkts
+
+
+def frames(buffer, offsets, lengths):
+    """ The frames of a batch as memoryviews of buffer, e.g. to build scapy packets of a few of them """
+    view = memoryview(buffer).cast('B')
+    return [view[offset:offset + length] for offset, length in zip(offsets.tolist(), lengths.tolist())]
+
+
+def _fold16(sums):
+    """ 64 bits sums of 16 bits words -> 16 bits one's complement sums """
+    for _ in range(4):
+        sums = (sums & 0xffff) + (sums >> 16)
+    return sums
+
+
+def _fold(sums):
+    """ 16 bits one's complement of 64 bits sums of 16 bits words """
+    return (~_fold16(sums.astype(np.uint64)) & 0xffff).astype(np.uint16)
+
+
+class _WordSums:
+    """ One's complement sums of the big endian 16 bits words of segments of buf[low:high] """
+
+    def __init__(self, buf, low, high):
+        self.low = low
+        # Zero padded to whole words and one more byte, see __call__
+        self.bytes = np.zeros((high - low) // 2 * 2 + 2, dtype=np.uint8)
+        self.bytes[:high - low] = buf[low:high]
+        self.prefix = np.zeros(len(self.bytes) // 2 + 1, dtype=np.uint64)
+        np.cumsum(self.bytes.view('>u2').astype(np.uint64), out=self.prefix[1:])
+
+    def __call__(self, starts, lengths):
+        starts = starts - self.low
+        stops = starts + lengths
+        # The words of the range that cover each segment, less the bytes that are not part of it
+        sums = self.prefix[(stops + 1) >> 1] - self.prefix[starts >> 1]
+        sums -= np.where(stops & 1, self.bytes[stops], 0).astype(np.uint64)
+        odd = (starts & 1) == 1
+        sums -= np.where(odd, self.bytes[starts - odd].astype(np.uint64) << 8, 0).astype(np.uint64)
+        sums = _fold16(sums)
+        # A segment at an odd position was summed a byte off, its sum is swapped (RFC 1071)
+        return np.where(odd, ((sums & 0xff) << 8) | (sums >> 8), sums)
+
+
+def _address_sums(words):
+    """ Sums of the 16 bits words of (n, 2) uint64 addresses """
+    return np.ascontiguousarray(words).view(np.uint16).sum(axis=1, dtype=np.uint64)
+
+
+def ipv4_checksum(ip):
+    """ Vectorized IPv4 header checksum of an IP column, 20 bytes headers, chksum field excluded """
+    sums = ((ip['version'].astype(np.uint64) << 12) | (5 << 8) | ip['tos'])
+    sums += ip['len'].astype(np.uint64) + ip['id'] + ip['frag']
+    sums += (ip['ttl'].astype(np.uint64) << 8) | ip['proto']
+    sums += _address_sums(ip['src']) + _address_sums(ip['dst'])
+    return _fold(sums)
+
+
+def _l4_checksum(ip, sums, lengths, udp):
+    """ Checksums of TCP or UDP segments from the sums of their words """
+    sums = sums + _address_sums(ip['src']) + _address_sums(ip['dst'])
+    sums += ip['proto'].astype(np.uint64) + (lengths & 0xffff).astype(np.uint64) + (lengths >> 16).astype(np.uint64)
+    chksum = _fold(sums)
+    if udp:
+        # 0 means no UDP checksum, a computed 0 is sent as 0xffff
+        chksum[chksum == 0] = 0xffff
+    return chksum
+
+
+def l4_checksum(ip, buf, starts, lengths, udp=False):
+    """
+    Vectorized TCP or UDP checksum, IPv4 or IPv6 pseudo header included.
+
+    Parameters:
+        ip (array): IP column of the packets.
+        buf (array): uint8 array of the frames, whose checksum fields are 0.
+        starts, lengths (arrays): positions and sizes of the TCP or UDP segments in buf.
+        udp (bool): UDP segments, whose checksum is never 0.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if not len(starts):
+        return np.zeros(0, dtype=np.uint16)
+    word_sums = _WordSums(buf, int(starts.min()), int((starts + lengths).max()))
+    return _l4_checksum(ip, word_sums(starts, lengths), lengths, udp)
+
+
+def _header_sizes(valid):
+    """ Sizes of the headers of every packet, in the order the deparser emits them """
+    def size(bit, header_size):
+        return np.where(valid & bit, header_size, 0).astype(np.int64)
+
+    return [size(h.ETHERNET, h.ETHER_HDR_SIZE),
+            size(h.IPV4, h.IPV4_HDR_SIZE) + size(h.IPV6, h.IPV6_HDR_SIZE),
+            size(h.UDP, h.UDP_HDR_SIZE) + size(h.TCP, h.TCP_HDR_SIZE),
+            size(h.VXLAN, h.VXLAN_HDR_SIZE),
+            size(h.INNER_ETHERNET, h.ETHER_HDR_SIZE),
+            size(h.INNER_IPV4, h.IPV4_HDR_SIZE) + size(h.INNER_IPV6, h.IPV6_HDR_SIZE),
+            size(h.INNER_UDP, h.UDP_HDR_SIZE) + size(h.INNER_TCP, h.TCP_HDR_SIZE)]
+
+
+def _encode_ethernet(out, pos, eth):
+    block = np.zeros((len(eth), h.ETHER_HDR_SIZE), dtype=np.uint8)
+    for field, offset, size in _ETHERNET:
+        _put(block, offset, size, eth[field])
+    _write(out, pos, block)
+
+
+def _encode_ipv4(out, pos, ip, checksums):
+    block = np.zeros((len(ip), h.IPV4_HDR_SIZE), dtype=np.uint8)
+    for field, offset, size in _IPV4:
+        _put(block, offset, size, ip[field])
+    block[:, 0] = 0x45
+    if checksums:
+        _put(block, 10, 2, ipv4_checksum(ip))
+    _put(block, 12, 4, ip['src'][:, 1])
+    _put(block, 16, 4, ip['dst'][:, 1])
+    _write(out, pos, block)
+
+
+def _encode_ipv6(out, pos, ip):
+    block = np.zeros((len(ip), h.IPV6_HDR_SIZE), dtype=np.uint8)
+    _put(block, 0, 4, (6 << 28) | (ip['tos'].astype(np.uint32) << 20) | (ip['flow_label'] & 0xfffff))
+    for field, offset, size in _IPV6:
+        _put(block, offset, size, ip[field])
+    for offset, words in ((8, ip['src']), (24, ip['dst'])):
+        _put(block, offset, 8, words[:, 0])
+        _put(block, offset + 8, 8, words[:, 1])
+    _write(out, pos, block)
+
+
+def _encode_udp(out, pos, l4, checksums):
+    block = np.zeros((len(l4), h.UDP_HDR_SIZE), dtype=np.uint8)
+    for field, offset, size in _UDP:
+        _put(block, offset, size, l4[field])
+    if checksums:
+        block[:, _UDP_CHKSUM:_UDP_CHKSUM + 2] = 0
+    _write(out, pos, block)
+
+
+def _encode_tcp(out, pos, l4, checksums):
+    block = np.zeros((len(l4), h.TCP_HDR_SIZE), dtype=np.uint8)
+    for field, offset, size in _TCP:
+        _put(block, offset, size, l4[field])
+    # Headers built from scratch have no data_offset, the codec emits TCP headers without options
+    data_offset = np.where(l4['data_offset'] == 0, 5, l4['data_offset']).astype(np.uint16)
+    _put(block, 12, 2, (data_offset << 12) | ((l4['ecn'].astype(np.uint16) & 0x7) << 6) | (l4['flags'] & 0x3f))
+    if checksums:
+        block[:, _TCP_CHKSUM:_TCP_CHKSUM + 2] = 0
+    _write(out, pos, block)
+
+
+def _put_checksums(out, pos, chksum):
+    out[pos] = chksum >> 8
+    out[pos + 1] = chksum & 0xff
+
+
+def _encode_chunk(out, pkts, offsets, payload, payload_offsets, checksums):
+    valid = pkts['valid']
+    pos = offsets.copy()
+    positions = []
+    for size in _header_sizes(valid):
+        positions.append(pos.copy())
+        pos += size
+    l4_pos, vxlan_pos, inner_l4_pos = positions[2], positions[3], positions[6]
+    end = pos + pkts['payload_len']
+
+    def rows(bit):
+        return np.nonzero(valid & bit)[0]
+
+    for prefix, shift, at in (('', 0, positions[:3]), ('inner_', h.INNER_SHIFT, positions[4:])):
+        eth, ip, l4 = pkts[prefix + 'eth'], pkts[prefix + 'ip'], pkts[prefix + 'l4']
+        present = rows(h.ETHERNET << shift)
+        _encode_ethernet(out, at[0][present], eth[present])
+        present = rows(h.IPV4 << shift)
+        _encode_ipv4(out, at[1][present], ip[present], checksums)
+        present = rows(h.IPV6 << shift)
+        _encode_ipv6(out, at[1][present], ip[present])
+        present = rows(h.UDP << shift)
+        _encode_udp(out, at[2][present], l4[present], checksums)
+        present = rows(h.TCP << shift)
+        _encode_tcp(out, at[2][present], l4[present], checksums)
+        if not shift:
+            present = rows(h.VXLAN)
+            block = np.zeros((len(present), h.VXLAN_HDR_SIZE), dtype=np.uint8)
+            block[:, 0] = pkts['vxlan_flags'][present]
+            _put(block, 4, 3, pkts['vni'][present])
+            _write(out, vxlan_pos[present], block)
+
+    if payload is not None:
+        copy_segments(out, pos, payload, payload_offsets, pkts['payload_len'])
+    if not checksums or not len(pkts):
+        return
+    # The TCP and UDP checksum fields are 0 in out, every segment ends with its frame
+    word_sums = _WordSums(out, int(offsets[0]), int(end[-1]))
+    inner_chksums = np.zeros(len(pkts), dtype=np.uint64)
+    for bit, offset, udp in ((h.INNER_UDP, _UDP_CHKSUM, True), (h.INNER_TCP, _TCP_CHKSUM, False)):
+        present = rows(bit)
+        length = end[present] - inner_l4_pos[present]
+        chksum = _l4_checksum(pkts['inner_ip'][present], word_sums(inner_l4_pos[present], length), length, udp)
+        _put_checksums(out, inner_l4_pos[present] + offset, chksum)
+        inner_chksums[present] = chksum
+    # A VXLAN UDP checksum of 0 is not computed (RFC 7348)
+    udp = np.nonzero(((valid & h.UDP) != 0) & (((valid & h.VXLAN) == 0) | (pkts['l4']['chksum'] != 0)))[0]
+    for present, offset, is_udp in ((udp, _UDP_CHKSUM, True), (rows(h.TCP), _TCP_CHKSUM, False)):
+        length = end[present] - l4_pos[present]
+        # The inner checksums are at an even distance from the outer segment, they add up as they are
+        sums = word_sums(l4_pos[present], length) + inner_chksums[present]
+        _put_checksums(out, l4_pos[present] + offset, _l4_checksum(pkts['ip'][present], sums, length, is_udp))
+
+
+def encode(pkts, payload=None, payload_offsets=None, checksums=True, chunk_size=CHUNK_SIZE):
+    """
+    Build the frames of a batch of packets.
+
+    Parameters:
+        pkts (array): headers of the packets, HEADERS_DTYPE.
+        payload (bytes-like): buffer holding the payloads, e.g. the buffer the packets were decoded
+            from. None for zero payloads.
+        payload_offsets (array): positions of the payloads in payload, as decode() returns them.
+        checksums (bool): compute the IPv4 header checksums and the TCP and UDP checksums, VXLAN UDP
+            checksums of 0 excepted. False keeps the chksum fields of pkts.
+        chunk_size (int): number of packets encoded at once.
+
+    Returns:
+        (buffer, offsets, lengths): uint8 array of the frames and their positions and sizes in it.
+    """
+    lengths = np.sum(_header_sizes(pkts['valid']), axis=0, dtype=np.int64) + pkts['payload_len']
+    offsets = np.cumsum(lengths) - lengths
+    out = np.zeros(int(lengths.sum()), dtype=np.uint8)
+    if payload is not None:
+        payload = np.frombuffer(payload, dtype=np.uint8)
+        payload_offsets = np.asarray(payload_offsets, dtype=np.int64)
+    for start in range(0, len(pkts), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        _encode_chunk(out, pkts[chunk], offsets[chunk], payload,
+                      None if payload is None else payload_offsets[chunk], checksums)
+    return out, offsets, lengths
@@ -0,0 +1,458 @@
+"""
+Connection tracking of dash_conntrack.p4 (PNA_CONNTRACK): the ConntrackIn and ConntrackOut flow
+tables replayed over TCP traces, to predict the flow table occupancy and the connection rate of
+every ENI before running the traffic on a device.
+
+Both tables are keyed by the direction neutral 5-tuple and the ENI: the VM side address and port
+come first whatever the direction of the packet. Every packet looks both tables up. A SYN missing
+ConntrackIn on an outbound packet, or ConntrackOut on an inbound packet, adds an entry with the
+long expire time; a hit restarts the expire timer, and expires the entry at the next tick on a
+FIN or a RST. When a table is full, the least recently used entry is evicted, as the STATEFUL_P4
+tables of the same file specify.
+
+    sim = ConntrackSimulator(SaiConfig.from_file('setup_commands.json'), capacity=1 << 20, timeout=60)
+    report = sim.replay(synthetic_trace([1, 2], cps=10000, duration=10))
+"""
+
+import numpy as np
+
+from . import headers as h
+from .codec import decode
+from .pcap import read_pcap_chunks
+from .pipeline import INBOUND, OUTBOUND, DashTables, take
+
+# A packet of a trace, the fields conntrackIn and conntrackOut look at
+TRACE_DTYPE = np.dtype([('time', 'f8'), ('eni_id', 'u8'), ('direction', 'u1'),
+                        ('src', 'u4'), ('dst', 'u4'), ('proto', 'u1'),
+                        ('sport', 'u2'), ('dport', 'u2'), ('flags', 'u1')])
+
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel (G. Varghese, T. Lauck, "Hashed and hierarchical timing wheels"):
+    level k has 2**bits slots of 2**(bits * k) ticks each, a timer sits in the lowest level its
+    delay fits in and moves down a level each time the time reaches the start of its slot.
+
+    Parameters:
+        levels (int): number of wheels, the timers further than 2**(bits * levels) ticks go
+            around the last wheel several times.
+        bits (int): log2 of the number of slots of a wheel.
+    """
+
+    def __init__(self, levels=4, bits=6):
+        self.levels = levels
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.wheels = [[[] for _ in range(1 << bits)] for _ in range(levels)]
+        self.counts = [0] * levels
+        self.now = 0
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def schedule(self, deadline, item):
+        """ Fire item at tick deadline, at the next tick when deadline is past """
+        deadline = max(deadline, self.now + 1)
+        delay = deadline - self.now
+        level = 0
+        while level < self.levels - 1 and delay >> (self.bits * (level + 1)):
+            level += 1
+        self.wheels[level][(deadline >> (self.bits * level)) & self.mask].append((deadline, item))
+        self.counts[level] += 1
+
+    def advance(self, to):
+        """ Move the time to tick to, returns the (deadline, item) of the timers fired on the way """
+        fired = []
+        while self.now < to:
+            # Jump to the next slot start of the lowest level holding timers
+            level = 0
+            while level < self.levels and not self.counts[level]:
+                level += 1
+            if level == self.levels:
+                self.now = to
+                break
+            if level:
+                start = ((self.now >> (self.bits * level)) + 1) << (self.bits * level)
+                if start > to:
+                    self.now = to
+                    break
+                self.now = start - 1
+            self.now += 1
+            # Move the timers of the slots starting now down, highest level first
+            for level in range(self.levels - 1, 0, -1):
+                if self.now & ((1 << (self.bits * level)) - 1):
+                    continue
+                slot = (self.now >> (self.bits * level)) & self.mask
+                timers = self.wheels[level][slot]
+                if not timers:
+                    continue
+                self.wheels[level][slot] = []
+                self.counts[level] -= len(timers)
+                for deadline, item in timers:
+                    if deadline <= self.now:
+                        fired.append((deadline, item))
+                    else:
+                        self.schedule(deadline, item)
+            slot = self.now & self.mask
+            timers = self.wheels[0][slot]
+            if timers:
+                self.wheels[0][slot] = []
+                self.counts[0] -= len(timers)
+                fired.extend(timers)
+        return fired
+
+    def pop_earliest(self):
+        """ Remove and return the (deadline, item) of the next timer to fire, None when there is none """
+        best = None
+        for level in range(self.levels):
+            if not self.counts[level]:
+                continue
+            current = (self.now >> (self.bits * level)) & self.mask
+            # The last wheel may hold timers of the next turns in any slot
+            last = level == self.levels - 1
+            for offset in range(1 if level == 0 else 0, 1 << self.bits):
+                slot = (current + offset) & self.mask
+                timers = self.wheels[level][slot]
+                if timers:
+                    index = min(range(len(timers)), key=lambda i: timers[i][0])
+                    if best is None or timers[index][0] < best[0][0]:
+                        best = (timers[index], level, slot, index)
+                    if not last:
+                        break
+        if best is None:
+            return None
+        timer, level, slot, index = best
+        del self.wheels[level][slot][index]
+        self.counts[level] -= 1
+        return timer
+
+
+class FlowTable:
+    """
+    Open addressing hash table of the flows of one conntrack table: linear probing, deletion by
+    backward shift, expiry on a TimerWheel and eviction of the least recently used flow when
+    capacity flows are in use.
+
+    Parameters:
+        capacity (int): maximum number of flows.
+        timeout (int): expire time of the flows, EXPIRE_TIME_PROFILE_LONG, in ticks.
+        load_factor (float): maximum ratio of used slots, sizes the table.
+    """
+
+    def __init__(self, capacity, timeout, load_factor=0.75):
+        size = 1
+        while size * load_factor < capacity:
+            size <<= 1
+        self.capacity = capacity
+        self.timeout = timeout
+        self.mask = size - 1
+        self.keys = [None] * size
+        # Flow of every slot: [deadline, id], the id telling a flow from an earlier one of the same key
+        self.flows = [None] * size
+        self.count = 0
+        self.next_id = 0
+        self.wheel = TimerWheel()
+        self.probes = 0
+        self.max_probes = 0
+        self.lookups = 0
+        self.expirations = 0
+        self.evictions = 0
+        # Keys of the flows expired or evicted, for the caller to account them
+        self.removed = []
+
+    def _probe(self, key):
+        """ (slot, probes) of key, the slot as - slot - 1 for the free slot it would go to """
+        slot = hash(key) & self.mask
+        probes = 1
+        keys = self.keys
+        while True:
+            current = keys[slot]
+            if current is None:
+                return -slot - 1, probes
+            if current == key:
+                return slot, probes
+            slot = (slot + 1) & self.mask
+            probes += 1
+
+    def find(self, key):
+        """ Slot of key, or the negative (- slot - 1) of the free slot it would go to """
+        slot, probes = self._probe(key)
+        self.lookups += 1
+        self.probes += probes
+        if probes > self.max_probes:
+            self.max_probes = probes
+        return slot
+
+    def add(self, key, now):
+        """ Insert the flow key, evicting the least recently used flow when the table is full """
+        if self.count >= self.capacity:
+            self.evict()
+        slot = -self._probe(key)[0] - 1
+        self.keys[slot] = key
+        self.flows[slot] = [now + self.timeout, self.next_id]
+        self.wheel.schedule(now + self.timeout, (key, self.next_id))
+        self.next_id += 1
+        self.count += 1
+
+    def touch(self, slot, now, close=False):
+        """ restart_expire_timer of a hit, and EXPIRE_TIME_PROFILE_NOW when close """
+        flow = self.flows[slot]
+        if close:
+            flow[0] = now + 1
+            self.wheel.schedule(now + 1, (self.keys[slot], flow[1]))
+        else:
+            # The timer is moved when it fires
+            flow[0] = now + self.timeout
+
+    def remove(self, slot):
+        """ Free slot, moving back the next keys of its probe sequence """
+        keys, flows, mask = self.keys, self.flows, self.mask
+        self.count -= 1
+        hole = slot
+        slot = (slot + 1) & mask
+        while keys[slot] is not None:
+            home = hash(keys[slot]) & mask
+            # Move the key when its home slot is not in (hole, slot]
+            if (slot - home) & mask >= (slot - hole) & mask:
+                keys[hole], flows[hole] = keys[slot], flows[slot]
+                hole = slot
+            slot = (slot + 1) & mask
+        keys[hole] = flows[hole] = None
+
+    def _live(self, timer):
+        """ Slot of the flow of a timer, None when the flow is gone """
+        key, flow_id = timer
+        slot, _ = self._probe(key)
+        if slot < 0 or self.flows[slot][1] != flow_id:
+            return None
+        return slot
+
+    def advance(self, now):
+        """ Expire the flows whose timer runs out by tick now """
+        for deadline, timer in self.wheel.advance(now):
+            slot = self._live(timer)
+            if slot is None:
+                continue
+            if self.flows[slot][0] > deadline:
+                # Restarted since the timer was set
+                self.wheel.schedule(self.flows[slot][0], timer)
+                continue
+            self.expirations += 1
+            self.removed.append(timer[0])
+            self.remove(slot)
+
+    def evict(self):
+        """ Remove the least recently used flow, the one of the earliest deadline """
+        while True:
+            deadline, timer = self.wheel.pop_earliest()
+            slot = self._live(timer)
+            if slot is None:
+                continue
+            if self.flows[slot][0] > deadline:
+                self.wheel.schedule(self.flows[slot][0], timer)
+                continue
+            self.evictions += 1
+            self.removed.append(timer[0])
+            self.remove(slot)
+            return
+
+
+class ConntrackSimulator:
+    """
+    ConntrackIn and ConntrackOut replayed over a trace, with the flow counts and connection rates
+    of every ENI set side by side with the FLOWS and CPS attributes of the ENI in the config.
+
+    Parameters:
+        config (SaiConfig): configuration of the ENIs, None for no limits.
+        capacity (int): flows of every table.
+        timeout (float): expire time of the flows, seconds.
+        tick (float): resolution of the timers, seconds.
+        interval (float): seconds between two samples of the occupancy in the report.
+    """
+
+    def __init__(self, config=None, capacity=1 << 20, timeout=60.0, tick=0.001, interval=1.0):
+        self.tick = tick
+        self.interval = interval
+        ticks = max(1, int(round(timeout / tick)))
+        self.conntrack_in = FlowTable(capacity, ticks)
+        self.conntrack_out = FlowTable(capacity, ticks)
+        self.limits = {}
+        if config is not None:
+            tables = DashTables(config)
+            for eni_id, flows, cps in zip(tables.eni_ids.tolist(), tables.eni_flows.tolist(), tables.eni_cps.tolist()):
+                self.limits[eni_id] = (flows, cps)
+
+    def replay(self, trace):
+        """
+        Run a trace through the tables, which keep their flows from a replay to the next.
+
+        Parameters:
+            trace (array): packets in time order, TRACE_DTYPE.
+
+        Returns:
+            dict: the report, JSON serializable: totals, the occupancy sampled every interval
+            as [seconds, flows] and the flows and connections per second of every ENI.
+        """
+        tables = (self.conntrack_in, self.conntrack_out)
+        flows, peak_flows, cps, peak_cps = {}, {}, {}, {}
+        total = peak = sum(t.count for t in tables)
+        inserts = hits = closes = 0
+        samples = []
+        second = next_sample = None
+
+        def release(table):
+            nonlocal total
+            for key in table.removed:
+                flows[key[-1]] = flows.get(key[-1], 1) - 1
+            total -= len(table.removed)
+            del table.removed[:]
+
+        start = float(trace['time'][0]) if len(trace) else 0.0
+        for time, eni_id, direction, src, dst, proto, sport, dport, flags in trace.tolist():
+            time -= start
+            now = int(time / self.tick)
+            for table in tables:
+                table.advance(now)
+                release(table)
+            if next_sample is None or time >= next_sample:
+                next_sample = (0.0 if next_sample is None else next_sample) + self.interval
+                samples.append([round(time, 6), total])
+            if int(time) != second:
+                second = int(time)
+                cps = {}
+
+            # The SYN of the VM side adds to ConntrackIn, the one of the remote side to ConntrackOut
+            if direction == OUTBOUND:
+                key = (src, dst, proto, sport, dport, eni_id)
+                adding = self.conntrack_in
+            else:
+                key = (dst, src, proto, dport, sport, eni_id)
+                adding = self.conntrack_out
+            for table in tables:
+                slot = table.find(key)
+                if slot >= 0:
+                    hits += 1
+                    close = (flags & (h.TCP_FIN | h.TCP_RST)) != 0
+                    closes += close
+                    table.touch(slot, now, close)
+                elif table is adding and flags == h.TCP_SYN and proto == h.TCP_PROTO:
+                    table.add(key, now)
+                    release(table)
+                    inserts += 1
+                    total += 1
+                    peak = max(peak, total)
+                    count = flows[eni_id] = flows.get(eni_id, 0) + 1
+                    peak_flows[eni_id] = max(peak_flows.get(eni_id, 0), count)
+                    rate = cps[eni_id] = cps.get(eni_id, 0) + 1
+                    peak_cps[eni_id] = max(peak_cps.get(eni_id, 0), rate)
+
+        duration = float(trace['time'][-1]) - start if len(trace) else 0.0
+        enis = {}
+        for eni_id in sorted(set(peak_flows) | set(self.limits)):
+            flow_limit, cps_limit = self.limits.get(eni_id, (0, 0))
+            enis[str(eni_id)] = {'flows': flows.get(eni_id, 0), 'peak_flows': peak_flows.get(eni_id, 0),
+                                 'flows_limit': flow_limit, 'peak_cps': peak_cps.get(eni_id, 0), 'cps_limit': cps_limit,
+                                 'over_flows': bool(flow_limit) and peak_flows.get(eni_id, 0) > flow_limit,
+                                 'over_cps': bool(cps_limit) and peak_cps.get(eni_id, 0) > cps_limit}
+        lookups = sum(t.lookups for t in tables)
+        return {'packets': len(trace), 'duration_s': round(duration, 6),
+                'flows': total, 'peak_flows': peak, 'inserts': inserts,
+                'insert_rate': round(inserts / duration, 1) if duration else 0.0,
+                'hits': hits, 'closes': closes,
+                'expirations': sum(t.expirations for t in tables), 'evictions': sum(t.evictions for t in tables),
+                'mean_probes': round(sum(t.probes for t in tables) / lookups, 3) if lookups else 0.0,
+                'max_probes': max(t.max_probes for t in tables),
+                'occupancy': samples, 'enis': enis}
+
+
+def synthetic_trace(enis, cps, duration, packets=10, lifetime=1.0, open_ratio=0.0, seed=1):
+    """
+    TCP connections opened by the VMs of the ENIs at random times.
+
+    Parameters:
+        enis (list): eni_id of the ENIs.
+        cps (float): connections per second of every ENI.
+        duration (float): seconds during which connections are opened.
+        packets (int): data packets of a connection besides the SYN, SYN-ACK, FIN and FIN-ACK.
+        lifetime (float): seconds from the SYN to the FIN of a connection.
+        open_ratio (float): share of the connections never closed, left for the timers to expire.
+        seed (int): seed of the random generator.
+
+    Returns:
+        array: the packets in time order, TRACE_DTYPE.
+    """
+    rng = np.random.default_rng(seed)
+    per_eni = int(cps * duration)
+    count = per_eni * len(enis)
+    eni_id = np.repeat(np.array(enis, dtype=np.uint64), per_eni)
+    opened = rng.uniform(0, duration, count)
+    src = (np.uint32(0x0a000000) + rng.integers(0, 1 << 16, count)).astype(np.uint32)
+    dst = (np.uint32(0x0b000000) + rng.integers(0, 1 << 24, count)).astype(np.uint32)
+    sport = rng.integers(1024, 1 << 16, count).astype(np.uint16)
+    dport = rng.choice(np.array([80, 443], dtype=np.uint16), count)
+    closed = rng.random(count) >= open_ratio
+
+    # SYN, SYN-ACK, data spread over the lifetime, then FIN from the VM and FIN-ACK
+    steps = packets + 4
+    offsets = np.concatenate([[0.0, 0.001], np.linspace(0.001, lifetime, packets + 2)[1:-1], [lifetime, lifetime + 0.001]])
+    outbound = np.array([True, False] + [i % 2 == 0 for i in range(packets)] + [True, False])
+    tcp_flags = np.array([h.TCP_SYN, h.TCP_SYN | h.TCP_ACK] + [h.TCP_ACK] * packets
+                         + [h.TCP_FIN | h.TCP_ACK, h.TCP_FIN | h.TCP_ACK], dtype=np.uint8)
+    keep = np.ones((count, steps), dtype=bool)
+    keep[~closed, -2:] = False
+
+    trace = np.zeros((count, steps), dtype=TRACE_DTYPE)
+    trace['time'] = opened[:, None] + offsets
+    trace['eni_id'] = eni_id[:, None]
+    trace['direction'] = np.where(outbound, OUTBOUND, INBOUND)
+    trace['src'] = np.where(outbound, src[:, None], dst[:, None])
+    trace['dst'] = np.where(outbound, dst[:, None], src[:, None])
+    trace['proto'] = h.TCP_PROTO
+    trace['sport'] = np.where(outbound, sport[:, None], dport[:, None])
+    trace['dport'] = np.where(outbound, dport[:, None], sport[:, None])
+    trace['flags'] = tcp_flags
+    trace = trace[keep]
+    return trace[np.argsort(trace['time'], kind='stable')]
+
+
+def pcap_trace(path, config):
+    """
+    The TCP over IPv4 packets of a capture of VXLAN traffic as the device receives it: the direction
+    comes from the VNI (direction_lookup, inbound on a miss) and the ENI from the inner Ethernet
+    source address of outbound packets and destination address of inbound ones. Other packets
+    and those of no ENI are skipped.
+
+    Parameters:
+        path (str): pcap file.
+        config (SaiConfig): configuration of the direction lookup and of the ENI addresses.
+
+    Returns:
+        array: the packets, TRACE_DTYPE.
+    """
+    traces = []
+    tcp = h.IPV4 | h.UDP | h.VXLAN | h.INNER_ETHERNET | h.INNER_IPV4 | h.INNER_TCP
+    for times, buffer, offsets, lengths in read_pcap_chunks(path):
+        pkts, _ = decode(buffer, offsets, lengths)
+        keep = (pkts['valid'] & tcp) == tcp
+        pkts = pkts[keep]
+        chunk = np.zeros(len(pkts), dtype=TRACE_DTYPE)
+        chunk['time'] = times[keep]
+        chunk['src'] = pkts['inner_ip']['src'][:, 1]
+        chunk['dst'] = pkts['inner_ip']['dst'][:, 1]
+        chunk['proto'] = h.TCP_PROTO
+        chunk['sport'] = pkts['inner_l4']['sport']
+        chunk['dport'] = pkts['inner_l4']['dport']
+        chunk['flags'] = pkts['inner_l4']['flags']
+        traces.append((chunk, pkts['vni'], pkts['inner_eth']['src'], pkts['inner_eth']['dst']))
+
+    trace = np.concatenate([chunk for chunk, _, _, _ in traces] or [np.zeros(0, dtype=TRACE_DTYPE)])
+    vnis = np.concatenate([vni for _, vni, _, _ in traces] or [np.zeros(0, dtype=np.uint32)]).astype(np.uint64)
+    smacs = np.concatenate([smac for _, _, smac, _ in traces] or [np.zeros(0, dtype=np.uint64)])
+    dmacs = np.concatenate([dmac for _, _, _, dmac in traces] or [np.zeros(0, dtype=np.uint64)])
+    tables = DashTables(config)
+    row = tables.direction.lookup([vnis])
+    trace['direction'] = np.where(row >= 0, take(tables.direction_values, row), INBOUND)
+    eni_addr = np.where(trace['direction'] == OUTBOUND, smacs, dmacs)
+    row = tables.eni_address.lookup([eni_addr])
+    trace['eni_id'] = take(tables.eni_address_ids, row)
+    return trace[row >= 0]
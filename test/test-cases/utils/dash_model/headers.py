@@ -0,0 +1,117 @@
+"""
+DASH header stack as NumPy structured arrays, one row per packet.
+
+The layout follows headers_t of dash-pipeline/bmv2/dash_headers.p4: outer Ethernet, IPv4 or IPv6,
+UDP or TCP and VXLAN, then the inner Ethernet, IPv4 or IPv6 and UDP or TCP. The `valid` bitmask
+holds the isValid() bit of each header. IP addresses are two uint64 words [high, low] so IPv4 and
+IPv6 share the same columns, an IPv4 address being in the low word like the bit<128> metadata of
+the pipeline.
+"""
+
+import ipaddress
+
+import numpy as np
+
+ETHERNET = 1 << 0
+IPV4 = 1 << 1
+IPV6 = 1 << 2
+UDP = 1 << 3
+TCP = 1 << 4
+VXLAN = 1 << 5
+INNER_ETHERNET = 1 << 6
+INNER_IPV4 = 1 << 7
+INNER_IPV6 = 1 << 8
+INNER_UDP = 1 << 9
+INNER_TCP = 1 << 10
+
+# Shift from an outer header bit to its inner header bit
+INNER_SHIFT = 6
+
+ETHERNET_DTYPE = np.dtype([('dst', 'u8'), ('src', 'u8'), ('type', 'u2')])
+
+# len is the IPv4 total_len or the IPv6 payload_length, proto the protocol or next_header,
+# ttl the ttl or hop_limit and tos the diffserv or traffic_class. frag holds the IPv4 flags and
+# frag_offset, flow_label the IPv6 flow_label.
+IP_DTYPE = np.dtype([('version', 'u1'), ('tos', 'u1'), ('len', 'u2'), ('id', 'u2'), ('frag', 'u2'),
+                     ('ttl', 'u1'), ('proto', 'u1'), ('chksum', 'u2'), ('flow_label', 'u4'),
+                     ('src', 'u8', (2,)), ('dst', 'u8', (2,))])
+
+# len is the UDP length, flags the 6 TCP flags, ecn the 3 TCP ecn bits
+L4_DTYPE = np.dtype([('sport', 'u2'), ('dport', 'u2'), ('len', 'u2'), ('chksum', 'u2'), ('flags', 'u1'),
+                     ('seq', 'u4'), ('ack', 'u4'), ('data_offset', 'u1'), ('ecn', 'u1'), ('window', 'u2'),
+                     ('urgent', 'u2')])
+
+HEADERS_DTYPE = np.dtype([('valid', 'u2'),
+                          ('eth', ETHERNET_DTYPE), ('ip', IP_DTYPE), ('l4', L4_DTYPE),
+                          ('vxlan_flags', 'u1'), ('vni', 'u4'),
+                          ('inner_eth', ETHERNET_DTYPE), ('inner_ip', IP_DTYPE), ('inner_l4', L4_DTYPE),
+                          # Bytes after the last header
+                          ('payload_len', 'u2')])
+
+ETHER_HDR_SIZE = 14
+IPV4_HDR_SIZE = 20
+IPV6_HDR_SIZE = 40
+UDP_HDR_SIZE = 8
+TCP_HDR_SIZE = 20
+VXLAN_HDR_SIZE = 8
+
+IPV4_ETHTYPE = 0x0800
+IPV6_ETHTYPE = 0x86dd
+UDP_PROTO = 17
+TCP_PROTO = 6
+UDP_PORT_VXLAN = 4789
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+
+def zeros(count):
+    return np.zeros(count, dtype=HEADERS_DTYPE)
+
+
+def ip_words(address):
+    """ IP address (str, int or ipaddress object) -> (version, high word, low word) """
+    if not isinstance(address, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+        address = ipaddress.ip_address(address)
+    value = int(address)
+    return address.version, value >> 64, value & 0xffffffffffffffff
+
+
+def ip_from_words(version, high, low):
+    value = (int(high) << 64) | int(low)
+    return ipaddress.IPv4Address(value) if version == 4 else ipaddress.IPv6Address(value)
+
+
+def mac_to_int(mac):
+    return int(str(mac).replace(':', '').replace('-', ''), 16)
+
+
+def int_to_mac(value):
+    return ':'.join('%02x' % ((int(value) >> shift) & 0xff) for shift in range(40, -8, -8))
+
+
+def set_ip(ip, index, address):
+    """ Set src or dst words of an IP column, e.g. set_ip(pkts['ip']['dst'], slice(None), '10.0.0.1') """
+    _, high, low = ip_words(address)
+    ip[index, 0] = high
+    ip[index, 1] = low
+
+
+def ip_header_len(version):
+    """ Vectorized IPv4/IPv6 header size of a version column """
+    return np.where(version == 6, IPV6_HDR_SIZE, IPV4_HDR_SIZE).astype(np.uint16)
+
+
+def ip_packet_len(ip):
+    """ Vectorized size of the IP packets, header included, from an IP column """
+    return np.where(ip['version'] == 6, ip['len'].astype(np.uint32) + IPV6_HDR_SIZE, ip['len']).astype(np.uint16)
+
+
+def frame_len(pkts):
+    """ Vectorized size of the frames on the wire, without FCS """
+    size = np.where(pkts['valid'] & ETHERNET, ETHER_HDR_SIZE, 0).astype(np.uint32)
+    has_ip = (pkts['valid'] & (IPV4 | IPV6)) != 0
+    size += np.where(has_ip, ip_packet_len(pkts['ip']), pkts['payload_len'])
+    return size.astype(np.uint32)
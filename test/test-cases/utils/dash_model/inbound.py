@@ -0,0 +1,144 @@
+"""
+Reference model of the DASH inbound pipeline: VIP, direction lookup, inbound routing, PA
+validation, VXLAN decap, ENI lookup, ACL stages and VXLAN encap towards the VM, as
+dash_pipeline.p4 and dash_inbound.p4 apply them, on batches of packets.
+
+dash_pipeline.p4 looks inbound_routing up before the ENI, while meta.eni_id is still 0, and bmv2
+skips the inbound tests for this reason (Issue #233). The model keys inbound_routing with the ENI
+of the inner Ethernet destination, the ENI the SAI entries and the PTF tests refer to.
+
+    config = SaiConfig.from_file('vnet_inbound_setup_commands.json')
+    model = InboundModel(config)
+    expected, meta = model.process(pkts)
+    forwarded = expected[~meta['dropped']]
+"""
+
+import numpy as np
+
+from . import headers as h
+from . import pipeline as p
+from .records import to_int
+from .tables import ExactIndex, TernaryIndex
+
+INBOUND_VXLAN_DECAP = 0
+INBOUND_VXLAN_DECAP_PA_VALIDATE = 1
+INBOUND_DENY = 2
+
+INBOUND_ACTIONS = {'vxlan_decap': INBOUND_VXLAN_DECAP, 'vxlan_decap_pa_validate': INBOUND_VXLAN_DECAP_PA_VALIDATE,
+                   'deny': INBOUND_DENY}
+
+PA_PERMIT = 0
+PA_DENY = 1
+
+PA_ACTIONS = {'permit': PA_PERMIT, 'deny': PA_DENY}
+
+
+class InboundTables:
+    """
+    Indexes of the inbound_routing_entry and pa_validation_entry tables of a SaiConfig.
+    Entries are referred to by their row, the position of the entry in its config table.
+    """
+
+    def __init__(self, config):
+        routes = list(config['inbound_routing_entry'].values())
+        self.route_names = [r.name for r in routes]
+        self.route_action = np.array([INBOUND_ACTIONS[r.attrs.get('action', 'vxlan_decap')] for r in routes],
+                                     dtype=np.uint8)
+        self.route_src_vnet_id = np.array([to_int(r.attrs.get('src_vnet_id')) for r in routes], dtype=np.uint64)
+        self.routing = TernaryIndex(
+            [np.array([to_int(r.key['eni_id']) for r in routes], dtype=np.uint64),
+             np.array([to_int(r.key['vni']) for r in routes], dtype=np.uint64)],
+            [np.array([p.ip_int(r.key['sip']) for r in routes], dtype=np.uint64)],
+            [np.array([p.ip_int(r.key.get('sip_mask', '255.255.255.255')) for r in routes], dtype=np.uint64)],
+            np.array([to_int(r.key.get('priority')) for r in routes], dtype=np.int64))
+
+        entries = list(config['pa_validation_entry'].values())
+        self.pa_validation_names = [r.name for r in entries]
+        self.pa_validation = ExactIndex([np.array([to_int(r.key['vnet_id']) for r in entries], dtype=np.uint64),
+                                         np.array([p.ip_int(r.key['sip']) for r in entries], dtype=np.uint64)])
+        self.pa_validation_action = np.array([PA_ACTIONS[r.attrs.get('action', 'permit')] for r in entries],
+                                             dtype=np.uint8)
+
+
+class InboundModel:
+    """
+    Expected result of the inbound pipeline for batches of packets.
+
+    Parameters:
+        config (SaiConfig): configuration to model.
+        underlay_dmac, underlay_smac (int): MACs of the appliance table, the outer Ethernet
+            addresses of the packets sent to the VMs. 0 when the appliance table is not configured.
+        chunk_size (int): number of packets processed at once.
+    """
+
+    def __init__(self, config, underlay_dmac=0, underlay_smac=0, chunk_size=8192):
+        self.tables = p.DashTables(config)
+        self.inbound = InboundTables(config)
+        self.underlay_dmac = underlay_dmac
+        self.underlay_smac = underlay_smac
+        self.chunk_size = chunk_size
+
+    def process(self, pkts):
+        """
+        Run a batch of packets through the pipeline.
+
+        Parameters:
+            pkts (array): received packets, HEADERS_DTYPE.
+
+        Returns:
+            (headers, meta): headers of the packets as sent (HEADERS_DTYPE) and their metadata
+            (META_DTYPE). Dropped packets have meta['dropped'] set and the first reason in
+            meta['drop_reason']; the packets sent to the VMs are headers[~meta['dropped']], whose
+            inner headers are the decapsulated frames.
+        """
+        hdrs = pkts.copy()
+        meta = p.new_metadata(len(pkts))
+        for start in range(0, len(pkts), self.chunk_size):
+            self.process_chunk(hdrs[start:start + self.chunk_size], meta[start:start + self.chunk_size])
+        return hdrs, meta
+
+    def process_chunk(self, hdrs, meta):
+        """ Run the packets of hdrs through the pipeline in place """
+        tables = self.tables
+
+        p.apply_vip(tables, hdrs, meta)
+        p.apply_direction(tables, hdrs, meta)
+        inbound = meta['direction'] == p.INBOUND
+        # The model only knows the inbound pipeline
+        p.drop(meta, ~inbound, p.DROP_DIRECTION)
+        action = self.apply_inbound_routing(hdrs, meta, inbound)
+        self.apply_pa_validation(hdrs, meta, inbound & (action == INBOUND_VXLAN_DECAP_PA_VALIDATE))
+        p.vxlan_decap(hdrs, inbound & (action != INBOUND_DENY))
+        p.extract_overlay(hdrs, meta)
+        p.apply_eni(tables, hdrs, meta)
+        p.apply_acl(tables, meta)
+        # The overlay destination MAC is kept, the VM's
+        meta['overlay_dmac'] = hdrs['eth']['dst']
+        p.vxlan_encap(hdrs, inbound, meta, self.underlay_dmac, self.underlay_smac)
+
+    def apply_inbound_routing(self, hdrs, meta, mask):
+        """ inbound_routing on the ENI, the VNI and the outer source IP, returns the action of every packet """
+        tables = self.tables
+        vxlan = (hdrs['valid'] & h.VXLAN) != 0
+        eni_row = tables.eni_address.lookup([np.where(vxlan, hdrs['inner_eth']['dst'], 0)])
+        eni_id = p.take(tables.eni_address_ids, eni_row)
+        vni = np.where(vxlan, hdrs['vni'], 0)
+        sip = np.where((hdrs['valid'] & h.IPV4) != 0, hdrs['ip']['src'][:, 1], 0)
+
+        route = self.inbound.routing.lookup([eni_id, vni], [sip])
+        route = np.where(mask, route, -1)
+        meta['inbound_route'] = route
+        action = p.take(self.inbound.route_action, route, INBOUND_DENY)
+        p.drop(meta, mask & (action == INBOUND_DENY), p.DROP_INBOUND_ROUTING)
+        validate = action == INBOUND_VXLAN_DECAP_PA_VALIDATE
+        meta['vnet_id'] = np.where(validate, p.take(self.inbound.route_src_vnet_id, route), meta['vnet_id'])
+        return action
+
+    def apply_pa_validation(self, hdrs, meta, mask):
+        """ pa_validation of the source VNET and the outer source IP """
+        sip = np.where((hdrs['valid'] & h.IPV4) != 0, hdrs['ip']['src'][:, 1], 0)
+        entry = self.inbound.pa_validation.lookup([meta['vnet_id'], sip])
+        entry = np.where(mask, entry, -1)
+        meta['pa_validation'] = entry
+        permit = p.take(self.inbound.pa_validation_action, entry, PA_DENY) == PA_PERMIT
+        p.drop(meta, mask & ~permit, p.DROP_PA_VALIDATION)
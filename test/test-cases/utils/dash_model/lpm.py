@@ -0,0 +1,299 @@
+"""
+Longest prefix match index of the outbound routing table, keyed like dash_outbound_routing by
+ENI, address family and destination prefix.
+
+IPv4 prefixes of every ENI are in a DIR-24-8 table: a 2^24 entry table indexed by the top 24
+bits of the address, whose entries either hold the route or point to a 256 entry group of the
+low 8 bits for the prefixes longer than /24. A lookup is one or two array reads. The 2^24
+tables are allocated zeroed, so an ENI only uses the memory of the pages its routes touch.
+
+IPv6 prefixes are in a multibit trie with 8-bit strides: every node has 256 entries, each with
+the route of the longest prefix ending in that node (controlled prefix expansion) and a child
+node. A lookup walks one level per byte and keeps the last route seen.
+
+Both support inserting and deleting routes one by one, e.g. to follow create/remove records.
+"""
+
+import numpy as np
+
+V4_TBL24_SIZE = 1 << 24
+GROUP_SIZE = 256
+NODE_SIZE = 256
+V6_LEVELS = 16
+
+MISS = -1
+EMPTY_NODE = 0
+
+# Largest ENI OID mapped to its DIR-24-8 table by an array rather than a search
+MAX_SLOT_TABLE = 1 << 20
+
+
+class _GrowingTable:
+    """ Rows of fixed size stored in a 2D array that doubles when full """
+
+    def __init__(self, row_size, fill, dtype):
+        self.row_size = row_size
+        self.fill = fill
+        self.data = np.full((16, row_size), fill, dtype=dtype)
+        self.count = 0
+
+    def allocate(self):
+        if self.count == len(self.data):
+            grown = np.full((2 * len(self.data), self.row_size), self.fill, dtype=self.data.dtype)
+            grown[:self.count] = self.data
+            self.data = grown
+        self.count += 1
+        return self.count - 1
+
+
+class _Dir24x8:
+    """ DIR-24-8 table of the IPv4 routes of one ENI. Entries are row + 1, 0 for a miss, -(group + 1) for a group """
+
+    def __init__(self):
+        self.tbl24 = np.zeros(V4_TBL24_SIZE, dtype=np.int32)
+        self.len24 = np.zeros(V4_TBL24_SIZE, dtype=np.uint8)
+        self.tbl8 = _GrowingTable(GROUP_SIZE, 0, np.int32)
+        self.len8 = _GrowingTable(GROUP_SIZE, 0, np.uint8)
+
+    def set(self, address, length, value, value_length, owner_length):
+        """ Set the entries of address/length to value, a route of value_length, where they hold
+            a prefix not longer than owner_length """
+        if length <= 24:
+            start = address >> 8
+            end = start + (1 << (24 - length))
+            entries = self.tbl24[start:end]
+            lengths = self.len24[start:end]
+            direct = (entries >= 0) & (lengths <= owner_length)
+            entries[direct] = value
+            lengths[direct] = value_length
+            for group in -entries[entries < 0] - 1:
+                self._set_group(group, 0, GROUP_SIZE, value, value_length, owner_length)
+            return
+
+        index = address >> 8
+        entry = self.tbl24[index]
+        if entry >= 0:
+            # Expand the entry into a group holding its route
+            group = self.tbl8.allocate()
+            self.len8.allocate()
+            self.tbl8.data[group] = entry
+            self.len8.data[group] = self.len24[index]
+            self.tbl24[index] = -(group + 1)
+        else:
+            group = -entry - 1
+        start = address & 0xff
+        self._set_group(group, start, start + (1 << (32 - length)), value, value_length, owner_length)
+
+    def _set_group(self, group, start, end, value, value_length, owner_length):
+        entries = self.tbl8.data[group, start:end]
+        lengths = self.len8.data[group, start:end]
+        update = lengths <= owner_length
+        entries[update] = value
+        lengths[update] = value_length
+
+    def lookup(self, addresses):
+        entries = np.take(self.tbl24, addresses >> 8)
+        groups = np.flatnonzero(entries < 0)
+        if len(groups):
+            index = (-entries[groups] - 1) * GROUP_SIZE + (addresses[groups] & 0xff)
+            entries[groups] = np.take(self.tbl8.data.reshape(-1), index)
+        entries -= 1
+        return entries
+
+
+class _MultibitTrie:
+    """ Multibit trie with 8-bit strides of the IPv6 routes of all ENIs, one root node per ENI.
+        Node 0 is empty and its own child, the lookups of all addresses walk in step without branches. """
+
+    def __init__(self):
+        self.routes = _GrowingTable(NODE_SIZE, MISS, np.int64)
+        self.lengths = _GrowingTable(NODE_SIZE, 0, np.uint8)
+        self.children = _GrowingTable(NODE_SIZE, EMPTY_NODE, np.int64)
+        self.roots = {}
+        self._new_node()
+
+    def _new_node(self):
+        self.routes.allocate()
+        self.lengths.allocate()
+        return self.children.allocate()
+
+    def root(self, eni, create=False):
+        node = self.roots.get(eni, EMPTY_NODE)
+        if node == EMPTY_NODE and create:
+            node = self.roots[eni] = self._new_node()
+        return node
+
+    def set(self, eni, address, length, value, value_length, owner_length):
+        """ Set the entries of address/length to value, a route of value_length, where they hold
+            a prefix not longer than owner_length """
+        node = self.root(eni, create=True)
+        level = max(length - 1, 0) // 8
+        for depth in range(level):
+            byte = (address >> (120 - 8 * depth)) & 0xff
+            child = self.children.data[node, byte]
+            if child == EMPTY_NODE:
+                child = self._new_node()
+                self.children.data[node, byte] = child
+            node = child
+        start = (address >> (120 - 8 * level)) & 0xff
+        end = start + (1 << (8 * (level + 1) - length))
+        routes = self.routes.data[node, start:end]
+        lengths = self.lengths.data[node, start:end]
+        update = lengths <= owner_length
+        # Nodes only hold the routes ending in their byte, the lookup finds shorter ones in the upper levels
+        if level > 0 and value_length <= 8 * level:
+            value, value_length = MISS, 0
+        routes[update] = value
+        lengths[update] = value_length
+
+    def lookup(self, nodes, high, low):
+        result = np.full(len(nodes), MISS, dtype=np.int64)
+        routes = self.routes.data.reshape(-1)
+        children = self.children.data.reshape(-1)
+        for depth in range(V6_LEVELS):
+            if not nodes.any():
+                break
+            word = high if depth < 8 else low
+            shift = np.uint64(56 - 8 * (depth % 8))
+            entry = nodes * NODE_SIZE + ((word >> shift) & np.uint64(0xff)).astype(np.int64)
+            found = np.take(routes, entry)
+            np.copyto(result, found, where=found != MISS)
+            nodes = np.take(children, entry)
+        return result
+
+
+class RouteIndex:
+    """
+    LPM index of routes keyed by ENI, address family and destination prefix, see the module
+    documentation. Routes are referred to by a row number, e.g. their position in the config.
+
+    Parameters:
+        enis (array): ENI OID of every route.
+        is_v6 (array): 1 for IPv6 routes.
+        addresses (array): (n, 2) uint64 [high, low] words of the prefixes, IPv4 in the low word.
+        lengths (array): prefix lengths, 0-32 for IPv4 and 0-128 for IPv6.
+    """
+
+    def __init__(self, enis=(), is_v6=(), addresses=(), lengths=()):
+        # DIR-24-8 table of every ENI with IPv4 routes, in v4_tables[v4_slots[eni]]
+        self.v4_tables = []
+        self.v4_slots = {}
+        self.slot_table = None
+        self.v6 = _MultibitTrie()
+        # {(eni, is_v6): {(length, address): row}} of the stored routes
+        self.prefixes = {}
+        addresses = np.asarray(addresses, dtype=np.uint64).reshape(-1, 2)
+        for row, (eni, v6, words, length) in enumerate(zip(enis, is_v6, addresses, lengths)):
+            self.insert(int(eni), bool(v6), (int(words[0]) << 64) | int(words[1]), int(length), row)
+
+    def __len__(self):
+        return sum(len(routes) for routes in self.prefixes.values())
+
+    @staticmethod
+    def _mask(address, length, v6):
+        bits = 128 if v6 else 32
+        return address & (((1 << bits) - 1) ^ ((1 << (bits - length)) - 1))
+
+    def _covering(self, routes, address, length, v6):
+        """ (row, length) of the longest stored prefix shorter than length holding address """
+        for shorter in range(length - 1, -1, -1):
+            row = routes.get((shorter, self._mask(address, shorter, v6)))
+            if row is not None:
+                return row, shorter
+        return MISS, 0
+
+    def _set(self, eni, v6, address, length, row, row_length, owner_length):
+        if v6:
+            self.v6.set(eni, address, length, row, row_length, owner_length)
+        else:
+            slot = self.v4_slots.get(eni)
+            if slot is None:
+                slot = self.v4_slots[eni] = len(self.v4_tables)
+                self.v4_tables.append(_Dir24x8())
+                self.slot_table = None
+            self.v4_tables[slot].set(address, length, row + 1, row_length, owner_length)
+
+    def insert(self, eni, is_v6, address, length, row):
+        """ Add the route address/length of an ENI, or replace the row of an existing one """
+        v6 = bool(is_v6)
+        address = self._mask(address, length, v6)
+        routes = self.prefixes.setdefault((eni, v6), {})
+        routes[(length, address)] = row
+        self._set(eni, v6, address, length, row, length, length)
+
+    def delete(self, eni, is_v6, address, length):
+        """ Remove the route address/length of an ENI, its addresses go back to the covering route """
+        v6 = bool(is_v6)
+        address = self._mask(address, length, v6)
+        routes = self.prefixes.get((eni, v6), {})
+        if routes.pop((length, address), None) is None:
+            raise KeyError('no route %x/%d for ENI %d' % (address, length, eni))
+        row, row_length = self._covering(routes, address, length, v6)
+        # The entries of the range holding a prefix not longer than the deleted one are the ones it owns
+        self._set(eni, v6, address, length, row, row_length, length)
+
+    def _slots(self, enis):
+        """ Slot of every ENI in v4_tables, len(v4_tables) for the ENIs without IPv4 routes """
+        unknown = len(self.v4_tables)
+        if self.slot_table is None:
+            largest = max(self.v4_slots)
+            if largest < MAX_SLOT_TABLE:
+                # ENI OIDs are small, map them with one array read
+                self.slot_table = np.full(largest + 1, unknown, dtype=np.uint16)
+                for eni, slot in self.v4_slots.items():
+                    self.slot_table[eni] = slot
+            else:
+                self.slot_table = np.array(sorted(self.v4_slots), dtype=np.uint64)
+        if self.slot_table.dtype == np.uint16:
+            size = len(self.slot_table)
+            return np.where(enis < size, self.slot_table[np.minimum(enis, size - 1)], unknown).astype(np.uint16)
+        pos = np.minimum(np.searchsorted(self.slot_table, enis), len(self.slot_table) - 1)
+        slots = np.array([self.v4_slots[int(eni)] for eni in self.slot_table], dtype=np.uint16)[pos]
+        return np.where(self.slot_table[pos] == enis, slots, unknown).astype(np.uint16)
+
+    def _lookup_v4(self, enis, addresses):
+        slots = self._slots(enis)
+        result = np.full(len(enis), MISS, dtype=np.int64)
+        # Group the addresses by ENI, a stable sort of uint16 is a radix sort
+        order = np.argsort(slots, kind='stable')
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(slots, minlength=len(self.v4_tables) + 1))))
+        addresses = addresses[order]
+        for slot, table in enumerate(self.v4_tables):
+            start, end = bounds[slot], bounds[slot + 1]
+            if end > start:
+                result[order[start:end]] = table.lookup(addresses[start:end])
+        return result
+
+    def _v6_roots(self, enis):
+        known = np.array(sorted(self.v6.roots), dtype=np.uint64)
+        nodes = np.array([self.v6.roots[int(eni)] for eni in known], dtype=np.int64)
+        slot = np.minimum(np.searchsorted(known, enis), len(known) - 1)
+        return np.where(known[slot] == enis, nodes[slot], EMPTY_NODE)
+
+    def lookup(self, enis, is_v6, addresses):
+        """
+        Rows of the longest matching routes, -1 where no route matches.
+
+        Parameters:
+            enis (array): ENI OID of every address.
+            is_v6 (array): 1 for IPv6 addresses.
+            addresses (array): (n, 2) uint64 [high, low] words, IPv4 in the low word.
+        """
+        enis = np.asarray(enis, dtype=np.uint64)
+        is_v6 = np.asarray(is_v6).astype(bool)
+        addresses = np.asarray(addresses, dtype=np.uint64).reshape(-1, 2)
+        result = np.full(len(enis), MISS, dtype=np.int64)
+
+        if not is_v6.any():
+            # All IPv4, the common case, without gathering the packets
+            if self.v4_tables:
+                result = self._lookup_v4(enis, addresses[:, 1].astype(np.uint32))
+            return result
+
+        v4 = np.flatnonzero(~is_v6)
+        if len(v4) and self.v4_tables:
+            result[v4] = self._lookup_v4(enis[v4], addresses[v4, 1].astype(np.uint32))
+        v6 = np.flatnonzero(is_v6)
+        if self.v6.roots:
+            result[v6] = self.v6.lookup(self._v6_roots(enis[v6]), addresses[v6, 0], addresses[v6, 1])
+        return result
@@ -0,0 +1,168 @@
+"""
+Reference model of the DASH outbound pipeline: VIP, direction lookup, VXLAN decap, ENI lookup,
+ACL stages, outbound routing, CA to PA mapping, VNET and VXLAN encap, as dash_pipeline.p4 and
+dash_outbound.p4 apply them, on batches of packets.
+
+    config = SaiConfig.from_file('vnet_outbound_setup_commands_simple.json')
+    model = OutboundModel(config)
+    expected, meta = model.process(pkts)
+    forwarded = expected[~meta['dropped']]
+"""
+
+import numpy as np
+
+from . import headers as h
+from . import pipeline as p
+from .lpm import RouteIndex
+from .records import to_bool, to_int
+from .tables import ExactIndex
+
+ROUTE_VNET = 0
+ROUTE_VNET_DIRECT = 1
+ROUTE_DIRECT = 2
+ROUTE_DROP = 3
+
+ROUTE_ACTIONS = {'route_vnet': ROUTE_VNET, 'route_vnet_direct': ROUTE_VNET_DIRECT,
+                 'route_direct': ROUTE_DIRECT, 'drop': ROUTE_DROP}
+
+
+def _ip_columns(addresses):
+    """ IP addresses -> is_v6 column and (n, 2) uint64 [high, low] words """
+    words = [h.ip_words(address) for address in addresses]
+    is_v6 = np.array([version == 6 for version, _, _ in words], dtype=np.uint64)
+    return is_v6, np.array([(high, low) for _, high, low in words], dtype=np.uint64).reshape(-1, 2)
+
+
+def prefix_columns(prefixes):
+    """ 'a.b.c.d/len' prefixes -> is_v6 column, (n, 2) uint64 words and prefix lengths """
+    addresses, lengths = [], []
+    for prefix in prefixes:
+        address, _, length = str(prefix).partition('/')
+        version, _, _ = h.ip_words(address)
+        addresses.append(address)
+        lengths.append(int(length or (32 if version == 4 else 128)))
+    is_v6, words = _ip_columns(addresses)
+    return is_v6, words, np.array(lengths, dtype=np.int64)
+
+
+class OutboundTables:
+    """
+    Indexes of the outbound_routing_entry and outbound_ca_to_pa_entry tables of a SaiConfig.
+    Entries are referred to by their row, the position of the entry in its config table.
+    """
+
+    def __init__(self, config):
+        routes = list(config['outbound_routing_entry'].values())
+        self.route_names = [r.name for r in routes]
+        self.route_action = np.array([ROUTE_ACTIONS[r.attrs.get('action', 'route_vnet')] for r in routes],
+                                     dtype=np.uint8)
+        self.route_dst_vnet_id = np.array([to_int(r.attrs.get('dst_vnet_id')) for r in routes], dtype=np.uint64)
+        overlay_v6, overlay_ip = _ip_columns([r.attrs.get('overlay_ip', '0.0.0.0') for r in routes])
+        self.route_overlay_v6 = overlay_v6.astype(np.uint8)
+        self.route_overlay_ip = overlay_ip
+        route_eni = np.array([to_int(r.key['eni_id']) for r in routes], dtype=np.uint64)
+        route_v6, route_prefix, route_length = prefix_columns([r.key['destination'] for r in routes])
+        self.routing = RouteIndex(route_eni, route_v6, route_prefix, route_length)
+
+        mappings = list(config['outbound_ca_to_pa_entry'].values())
+        self.ca_to_pa_names = [r.name for r in mappings]
+        dip_v6, dip = _ip_columns([r.key['dip'] for r in mappings])
+        self.ca_to_pa = ExactIndex([np.array([to_int(r.key['dst_vnet_id']) for r in mappings], dtype=np.uint64),
+                                    dip_v6, dip[:, 0], dip[:, 1]])
+        self.ca_to_pa_underlay_dip = np.array([p.ip_int(r.attrs.get('underlay_dip', '0.0.0.0')) for r in mappings],
+                                              dtype=np.uint32)
+        self.ca_to_pa_overlay_dmac = np.array([h.mac_to_int(r.attrs.get('overlay_dmac', '0')) for r in mappings],
+                                              dtype=np.uint64)
+        self.ca_to_pa_use_dst_vnet_vni = np.array([to_bool(r.attrs.get('use_dst_vnet_vni', False)) for r in mappings],
+                                                  dtype=bool)
+
+
+class OutboundModel:
+    """
+    Expected result of the outbound pipeline for batches of packets.
+
+    Parameters:
+        config (SaiConfig): configuration to model.
+        underlay_dmac, underlay_smac (int): MACs of the appliance table, the outer Ethernet
+            addresses of the encapsulated packets. 0 when the appliance table is not configured.
+        chunk_size (int): number of packets processed at once.
+    """
+
+    def __init__(self, config, underlay_dmac=0, underlay_smac=0, chunk_size=8192):
+        self.tables = p.DashTables(config)
+        self.outbound = OutboundTables(config)
+        self.underlay_dmac = underlay_dmac
+        self.underlay_smac = underlay_smac
+        self.chunk_size = chunk_size
+
+    def process(self, pkts):
+        """
+        Run a batch of packets through the pipeline.
+
+        Parameters:
+            pkts (array): received packets, HEADERS_DTYPE.
+
+        Returns:
+            (headers, meta): headers of the packets as sent (HEADERS_DTYPE) and their metadata
+            (META_DTYPE). Dropped packets have meta['dropped'] set and the first reason in
+            meta['drop_reason']; the packets sent back to the network are headers[~meta['dropped']].
+        """
+        hdrs = pkts.copy()
+        meta = p.new_metadata(len(pkts))
+        # The header stack is a wide record, work on slices that stay in the CPU caches
+        for start in range(0, len(pkts), self.chunk_size):
+            self.process_chunk(hdrs[start:start + self.chunk_size], meta[start:start + self.chunk_size])
+        return hdrs, meta
+
+    def process_chunk(self, hdrs, meta):
+        """ Run the packets of hdrs through the pipeline in place """
+        tables = self.tables
+
+        p.apply_vip(tables, hdrs, meta)
+        p.apply_direction(tables, hdrs, meta)
+        outbound = meta['direction'] == p.OUTBOUND
+        # The model only knows the outbound pipeline
+        p.drop(meta, ~outbound, p.DROP_DIRECTION)
+        p.vxlan_decap(hdrs, outbound)
+        p.extract_overlay(hdrs, meta)
+        p.apply_eni(tables, hdrs, meta)
+        p.apply_acl(tables, meta)
+        action = self.apply_routing(meta)
+        vnet = (action == ROUTE_VNET) | (action == ROUTE_VNET_DIRECT)
+        self.apply_ca_to_pa(meta, vnet)
+        self.apply_vnet(meta, vnet)
+        p.vxlan_encap(hdrs, vnet, meta, self.underlay_dmac, self.underlay_smac)
+
+    def apply_routing(self, meta):
+        """ outbound routing LPM, returns the action of every packet """
+        out = self.outbound
+        route = out.routing.lookup(meta['eni_id'], meta['is_v6'], meta['dst_ip'])
+        meta['route'] = route
+        action = p.take(out.route_action, route, ROUTE_DROP)
+        p.drop(meta, action == ROUTE_DROP, p.DROP_ROUTING)
+        meta['dst_vnet_id'] = p.take(out.route_dst_vnet_id, route)
+        return action
+
+    def apply_ca_to_pa(self, meta, mask):
+        out = self.outbound
+        # route_vnet_direct looks the overlay IP of the route up instead of the destination
+        direct = p.take(out.route_action, meta['route'], ROUTE_DROP) == ROUTE_VNET_DIRECT
+        is_v6 = np.where(direct, p.take(out.route_overlay_v6, meta['route']), meta['is_v6']).astype(np.uint64)
+        dip = meta['dst_ip'].copy()
+        if direct.any():
+            dip[direct] = out.route_overlay_ip[meta['route'][direct]]
+
+        mapping = out.ca_to_pa.lookup([meta['dst_vnet_id'], is_v6, dip[:, 0], dip[:, 1]])
+        mapping = np.where(mask, mapping, -1)
+        meta['ca_to_pa'] = mapping
+        hit = mapping >= 0
+        p.drop(meta, mask & ~hit, p.DROP_CA_TO_PA)
+        meta['underlay_dip'] = np.where(hit, p.take(out.ca_to_pa_underlay_dip, mapping), meta['underlay_dip'])
+        meta['overlay_dmac'] = np.where(hit, p.take(out.ca_to_pa_overlay_dmac, mapping), meta['overlay_dmac'])
+        use_dst_vnet = hit & p.take(out.ca_to_pa_use_dst_vnet_vni, mapping, False)
+        meta['vnet_id'] = np.where(use_dst_vnet, meta['dst_vnet_id'], meta['vnet_id'])
+
+    def apply_vnet(self, meta, mask):
+        vnet = self.tables.vnet.lookup([meta['vnet_id']])
+        hit = mask & (vnet >= 0)
+        meta['vni'] = np.where(hit, p.take(self.tables.vnet_vni, vnet), meta['vni'])
@@ -0,0 +1,210 @@
+"""
+Classic libpcap capture files (https://www.tcpdump.org/manpages/pcap-savefile.5.html), in either
+byte order and with microsecond or nanosecond timestamps, optionally gzip compressed.
+
+read_pcap() and write_pcap() handle a packet at a time. read_pcap_chunks() and write_pcap_chunks()
+handle batches, a batch being a buffer and the positions and sizes of its frames in the buffer,
+the form codec.decode() and codec.encode() work with.
+"""
+
+import gzip
+import struct
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+MAGIC_MICROSECONDS = 0xa1b2c3d4
+MAGIC_NANOSECONDS = 0xa1b23c4d
+
+LINKTYPE_ETHERNET = 1
+
+_FILE_HEADER_SIZE = 24
+_RECORD_HEADER_SIZE = 16
+
+
+def _open(path, mode):
+    return gzip.open(path, mode) if str(path).endswith('.gz') else open(path, mode)
+
+
+def _parse_header(header, path):
+    """ pcap file header -> (struct byte order, seconds per timestamp fraction) """
+    if len(header) < _FILE_HEADER_SIZE:
+        raise ValueError('%s: not a pcap file' % path)
+    for order in '<>':
+        magic = struct.unpack(order + 'I', header[:4])[0]
+        if magic in (MAGIC_MICROSECONDS, MAGIC_NANOSECONDS):
+            break
+    else:
+        raise ValueError('%s: not a pcap file, pcapng is not supported' % path)
+    linktype = struct.unpack(order + 'I', header[20:24])[0] & 0xffff
+    if linktype != LINKTYPE_ETHERNET:
+        raise ValueError('%s: link type %d, only Ethernet is supported' % (path, linktype))
+    return order, 1e-9 if magic == MAGIC_NANOSECONDS else 1e-6
+
+
+def _file_header(nanoseconds):
+    return struct.pack('<IHHiIII', MAGIC_NANOSECONDS if nanoseconds else MAGIC_MICROSECONDS,
+                       2, 4, 0, 0, 65535, LINKTYPE_ETHERNET)
+
+
+def read_pcap(path):
+    """
+    Iterate over the packets of a capture.
+
+    Parameters:
+        path (str): pcap file, .gz for a compressed one.
+
+    Yields:
+        (time, frame): capture time in seconds and the captured bytes of the Ethernet frame.
+    """
+    with _open(path, 'rb') as f:
+        order, scale = _parse_header(f.read(_FILE_HEADER_SIZE), path)
+        record = struct.Struct(order + 'IIII')
+        while True:
+            data = f.read(_RECORD_HEADER_SIZE)
+            if len(data) < _RECORD_HEADER_SIZE:
+                return
+            seconds, fraction, captured, _ = record.unpack(data)
+            frame = f.read(captured)
+            if len(frame) < captured:
+                return
+            yield seconds + fraction * scale, frame
+
+
+def index_records(buffer, order='<', scale=1e-6, start=0):
+    """
+    Locate the packet records of a buffer holding pcap records, without copying them.
+
+    Parameters:
+        buffer (bytes-like): records, as they follow the file header.
+        order, scale: byte order and timestamp unit of the capture.
+        start (int): position of the first record.
+
+    Returns:
+        (times, offsets, lengths, end): capture times, positions and sizes of the frames in
+        buffer, and the position after the last complete record.
+    """
+    unpack = struct.Struct(order + 'IIII').unpack_from
+    size = len(buffer)
+    seconds, fractions, offsets, lengths = [], [], [], []
+    position = start
+    while position + _RECORD_HEADER_SIZE <= size:
+        second, fraction, captured, _ = unpack(buffer, position)
+        if position + _RECORD_HEADER_SIZE + captured > size:
+            break
+        seconds.append(second)
+        fractions.append(fraction)
+        offsets.append(position + _RECORD_HEADER_SIZE)
+        lengths.append(captured)
+        position += _RECORD_HEADER_SIZE + captured
+    times = np.array(seconds, dtype=np.float64) + np.array(fractions, dtype=np.float64) * scale
+    return times, np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64), position
+
+
+def read_pcap_chunks(path, chunk_bytes=1 << 24):
+    """
+    Iterate over a capture by batches of packets, in bounded memory.
+
+    Parameters:
+        path (str): pcap file, .gz for a compressed one.
+        chunk_bytes (int): size of the reads, a batch holds the records that end in one read.
+
+    Yields:
+        (times, buffer, offsets, lengths): capture times of the packets of the batch, and the
+        positions and sizes of their frames in buffer.
+    """
+    with _open(path, 'rb') as f:
+        order, scale = _parse_header(f.read(_FILE_HEADER_SIZE), path)
+        tail = b''
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                return
+            buffer = tail + data
+            times, offsets, lengths, end = index_records(buffer, order, scale)
+            # A record larger than the reads needs several of them
+            tail = buffer[end:]
+            if len(times):
+                yield times, buffer, offsets, lengths
+
+
+def copy_segments(dst, dst_starts, src, src_starts, lengths, batch_bytes=1 << 22):
+    """ dst[dst_starts[i]:dst_starts[i] + lengths[i]] = src[src_starts[i]:...] for every i, uint8 arrays """
+    dst_starts = np.asarray(dst_starts, dtype=np.int64)
+    src_starts = np.asarray(src_starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    # The segments of the same size are copied as the rows of a 2D view, by batches of about batch_bytes
+    order = np.argsort(lengths, kind='stable')
+    for rows in np.split(order, np.flatnonzero(np.diff(lengths[order])) + 1):
+        size = int(lengths[rows[0]]) if len(rows) else 0
+        if not size:
+            continue
+        dst_rows = sliding_window_view(dst, size, writeable=True)
+        src_rows = sliding_window_view(src, size)
+        step = max(batch_bytes // size, 1)
+        for start in range(0, len(rows), step):
+            batch = rows[start:start + step]
+            dst_rows[dst_starts[batch]] = src_rows[src_starts[batch]]
+
+
+def write_pcap(path, packets, nanoseconds=False):
+    """
+    Write packets to a capture.
+
+    Parameters:
+        path (str): pcap file, .gz for a compressed one.
+        packets (iterable): (time, frame) of every packet, time in seconds.
+        nanoseconds (bool): nanosecond timestamps instead of microsecond ones.
+    """
+    units = 10 ** 9 if nanoseconds else 10 ** 6
+    with _open(path, 'wb') as f:
+        f.write(_file_header(nanoseconds))
+        for time, frame in packets:
+            ticks = int(round(time * units))
+            f.write(struct.pack('<IIII', ticks // units, ticks % units, len(frame), len(frame)))
+            f.write(frame)
+
+
+def pack_records(times, buffer, offsets, lengths, nanoseconds=False):
+    """
+    pcap records of a batch of frames, the file header excluded.
+
+    Parameters:
+        times (array): capture times in seconds.
+        buffer (bytes-like): frames of the batch, at offsets and of lengths in buffer.
+        nanoseconds (bool): nanosecond timestamps instead of microsecond ones.
+
+    Returns:
+        uint8 array of the records.
+    """
+    units = 10 ** 9 if nanoseconds else 10 ** 6
+    lengths = np.asarray(lengths, dtype=np.int64)
+    ticks = np.round(np.asarray(times, dtype=np.float64) * units).astype(np.int64)
+    records = np.empty((len(lengths), 4), dtype='<u4')
+    records[:, 0] = ticks // units
+    records[:, 1] = ticks % units
+    records[:, 2] = lengths
+    records[:, 3] = lengths
+    starts = np.cumsum(lengths + _RECORD_HEADER_SIZE) - lengths - _RECORD_HEADER_SIZE
+    out = np.empty(int(lengths.sum()) + _RECORD_HEADER_SIZE * len(lengths), dtype=np.uint8)
+    if len(lengths):
+        sliding_window_view(out, _RECORD_HEADER_SIZE, writeable=True)[starts] = \
+            records.view(np.uint8).reshape(-1, _RECORD_HEADER_SIZE)
+    copy_segments(out, starts + _RECORD_HEADER_SIZE, np.frombuffer(buffer, dtype=np.uint8), offsets, lengths)
+    return out
+
+
+def write_pcap_chunks(path, chunks, nanoseconds=False):
+    """
+    Write batches of packets to a capture.
+
+    Parameters:
+        path (str): pcap file, .gz for a compressed one.
+        chunks (iterable): (times, buffer, offsets, lengths) of every batch, as read_pcap_chunks
+            yields them or codec.encode() builds them.
+        nanoseconds (bool): nanosecond timestamps instead of microsecond ones.
+    """
+    with _open(path, 'wb') as f:
+        f.write(_file_header(nanoseconds))
+        for times, buffer, offsets, lengths in chunks:
+            f.write(pack_records(times, buffer, offsets, lengths, nanoseconds).data)
@@ -0,0 +1,253 @@
+"""
+Stages of dash_ingress (dash-pipeline/bmv2/dash_pipeline.p4) shared by the outbound and inbound
+models, applied to a batch of packets at once.
+
+Like the P4 program, a packet marked dropped still goes through the next stages; its metadata
+records the first reason it was dropped for.
+"""
+
+import numpy as np
+
+from . import headers as h
+from .acl import ACL_STAGES, AclClassifier
+from .records import to_bool, to_int
+from .tables import ExactIndex
+
+OUTBOUND = 1
+INBOUND = 2
+
+DROP_NONE = 0
+DROP_VIP = 1
+DROP_DIRECTION = 2
+DROP_ENI_ADDRESS = 3
+DROP_ENI = 4
+DROP_ADMIN_STATE = 5
+DROP_ACL_GROUP = 6
+DROP_ACL = 7
+DROP_ROUTING = 8
+DROP_CA_TO_PA = 9
+DROP_INBOUND_ROUTING = 10
+DROP_PA_VALIDATION = 11
+
+DROP_REASONS = ['none', 'vip', 'direction', 'eni_address', 'eni', 'admin_state', 'acl_group', 'acl',
+                'routing', 'ca_to_pa', 'inbound_routing', 'pa_validation']
+
+# metadata_t fields used by the model, plus the rows of the table entries each packet hit (-1 on a miss)
+META_DTYPE = np.dtype([('direction', 'u1'), ('dropped', '?'), ('drop_reason', 'u1'),
+                       ('eni_id', 'u8'), ('eni', 'i8'),
+                       ('is_v6', 'u1'), ('src_ip', 'u8', (2,)), ('dst_ip', 'u8', (2,)),
+                       ('proto', 'u1'), ('sport', 'u2'), ('dport', 'u2'),
+                       ('vnet_id', 'u8'), ('dst_vnet_id', 'u8'),
+                       ('underlay_sip', 'u4'), ('underlay_dip', 'u4'), ('overlay_dmac', 'u8'), ('vni', 'u4'),
+                       ('acl_group', 'u8', (ACL_STAGES,)), ('acl_rule', 'i8', (ACL_STAGES,)),
+                       ('route', 'i8'), ('ca_to_pa', 'i8'), ('inbound_route', 'i8'), ('pa_validation', 'i8')])
+
+ACL_GROUP_ATTRS = {(OUTBOUND, False): 'outbound_v4_stage%d_dash_acl_group_id',
+                   (OUTBOUND, True): 'outbound_v6_stage%d_dash_acl_group_id',
+                   (INBOUND, False): 'inbound_v4_stage%d_dash_acl_group_id',
+                   (INBOUND, True): 'inbound_v6_stage%d_dash_acl_group_id'}
+
+
+def new_metadata(count):
+    meta = np.zeros(count, dtype=META_DTYPE)
+    for field in ('eni', 'acl_rule', 'route', 'ca_to_pa', 'inbound_route', 'pa_validation'):
+        meta[field] = -1
+    return meta
+
+
+def drop(meta, mask, reason):
+    """ Mark the packets of mask dropped, keeping the reason of those already dropped """
+    meta['drop_reason'] = np.where(mask & ~meta['dropped'], reason, meta['drop_reason'])
+    meta['dropped'] |= mask
+
+
+def ip_int(value):
+    _, high, low = h.ip_words(value)
+    return (high << 64) | low
+
+
+def _column(values, dtype=np.uint64):
+    return np.array(values, dtype=dtype)
+
+
+def take(values, rows, default=0):
+    """ values[rows], default where rows is -1 """
+    if len(values) == 0:
+        return np.full(len(rows), default, dtype=values.dtype)
+    return np.where(rows >= 0, values[np.maximum(rows, 0)], default).astype(values.dtype)
+
+
+class DashTables:
+    """
+    Indexes of the direction agnostic DASH tables of a SaiConfig: VIP, direction lookup,
+    ENI ether address map, ENI, ACL group, ACL rules and VNET.
+
+    Parameters:
+        config (SaiConfig): configuration to model.
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+        vips = config['vip_entry'].values()
+        self.vip = ExactIndex([_column([ip_int(r.key['vip']) for r in vips if r.attrs.get('action') == 'accept'])])
+
+        dles = list(config['direction_lookup_entry'].values())
+        self.direction = ExactIndex([_column([to_int(r.key['vni']) for r in dles])])
+        self.direction_values = _column([OUTBOUND if r.attrs.get('action') == 'set_outbound_direction' else INBOUND
+                                         for r in dles], np.uint8)
+
+        eams = list(config['eni_ether_address_map_entry'].values())
+        self.eni_address = ExactIndex([_column([h.mac_to_int(r.key['address']) for r in eams])])
+        self.eni_address_ids = _column([to_int(r.attrs.get('eni_id')) for r in eams])
+
+        enis = list(config['eni'].values())
+        self.eni_names = [r.name for r in enis]
+        self.eni = ExactIndex([_column([r.oid for r in enis])])
+        self.eni_ids = _column([r.oid for r in enis])
+        self.eni_admin_state = _column([to_bool(r.attrs.get('admin_state', False)) for r in enis], bool)
+        self.eni_underlay_dip = _column([ip_int(r.attrs.get('vm_underlay_dip', '0.0.0.0')) for r in enis], np.uint32)
+        self.eni_vm_vni = _column([to_int(r.attrs.get('vm_vni')) for r in enis], np.uint32)
+        self.eni_vnet_id = _column([to_int(r.attrs.get('vnet_id')) for r in enis])
+        self.eni_cps = _column([to_int(r.attrs.get('cps')) for r in enis])
+        self.eni_pps = _column([to_int(r.attrs.get('pps')) for r in enis])
+        self.eni_flows = _column([to_int(r.attrs.get('flows')) for r in enis])
+        self.eni_acl_groups = {}
+        for key, attr in ACL_GROUP_ATTRS.items():
+            self.eni_acl_groups[key] = _column([[to_int(r.attrs.get(attr % stage)) for stage in range(1, ACL_STAGES + 1)]
+                                                for r in enis]).reshape(-1, ACL_STAGES)
+
+        groups = list(config['dash_acl_group'].values())
+        self.acl_group = ExactIndex([_column([r.oid for r in groups])])
+        self.acl_group_v6 = _column([r.attrs.get('ip_addr_family') == 'SAI_IP_ADDR_FAMILY_IPV6' for r in groups], bool)
+        self.acl = AclClassifier(config)
+
+        vnets = list(config['vnet'].values())
+        self.vnet = ExactIndex([_column([r.oid for r in vnets])])
+        self.vnet_vni = _column([to_int(r.attrs.get('vni')) for r in vnets], np.uint32)
+
+
+def apply_vip(tables, hdrs, meta):
+    outer_v4 = (hdrs['valid'] & h.IPV4) != 0
+    vip = np.where(outer_v4, hdrs['ip']['dst'][:, 1], 0)
+    hit = (tables.vip.lookup([vip]) >= 0) & outer_v4
+    meta['underlay_sip'] = np.where(hit, vip, 0)
+    drop(meta, ~hit, DROP_VIP)
+
+
+def apply_direction(tables, hdrs, meta):
+    vni = np.where(hdrs['valid'] & h.VXLAN, hdrs['vni'], 0)
+    row = tables.direction.lookup([vni])
+    meta['direction'] = take(tables.direction_values, row, INBOUND)
+
+
+def _assign(column, value, mask):
+    """ column[mask] = value, value being a scalar or a column of the same batch """
+    if np.ndim(value) and np.ndim(column) > 1:
+        np.copyto(column, value, where=mask[:, None])
+    else:
+        np.copyto(column, value, where=mask.reshape((-1,) + (1,) * (np.ndim(column) - 1)), casting='unsafe')
+
+
+def _move_header(hdrs, dst, src, mask):
+    """ hdrs[dst] = hdrs[src] where mask, leaf field by leaf field """
+    for field in hdrs.dtype[dst].names:
+        _assign(hdrs[dst][field], hdrs[src][field], mask)
+
+
+def _clear_header(hdrs, name, mask):
+    for field in hdrs.dtype[name].names:
+        _assign(hdrs[name][field], 0, mask)
+
+
+def vxlan_decap(hdrs, mask):
+    """ vxlan_decap() of the packets of mask: the inner headers replace the outer ones """
+    if not mask.any():
+        return
+    inner = (hdrs['valid'] >> h.INNER_SHIFT) & (h.ETHERNET | h.IPV4 | h.IPV6 | h.UDP | h.TCP)
+    _assign(hdrs['valid'], inner, mask)
+    for outer in ('eth', 'ip', 'l4'):
+        _move_header(hdrs, outer, 'inner_' + outer, mask)
+        _clear_header(hdrs, 'inner_' + outer, mask)
+    _assign(hdrs['vxlan_flags'], 0, mask)
+    _assign(hdrs['vni'], 0, mask)
+
+
+def vxlan_encap(hdrs, mask, meta, underlay_dmac=0, underlay_smac=0):
+    """ vxlan_encap() of the packets of mask, from the encap data of their metadata """
+    if not mask.any():
+        return
+    has_ip = (hdrs['valid'] & (h.IPV4 | h.IPV6)) != 0
+    inner_ip_len = np.where(has_ip, h.ip_packet_len(hdrs['ip']), 0).astype(np.uint16)
+
+    _assign(hdrs['valid'], (hdrs['valid'] << h.INNER_SHIFT) | h.ETHERNET | h.IPV4 | h.UDP | h.VXLAN, mask)
+    for outer in ('eth', 'ip', 'l4'):
+        _move_header(hdrs, 'inner_' + outer, outer, mask)
+        _clear_header(hdrs, outer, mask)
+    _assign(hdrs['inner_eth']['dst'], meta['overlay_dmac'], mask)
+
+    eth = hdrs['eth']
+    _assign(eth['dst'], underlay_dmac, mask)
+    _assign(eth['src'], underlay_smac, mask)
+    _assign(eth['type'], h.IPV4_ETHTYPE, mask)
+    ip = hdrs['ip']
+    _assign(ip['version'], 4, mask)
+    _assign(ip['len'], inner_ip_len + (h.ETHER_HDR_SIZE + h.IPV4_HDR_SIZE + h.UDP_HDR_SIZE + h.VXLAN_HDR_SIZE), mask)
+    _assign(ip['id'], 1, mask)
+    _assign(ip['ttl'], 64, mask)
+    _assign(ip['proto'], h.UDP_PROTO, mask)
+    _assign(ip['src'][:, 1], meta['underlay_sip'], mask)
+    _assign(ip['dst'][:, 1], meta['underlay_dip'], mask)
+    l4 = hdrs['l4']
+    _assign(l4['dport'], h.UDP_PORT_VXLAN, mask)
+    _assign(l4['len'], inner_ip_len + (h.UDP_HDR_SIZE + h.VXLAN_HDR_SIZE + h.ETHER_HDR_SIZE), mask)
+    _assign(hdrs['vxlan_flags'], 0, mask)
+    _assign(hdrs['vni'], meta['vni'], mask)
+
+
+def extract_overlay(hdrs, meta):
+    """ Overlay IP addresses, protocol and L4 ports of the (decapsulated) packets """
+    valid = hdrs['valid']
+    ip = hdrs['ip']
+    has_ip = (valid & (h.IPV4 | h.IPV6)) != 0
+    meta['is_v6'] = (valid & h.IPV6) != 0
+    meta['proto'] = np.where(has_ip, ip['proto'], 0)
+    meta['src_ip'] = np.where(has_ip[:, None], ip['src'], 0)
+    meta['dst_ip'] = np.where(has_ip[:, None], ip['dst'], 0)
+    has_l4 = (valid & (h.TCP | h.UDP)) != 0
+    meta['sport'] = np.where(has_l4, hdrs['l4']['sport'], 0)
+    meta['dport'] = np.where(has_l4, hdrs['l4']['dport'], 0)
+
+
+def apply_eni(tables, hdrs, meta):
+    """ eni_ether_address_map and eni tables, admin state check """
+    eni_addr = np.where(meta['direction'] == OUTBOUND, hdrs['eth']['src'], hdrs['eth']['dst'])
+    row = tables.eni_address.lookup([eni_addr])
+    drop(meta, row < 0, DROP_ENI_ADDRESS)
+    meta['eni_id'] = take(tables.eni_address_ids, row)
+
+    eni = tables.eni.lookup([meta['eni_id']])
+    hit = eni >= 0
+    drop(meta, ~hit, DROP_ENI)
+    meta['eni'] = eni
+    meta['underlay_dip'] = take(tables.eni_underlay_dip, eni)
+    meta['vni'] = take(tables.eni_vm_vni, eni)
+    meta['vnet_id'] = take(tables.eni_vnet_id, eni)
+    is_v6 = meta['is_v6'] != 0
+    for (direction, v6), groups in tables.eni_acl_groups.items():
+        select = hit & (meta['direction'] == direction) & (is_v6 == v6)
+        meta['acl_group'][select] = groups[eni[select]]
+    drop(meta, ~take(tables.eni_admin_state, eni, False), DROP_ADMIN_STATE)
+
+
+def apply_acl(tables, meta):
+    """ acl_group family check, then the ACL stages of dash_acl.p4 """
+    groups = meta['acl_group']
+    row = tables.acl_group.lookup([groups[:, 0]])
+    mismatch = (row >= 0) & (take(tables.acl_group_v6, row, False) != (meta['is_v6'] != 0))
+    drop(meta, mismatch, DROP_ACL_GROUP)
+
+    denied, rules = tables.acl.classify(groups, meta['src_ip'], meta['dst_ip'], meta['proto'],
+                                        meta['sport'], meta['dport'])
+    meta['acl_rule'] = rules
+    drop(meta, denied, DROP_ACL)
@@ -0,0 +1,269 @@
+"""
+Policing of the ENIs after their CPS, PPS and FLOWS attributes: a token bucket of connections and
+one of packets per ENI, and a budget of concurrent flows, run over a traffic profile to predict the
+connections and packets every ENI accepts and drops, per direction like the eni_meter counters.
+
+The traffic is a fluid: a tick moves the expected number of connections and packets of every row of
+the profile at once, for all the ENIs, so a minute of traffic of tens of ENIs at a millisecond tick
+runs in a few seconds. When an ENI is offered more than a limit allows, the rows of the ENI share what it allows
+in proportion to what they offer. A limit of 0 is no limit, as an ENI created without it.
+
+    policer = EniPolicer(SaiConfig.from_file('setup_commands.json'))
+    report = policer.predict(uniform_profile(policer.eni_ids, pps=100, cps=1000, lifetime=2.0), duration=10)
+    ceiling = policer.ceiling(uniform_profile(policer.eni_ids, pps=100, cps=1000, lifetime=2.0), rate='cps')
+"""
+
+import numpy as np
+
+from .pipeline import INBOUND, OUTBOUND, DashTables
+
+# A row of a traffic profile: flows open from the start and connections opened at a constant
+# rate for lifetime seconds, every one of them sending pps packets per second in direction
+PROFILE_DTYPE = np.dtype([('eni_id', 'u8'), ('direction', 'u1'), ('flows', 'f8'), ('cps', 'f8'),
+                          ('lifetime', 'f8'), ('pps', 'f8')])
+
+# Rates a ceiling is searched for
+RATES = ('cps', 'pps')
+
+
+def uniform_profile(enis, flows=0, cps=0.0, lifetime=1.0, pps=1.0, direction=OUTBOUND):
+    """
+    The same traffic on every ENI.
+
+    Parameters:
+        enis (list): eni_id of the ENIs.
+        flows (float): flows open from the start.
+        cps (float): connections opened per second.
+        lifetime (float): seconds a connection lasts.
+        pps (float): packets per second of every flow.
+        direction (int): OUTBOUND or INBOUND.
+
+    Returns:
+        array: PROFILE_DTYPE, a row per ENI.
+    """
+    profile = np.zeros(len(enis), dtype=PROFILE_DTYPE)
+    profile['eni_id'] = enis
+    profile['direction'] = direction
+    profile['flows'] = flows
+    profile['cps'] = cps
+    profile['lifetime'] = lifetime
+    profile['pps'] = pps
+    return profile
+
+
+def _limit(values):
+    """ Limits as floats, infinite for 0 """
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(values > 0, values, np.inf)
+
+
+def _share(offered, allowed, eni):
+    """ Part of what every row offers its ENI accepts, when the ENI allows less than its rows offer """
+    total = np.bincount(eni, offered, len(allowed))
+    ratio = np.ones(len(allowed))
+    over = total > allowed
+    ratio[over] = allowed[over] / total[over]
+    return offered * ratio[eni]
+
+
+class EniPolicer:
+    """
+    The CPS, PPS and FLOWS limits of the ENIs of a configuration.
+
+    Parameters:
+        config (SaiConfig): configuration of the ENIs.
+        burst (float): seconds of its rate a token bucket holds, full at the start.
+        tick (float): seconds of a step of the model.
+    """
+
+    def __init__(self, config, burst=0.1, tick=0.001):
+        tables = DashTables(config)
+        self.eni_ids = tables.eni_ids.tolist()
+        self.eni_names = tables.eni_names
+        self.eni = tables.eni
+        self.cps = tables.eni_cps.astype(np.float64)
+        self.pps = tables.eni_pps.astype(np.float64)
+        self.flows = tables.eni_flows.astype(np.float64)
+        self.burst = burst
+        self.tick = tick
+
+    def _run(self, profile, duration, cps_scale=None, pps_scale=None):
+        """ Connections and packets of every row offered and accepted over duration, with the rates
+            of the rows of every ENI scaled """
+        rows = len(profile)
+        eni = self.eni.lookup([profile['eni_id']])
+        if (eni < 0).any():
+            raise ValueError(f"No ENI {profile['eni_id'][eni < 0][0]} in the configuration")
+        enis = len(self.eni_ids)
+        cps = profile['cps'] * (1.0 if cps_scale is None else cps_scale[eni])
+        pps = profile['pps'] * (1.0 if pps_scale is None else pps_scale[eni])
+        cps_limit, pps_limit, flow_limit = _limit(self.cps), _limit(self.pps), _limit(self.flows)
+        cps_depth = np.maximum(cps_limit * self.burst, 1.0)
+        pps_depth = np.maximum(pps_limit * self.burst, 1.0)
+        cps_tokens = cps_depth.copy()
+        pps_tokens = pps_depth.copy()
+
+        # Flows open from the start take their place in the budget first, without connection tokens
+        active = _share(profile['flows'].astype(np.float64), flow_limit, eni)
+        ticks = max(1, int(round(duration / self.tick)))
+        life = np.maximum(1, np.round(profile['lifetime'] / self.tick)).astype(np.int64)
+        # Connections ending at every tick to come, a ring of the longest lifetime
+        ring = np.zeros((int(life.max()) + 1, rows))
+        slots = np.arange(rows)
+        totals = {name: np.zeros(rows) for name in ('offered_connections', 'accepted_connections',
+                                                     'offered_packets', 'accepted_packets', 'lost_packets')}
+        peak = np.bincount(eni, active, enis)
+        for step in range(ticks):
+            slot = step % len(ring)
+            active -= ring[slot]
+            ring[slot] = 0.0
+
+            cps_tokens = np.minimum(cps_depth, cps_tokens + cps_limit * self.tick)
+            free = np.maximum(flow_limit - np.bincount(eni, active, enis), 0.0)
+            offered = cps * self.tick
+            accepted = _share(offered, np.minimum(cps_tokens, free), eni)
+            cps_tokens -= np.bincount(eni, accepted, enis)
+            active += accepted
+            ring[(step + life) % len(ring), slots] += accepted
+            totals['offered_connections'] += offered
+            totals['accepted_connections'] += accepted
+            # The packets a dropped connection would have sent, the device has no flow for them
+            totals['lost_packets'] += (offered - accepted) * pps * np.minimum(profile['lifetime'],
+                                                                              (ticks - step) * self.tick)
+
+            pps_tokens = np.minimum(pps_depth, pps_tokens + pps_limit * self.tick)
+            offered = active * pps * self.tick
+            accepted = _share(offered, pps_tokens, eni)
+            pps_tokens -= np.bincount(eni, accepted, enis)
+            totals['offered_packets'] += offered
+            totals['accepted_packets'] += accepted
+            np.maximum(peak, np.bincount(eni, active, enis), out=peak)
+        return eni, totals, peak
+
+    def predict(self, profile, duration):
+        """
+        Connections and packets every ENI accepts and drops.
+
+        Parameters:
+            profile (array): PROFILE_DTYPE traffic.
+            duration (float): seconds of traffic.
+
+        Returns:
+            dict: the report, JSON serializable: totals and, for every ENI, its limits, the
+            connections and packets offered, accepted and dropped, the peak of its flows and the
+            accepted and dropped packets of every direction.
+        """
+        eni, totals, peak = self._run(profile, duration)
+        enis = len(self.eni_ids)
+
+        def per_eni(name, mask=True):
+            return np.bincount(eni, np.where(mask, totals[name], 0.0), enis)
+
+        offered_connections, accepted_connections = per_eni('offered_connections'), per_eni('accepted_connections')
+        offered_packets, accepted_packets = per_eni('offered_packets'), per_eni('accepted_packets')
+        lost_packets = per_eni('lost_packets')
+        report = {}
+        for row, eni_id in enumerate(self.eni_ids):
+            meter = {}
+            for direction, name in ((OUTBOUND, 'outbound'), (INBOUND, 'inbound')):
+                mask = profile['direction'] == direction
+                accepted = per_eni('accepted_packets', mask)[row]
+                dropped = per_eni('offered_packets', mask)[row] - accepted + per_eni('lost_packets', mask)[row]
+                meter[name] = {'accepted': round(accepted), 'dropped': round(dropped)}
+            report[str(eni_id)] = {
+                'name': self.eni_names[row], 'cps_limit': int(self.cps[row]), 'pps_limit': int(self.pps[row]),
+                'flows_limit': int(self.flows[row]),
+                'offered_connections': round(offered_connections[row]),
+                'accepted_connections': round(accepted_connections[row]),
+                'dropped_connections': round(offered_connections[row] - accepted_connections[row]),
+                'peak_flows': round(peak[row]),
+                'offered_packets': round(offered_packets[row] + lost_packets[row]),
+                'accepted_packets': round(accepted_packets[row]),
+                'policed_packets': round(offered_packets[row] - accepted_packets[row]),
+                'flowless_packets': round(lost_packets[row]),
+                'meter': meter}
+        return {'duration_s': duration, 'tick_s': self.tick, 'burst_s': self.burst,
+                'accepted_connections': round(accepted_connections.sum()),
+                'dropped_connections': round(offered_connections.sum() - accepted_connections.sum()),
+                'accepted_packets': round(accepted_packets.sum()),
+                'dropped_packets': round(offered_packets.sum() - accepted_packets.sum() + lost_packets.sum()),
+                'enis': report}
+
+    def ceiling(self, profile, rate='pps', duration=5.0, loss=0.0, tolerance=0.01, limit=1 << 20):
+        """
+        Highest rate of every ENI the model accepts with at most a share of loss, searched the way a
+        test looks for a boundary: the cps (or pps) of the rows of every ENI are scaled by a factor
+        bisected for all the ENIs at once. The bound the limits alone give is set beside it: CPS, or
+        the FLOWS left by the open flows over the lifetime of the connections, and PPS. The full
+        buckets of the start let the ceiling pass the bound by about burst / duration.
+
+        Parameters:
+            profile (array): PROFILE_DTYPE traffic at scale 1.
+            rate (str): 'cps' or 'pps', the rate scaled.
+            duration (float): seconds of traffic of every run.
+            loss (float): share of the connections (or packets) dropped at the ceiling.
+            tolerance (float): relative precision of the factor.
+            limit (float): highest factor tried.
+
+        Returns:
+            dict: for every ENI offered the rate, the factor and the offered rate at the ceiling,
+            averaged over the duration, None when the limits do not bound it, and the bound.
+        """
+        if rate not in RATES:
+            raise ValueError(f"Rate {rate} not in {RATES}")
+        enis = len(self.eni_ids)
+        low = np.zeros(enis)
+        high = np.ones(enis)
+        # Offered rate of the last factor passing
+        offered_rate = np.zeros(enis)
+
+        def passes(scale):
+            eni, totals, _ = self._run(profile, duration, **{rate + '_scale': scale})
+            if rate == 'cps':
+                offered = np.bincount(eni, totals['offered_connections'], enis)
+                accepted = np.bincount(eni, totals['accepted_connections'], enis)
+            else:
+                # The packets of the connections admitted, those of the others are the CPS and FLOWS drops
+                offered = np.bincount(eni, totals['offered_packets'], enis)
+                accepted = np.bincount(eni, totals['accepted_packets'], enis)
+            return accepted >= offered * (1.0 - loss) - 1e-6, offered / duration
+
+        # Double the factor of the ENIs still passing, then bisect between the last pass and the first failure
+        growing = np.ones(enis, dtype=bool)
+        while growing.any():
+            ok, offered = passes(high)
+            raised = growing & ok
+            low[raised] = high[raised]
+            offered_rate[raised] = offered[raised]
+            growing &= ok & (high < limit)
+            high[growing] *= 2
+        while True:
+            open_ = (high - low) > tolerance * np.maximum(low, tolerance)
+            if not open_.any():
+                break
+            middle = np.where(open_, (low + high) / 2, low)
+            ok, offered = passes(middle)
+            raised = open_ & ok
+            low[raised] = middle[raised]
+            offered_rate[raised] = offered[raised]
+            high[open_ & ~ok] = middle[open_ & ~ok]
+
+        eni = self.eni.lookup([profile['eni_id']])
+        cps = np.bincount(eni, profile['cps'], enis)
+        if rate == 'cps':
+            lifetime = np.bincount(eni, profile['cps'] * profile['lifetime'], enis) / np.maximum(cps, 1e-12)
+            flows = np.bincount(eni, profile['flows'], enis)
+            bound = np.minimum(_limit(self.cps), np.maximum(_limit(self.flows) - flows, 0) / np.maximum(lifetime, 1e-12))
+            scaled = cps > 0
+        else:
+            bound = _limit(self.pps)
+            scaled = np.bincount(eni, profile['pps'] * (profile['flows'] + profile['cps']), enis) > 0
+        result = {}
+        for row, eni_id in enumerate(self.eni_ids):
+            if not scaled[row]:
+                continue
+            unbounded = low[row] >= limit
+            result[str(eni_id)] = {'name': self.eni_names[row], 'scale': None if unbounded else round(float(low[row]), 6),
+                                   'ceiling': None if unbounded else round(float(offered_rate[row]), 3),
+                                   'bound': None if np.isinf(bound[row]) else round(float(bound[row]), 3)}
+        return {'rate': rate, 'loss': loss, 'enis': result}
@@ -0,0 +1,155 @@
+"""
+DASH configuration built from SAI command records, the format of the *_setup_commands*.json files
+and of dpugen, e.g.
+
+    {"name": "ore", "op": "create", "type": "SAI_OBJECT_TYPE_OUTBOUND_ROUTING_ENTRY",
+     "key": {"switch_id": "$SWITCH_ID", "eni_id": "$eni", "destination": "10.1.0.0/16"},
+     "attributes": ["SAI_OUTBOUND_ROUTING_ENTRY_ATTR_ACTION", "SAI_OUTBOUND_ROUTING_ENTRY_ACTION_ROUTE_VNET",
+                    "SAI_OUTBOUND_ROUTING_ENTRY_ATTR_DST_VNET_ID", "$vnet"]}
+"""
+
+import gzip
+import json
+from collections import OrderedDict, namedtuple
+
+SWITCH_ID = 0
+
+SaiRecord = namedtuple('SaiRecord', 'name type oid key attrs')
+
+
+def type_name(sai_type):
+    """ 'SAI_OBJECT_TYPE_OUTBOUND_ROUTING_ENTRY' -> 'outbound_routing_entry' """
+    return sai_type[len('SAI_OBJECT_TYPE_'):].lower() if sai_type.startswith('SAI_OBJECT_TYPE_') else sai_type.lower()
+
+
+def attr_name(name, table):
+    """ ('SAI_ENI_ATTR_VM_VNI', 'eni') -> 'vm_vni' """
+    prefix = 'SAI_%s_ATTR_' % table.upper()
+    return name[len(prefix):].lower() if name.startswith(prefix) else name.lower()
+
+
+def enum_value(value, table, attr):
+    """ ('SAI_VIP_ENTRY_ACTION_ACCEPT', 'vip_entry', 'action') -> 'accept' """
+    prefix = 'SAI_%s_%s_' % (table.upper(), attr.upper())
+    return value[len(prefix):].lower() if value.startswith(prefix) else value
+
+
+def read_records(path):
+    """ Iterate the records of a JSON list or NDJSON file, gzip compressed if it ends with .gz """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        if first == '[':
+            yield from json.loads(first + f.read())
+            return
+        line = first + f.readline()
+        while line:
+            if line.strip():
+                yield json.loads(line)
+            line = f.readline()
+
+
+class SaiConfig:
+    """
+    Apply a stream of SAI create/remove records and keep the resulting objects and entries.
+
+    Objects without a key (ENI, VNET, ACL group...) get sequential OIDs from 1 in creation order,
+    like a freshly started libsai, and "$name" references in keys and attributes are replaced by
+    the OID they name. Tables are indexed by the short SAI type name, e.g. 'outbound_routing_entry',
+    and hold SaiRecord(name, type, oid, key, attrs) by record name in creation order. Attribute names
+    are shortened ('SAI_ENI_ATTR_VM_VNI' -> 'vm_vni'), as are the values of enum attributes of the
+    record's own type ('SAI_OUTBOUND_ROUTING_ENTRY_ACTION_ROUTE_VNET' -> 'route_vnet').
+
+    Parameters:
+        records (iterable): SAI records to apply.
+    """
+
+    def __init__(self, records=()):
+        self.tables = {}
+        self.names = {}
+        self.next_oid = 1
+        self.apply(records)
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(read_records(path))
+
+    def table(self, name):
+        return self.tables.get(name, OrderedDict())
+
+    def __getitem__(self, name):
+        return self.table(name)
+
+    def resolve(self, value):
+        if isinstance(value, str) and value.startswith('$'):
+            if value == '$SWITCH_ID':
+                return SWITCH_ID
+            ref = self.names.get(value[1:])
+            if ref is None:
+                raise KeyError('reference to unknown SAI object ' + value)
+            if ref.oid is None:
+                raise KeyError('reference to SAI entry %s, entries have no OID' % value)
+            return ref.oid
+        return value
+
+    def oid_of(self, name):
+        return self.names[name].oid
+
+    def apply(self, records):
+        for record in records:
+            if record['op'] == 'create':
+                self.create(record)
+            elif record['op'] == 'remove':
+                self.remove(record)
+            else:
+                raise ValueError('unsupported SAI op %s of %s' % (record['op'], record.get('name')))
+
+    def create(self, record):
+        name = record['name']
+        if name in self.names:
+            raise ValueError('SAI object %s already exists' % name)
+        table = type_name(record['type'])
+        key = record.get('key')
+        if key is not None:
+            key = {k: self.resolve(v) for k, v in key.items()}
+            oid = None
+        else:
+            oid = self.next_oid
+            self.next_oid += 1
+
+        attrs = OrderedDict()
+        values = record.get('attributes', [])
+        for i in range(0, len(values) - 1, 2):
+            attr = attr_name(values[i], table)
+            value = self.resolve(values[i + 1])
+            if isinstance(value, str):
+                value = enum_value(value, table, attr)
+            attrs[attr] = value
+
+        entry = SaiRecord(name, table, oid, key, attrs)
+        self.tables.setdefault(table, OrderedDict())[name] = entry
+        self.names[name] = entry
+        return entry
+
+    def remove(self, record):
+        name = record['name']
+        entry = self.names.pop(name, None)
+        if entry is None:
+            raise KeyError('SAI object %s does not exist' % name)
+        del self.tables[entry.type][name]
+
+
+def to_bool(value):
+    if isinstance(value, str):
+        return value.lower() in ('true', '1')
+    return bool(value)
+
+
+def to_int(value, default=0):
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return int(value, 0)
+    return int(value)
@@ -0,0 +1,786 @@
+"""
+Coverage driven synthesis of the test traffic of a SAI configuration: the fewest VXLAN packets
+exercising every VIP, direction lookup, ENI ether address map, ENI, ACL rule, outbound routing,
+CA to PA, inbound routing and PA validation entry, and every path through the pipeline (direction,
+address family, routing action and drop reason), packed into templates of fields incremented in
+lockstep, the shape of a traffic generator flow.
+
+Candidate probes are derived from the entries and run through the model, which tells the entries
+every probe really hits. A target missed because the ACL stages stopped its probe (a stage denying
+a route probe, a stage 1 rule stopping a stage 2 rule probe, a rule of higher priority shadowing the
+probe of a rule) is retried on the 5-tuples AclRules.reaching() solves from the rules of the ENI.
+A greedy set cover then keeps the fewest probes hitting every target hit, and the probes differing
+by a constant step are merged into templates.
+
+    synth = FlowSynthesizer(SaiConfig.from_file('vnet_outbound_setup_commands_scale.json'))
+    templates = synth.templates()
+    pkts = packets(expand(templates))
+"""
+
+import collections
+import heapq
+import ipaddress
+
+import numpy as np
+
+from . import headers as h
+from . import pipeline as p
+from .acl import ACL_STAGES
+from .inbound import INBOUND_ACTIONS, INBOUND_VXLAN_DECAP_PA_VALIDATE
+from .outbound import ROUTE_ACTIONS, ROUTE_VNET, prefix_columns
+from .records import to_int
+from .tables import ExactIndex, prefix_masks
+from .verify import DashModel
+
+# Headers set by a probe, an IP address being [high, low] words. Every field is a uint64, so that
+# probes are also the rows of a (n, len(COLUMNS)) matrix.
+PROBE_DTYPE = np.dtype([('vip', 'u8'), ('vni', 'u8'), ('underlay_sip', 'u8'), ('smac', 'u8'), ('dmac', 'u8'),
+                        ('is_v6', 'u8'), ('sip', 'u8', (2,)), ('dip', 'u8', (2,)), ('proto', 'u8'),
+                        ('sport', 'u8'), ('dport', 'u8')])
+
+COLUMNS = ['vip', 'vni', 'underlay_sip', 'smac', 'dmac', 'is_v6', 'sip_high', 'sip_low', 'dip_high', 'dip_low',
+           'proto', 'sport', 'dport']
+
+# A template sends count probes, the i-th being start + i * step
+TEMPLATE_DTYPE = np.dtype([('start', PROBE_DTYPE), ('step', PROBE_DTYPE), ('count', 'i8')])
+
+TARGETS = ['vip_entry', 'direction_lookup_entry', 'eni_ether_address_map_entry', 'eni', 'dash_acl_rule',
+           'outbound_routing_entry', 'outbound_ca_to_pa_entry', 'inbound_routing_entry', 'pa_validation_entry',
+           'path']
+
+# Fields of the probes built without a table entry to follow
+UNDERLAY_SIP = '172.16.1.1'
+OVERLAY_MAC = '02:02:02:02:02:02'
+OVERLAY_SIP = {False: '10.1.1.10', True: 'fd00::1:10'}
+OVERLAY_DIP = {False: '10.1.1.1', True: 'fd00::1:1'}
+SPORT = 1234
+DPORT = 80
+PAYLOAD_LEN = 64
+
+_COLUMN = {name: i for i, name in enumerate(COLUMNS)}
+# Columns a template may increment, an address only in one of its words
+_STEPPED = np.array([name not in ('is_v6', 'proto') for name in COLUMNS])
+_ADDRESSES = [(_COLUMN['sip_high'], _COLUMN['sip_low']), (_COLUMN['dip_high'], _COLUMN['dip_low'])]
+# Columns of the fields of the ACL rules
+_TUPLE_COLUMNS = {'sip': ('sip_high', 'sip_low'), 'dip': ('dip_high', 'dip_low'), 'protocol': ('proto',),
+                  'src_port': ('sport',), 'dst_port': ('dport',)}
+_MAX_ADDRESS = (1 << 128) - 1
+# Only TCP and UDP probes carry ports, the others match the ACL rules on ports 0
+_L4_FIELDS = [{'protocol': [(h.TCP_PROTO, h.TCP_PROTO), (h.UDP_PROTO, h.UDP_PROTO)]},
+              {'src_port': [(0, 0)], 'dst_port': [(0, 0)]}]
+
+_KIND_SHIFT = 40
+_ROW_MASK = (1 << _KIND_SHIFT) - 1
+# Number of permitted sets per attempt kept to retry the targets of an ENI on
+_PERMITTED = 16
+_NO_ACTION = 255
+
+# Stages of each direction in pipeline order, named after the reason of the drops they do
+_STAGES = {p.OUTBOUND: [p.DROP_VIP, p.DROP_DIRECTION, p.DROP_ENI_ADDRESS, p.DROP_ENI, p.DROP_ADMIN_STATE,
+                        p.DROP_ACL_GROUP, p.DROP_ACL, p.DROP_ROUTING, p.DROP_CA_TO_PA],
+           p.INBOUND: [p.DROP_VIP, p.DROP_DIRECTION, p.DROP_INBOUND_ROUTING, p.DROP_PA_VALIDATION,
+                       p.DROP_ENI_ADDRESS, p.DROP_ENI, p.DROP_ADMIN_STATE, p.DROP_ACL_GROUP, p.DROP_ACL]}
+
+
+def _stage_ranks():
+    """ ranks[direction, reason]: position of the stage dropping for reason, after every stage for
+        DROP_NONE and further for the stages the direction does not have """
+    ranks = np.full((max(_STAGES) + 1, len(p.DROP_REASONS)), len(p.DROP_REASONS) + 1, dtype=np.int64)
+    for direction, stages in _STAGES.items():
+        ranks[direction, stages] = np.arange(len(stages))
+        ranks[direction, p.DROP_NONE] = len(p.DROP_REASONS)
+    return ranks
+
+
+_RANKS = _stage_ranks()
+
+
+def _matrix(probes):
+    return np.ascontiguousarray(probes, dtype=PROBE_DTYPE).view(np.uint64).reshape(len(probes), len(COLUMNS))
+
+
+def _probes(matrix):
+    return np.ascontiguousarray(matrix, dtype=np.uint64).view(PROBE_DTYPE).reshape(-1)
+
+
+def _columns(*names):
+    """ Bitmask of columns """
+    return sum(1 << _COLUMN[name] for name in names)
+
+
+def _targets(kind, rows):
+    return (np.int64(TARGETS.index(kind)) << _KIND_SHIFT) | np.asarray(rows, dtype=np.int64)
+
+
+def path_name(path):
+    """ Path target row -> 'outbound/ipv4/route_vnet/none' """
+    path = int(path)
+    direction, reason, action = (path >> 16) & 0xff, (path >> 8) & 0xff, path & 0xff
+    actions = ROUTE_ACTIONS if direction == p.OUTBOUND else INBOUND_ACTIONS
+    action = next((name for name, value in actions.items() if value == action), '-')
+    return '%s/%s/%s/%s' % ('outbound' if direction == p.OUTBOUND else 'inbound', 'ipv6' if path >> 24 else 'ipv4',
+                            action, p.DROP_REASONS[reason])
+
+
+def packets(probes, payload_len=PAYLOAD_LEN):
+    """ VXLAN packets of the probes: IPv4 underlay, inner UDP or TCP after the probe protocol """
+    pkts = h.zeros(len(probes))
+    v6 = probes['is_v6'] != 0
+    proto = probes['proto'].astype(np.uint8)
+    tcp = proto == h.TCP_PROTO
+    udp = proto == h.UDP_PROTO
+    pkts['valid'] = (h.ETHERNET | h.IPV4 | h.UDP | h.VXLAN | h.INNER_ETHERNET | np.where(v6, h.INNER_IPV6, h.INNER_IPV4)
+                     | np.where(tcp, h.INNER_TCP, 0) | np.where(udp, h.INNER_UDP, 0))
+    pkts['eth']['type'] = h.IPV4_ETHTYPE
+    ip = pkts['ip']
+    ip['version'] = 4
+    ip['proto'] = h.UDP_PROTO
+    ip['ttl'] = 64
+    ip['src'][:, 1] = probes['underlay_sip']
+    ip['dst'][:, 1] = probes['vip']
+    pkts['l4']['dport'] = h.UDP_PORT_VXLAN
+    pkts['vni'] = probes['vni']
+
+    pkts['inner_eth']['src'] = probes['smac']
+    pkts['inner_eth']['dst'] = probes['dmac']
+    pkts['inner_eth']['type'] = np.where(v6, h.IPV6_ETHTYPE, h.IPV4_ETHTYPE)
+    l4_len = np.where(tcp, h.TCP_HDR_SIZE, np.where(udp, h.UDP_HDR_SIZE, 0)) + payload_len
+    inner = pkts['inner_ip']
+    inner['version'] = np.where(v6, 6, 4)
+    inner['proto'] = proto
+    inner['ttl'] = 64
+    inner['len'] = np.where(v6, l4_len, l4_len + h.IPV4_HDR_SIZE)
+    inner['src'] = probes['sip']
+    inner['dst'] = probes['dip']
+    inner_l4 = pkts['inner_l4']
+    inner_l4['sport'] = np.where(tcp | udp, probes['sport'], 0)
+    inner_l4['dport'] = np.where(tcp | udp, probes['dport'], 0)
+    inner_l4['len'] = np.where(udp, l4_len, 0)
+    inner_l4['flags'] = np.where(tcp, h.TCP_SYN, 0)
+    inner_l4['data_offset'] = np.where(tcp, h.TCP_HDR_SIZE // 4, 0)
+    pkts['payload_len'] = payload_len
+
+    ip['len'] = h.IPV4_HDR_SIZE + h.UDP_HDR_SIZE + h.VXLAN_HDR_SIZE + h.ETHER_HDR_SIZE + h.ip_packet_len(inner)
+    pkts['l4']['len'] = ip['len'] - h.IPV4_HDR_SIZE
+    return pkts
+
+
+def select(probe, target, count):
+    """
+    Greedy set cover of the targets: the probes alone to hit a target first, then the probe hitting
+    the most targets not hit yet, the first one on a tie.
+
+    Parameters:
+        probe, target (array): probe and target of every hit.
+        count (int): number of probes.
+
+    Returns:
+        sorted indexes of the selected probes.
+    """
+    taken = np.zeros(count, dtype=bool)
+    if len(probe) == 0:
+        return np.flatnonzero(taken)
+    pairs = np.unique(np.stack([np.asarray(probe, dtype=np.int64), np.asarray(target, dtype=np.int64)], axis=1), axis=0)
+    _, target_row = np.unique(pairs[:, 1], return_inverse=True)
+    target_row = target_row.reshape(-1)
+    hits = np.bincount(target_row)
+    taken[pairs[hits[target_row] == 1, 0]] = True
+    covered = np.zeros(len(hits), dtype=bool)
+    covered[target_row[taken[pairs[:, 0]]]] = True
+
+    # Hits of the targets left, by probe
+    left = ~covered[target_row]
+    left_probe, left_target = pairs[left, 0], target_row[left]
+    bounds = np.searchsorted(left_probe, np.arange(count + 1))
+    gains = np.diff(bounds)
+    heap = [(-int(gains[i]), int(i)) for i in np.flatnonzero(gains)]
+    heapq.heapify(heap)
+    while heap:
+        gain, i = heapq.heappop(heap)
+        rows = left_target[bounds[i]:bounds[i + 1]]
+        new = int((~covered[rows]).sum())
+        if new == 0:
+            continue
+        if new < -gain:
+            # Lazy greedy: the gains only decrease, the probe goes back with its current one
+            heapq.heappush(heap, (-new, i))
+            continue
+        taken[i] = True
+        covered[rows] = True
+    return np.flatnonzero(taken)
+
+
+def _lexsort(matrix, columns):
+    """ Order of the rows, sorted by the columns, the most significant first """
+    return np.lexsort([matrix[:, column] for column in reversed(columns)])
+
+
+def _runs(matrix):
+    """ First rows of the runs of rows differing by a constant step, in order """
+    count = len(matrix)
+    if count < 2:
+        return np.arange(count)
+    step = matrix[1:] - matrix[:-1]
+    moved = step != 0
+    # A step increments stepped columns only, without wrapping, and one word of an address
+    ok = moved.any(axis=1) & ~(moved & ~_STEPPED).any(axis=1) & ~(moved & (matrix[1:] < matrix[:-1])).any(axis=1)
+    for high, low in _ADDRESSES:
+        ok &= ~(moved[:, high] & moved[:, low])
+    # Step k continues the run of step k - 1
+    follows = np.zeros(count - 1, dtype=bool)
+    follows[1:] = ok[1:] & ok[:-1] & (step[1:] == step[:-1]).all(axis=1)
+    breaks = np.append(np.flatnonzero(~follows), count - 1)
+
+    starts = []
+    row = 0
+    while row < count:
+        starts.append(row)
+        if row + 1 < count and ok[row]:
+            # The run ends at the first step not following the previous one
+            row = int(breaks[np.searchsorted(breaks, row + 1)]) + 1
+        else:
+            row += 1
+    return np.array(starts, dtype=np.int64)
+
+
+def pack(probes):
+    """
+    Templates of probes: runs of probes differing by a constant step. The probes are sorted on every
+    column that varies, either after all the others or right after the address family and protocol
+    (for columns incremented in lockstep), and the order giving the fewest templates is kept.
+
+    Parameters:
+        probes (array): PROBE_DTYPE probes.
+
+    Returns:
+        TEMPLATE_DTYPE templates.
+    """
+    matrix = np.unique(_matrix(probes), axis=0)
+    templates = np.zeros(0, dtype=TEMPLATE_DTYPE)
+    if len(matrix) == 0:
+        return templates
+    varying = [c for c in range(len(COLUMNS)) if _STEPPED[c] and (matrix[:, c] != matrix[0, c]).any()]
+    fixed = [_COLUMN['is_v6'], _COLUMN['proto']]
+    orders = [np.arange(len(matrix))]
+    for column in varying:
+        others = [c for c in range(len(COLUMNS)) if c != column]
+        orders.append(_lexsort(matrix, others + [column]))
+        orders.append(_lexsort(matrix, fixed + [column] + [c for c in varying if c != column]))
+    best = None
+    for order in orders:
+        starts = _runs(matrix[order])
+        if best is None or len(starts) < len(best[1]):
+            best = (order, starts)
+    order, starts = best
+    matrix = matrix[order]
+    counts = np.diff(np.append(starts, len(matrix)))
+
+    templates = np.zeros(len(starts), dtype=TEMPLATE_DTYPE)
+    templates['start'] = _probes(matrix[starts])
+    steps = np.zeros((len(starts), len(COLUMNS)), dtype=np.uint64)
+    runs = counts > 1
+    steps[runs] = matrix[starts[runs] + 1] - matrix[starts[runs]]
+    templates['step'] = _probes(steps)
+    templates['count'] = counts
+    return templates
+
+
+def expand(templates):
+    """ Probes of the templates, in order """
+    counts = templates['count']
+    template = np.repeat(np.arange(len(templates)), counts)
+    index = np.arange(len(template)) - np.repeat(np.cumsum(counts) - counts, counts)
+    start = _matrix(templates['start'])[template]
+    step = _matrix(templates['step'])[template]
+    return _probes(start + step * index.astype(np.uint64)[:, None])
+
+
+def _address(words, v6):
+    value = (int(words[0]) << 64) | int(words[1]) if np.ndim(words) else int(words)
+    return str(ipaddress.IPv6Address(value) if v6 else ipaddress.IPv4Address(value))
+
+
+def _fields(probe, v6):
+    """ Header fields of a probe, addresses as strings """
+    return {'vip': _address(probe['vip'], False), 'vni': int(probe['vni']),
+            'underlay_sip': _address(probe['underlay_sip'], False),
+            'smac': h.int_to_mac(probe['smac']), 'dmac': h.int_to_mac(probe['dmac']),
+            'sip': _address(probe['sip'], v6), 'dip': _address(probe['dip'], v6),
+            'sport': int(probe['sport']), 'dport': int(probe['dport'])}
+
+
+def template_dicts(templates):
+    """
+    JSON friendly templates: the headers of the first packet, addresses as strings, and the step of
+    the incremented ones, e.g.
+
+        {'count': 64, 'is_v6': False, 'proto': 17, 'vip': '221.0.0.2', 'vni': 5000, 'underlay_sip': '172.16.1.1',
+         'smac': '00:1a:c5:00:00:01', 'dmac': '02:02:02:02:02:02', 'sip': '10.1.1.10', 'dip': '1.128.0.1',
+         'sport': 1234, 'dport': 80, 'steps': {'dip': '0.0.0.1'}}
+    """
+    result = []
+    for template in templates:
+        start, step = template['start'], template['step']
+        v6 = bool(start['is_v6'])
+        item = {'count': int(template['count']), 'is_v6': v6, 'proto': int(start['proto'])}
+        item.update(_fields(start, v6))
+        steps = _fields(step, v6)
+        item['steps'] = {name: value for name, value in steps.items() if np.any(step[name] != 0)}
+        result.append(item)
+    return result
+
+
+class FlowSynthesizer:
+    """
+    The probes of a configuration, their coverage of its entries and paths, and the templates of the
+    probes selected to cover them.
+
+    Parameters:
+        config (SaiConfig): configuration to cover.
+        drops (bool): also cover the paths dropping packets. Without, only the probes the pipeline
+            forwards count, e.g. for tests expecting every packet sent back.
+        attempts (int): number of 5-tuples a target missed by its probe is retried on.
+        chunk_size (int): number of packets run through the model at once.
+    """
+
+    def __init__(self, config, drops=True, attempts=4, chunk_size=8192):
+        self.config = config
+        self.drops = drops
+        self.attempts = attempts
+        self.model = DashModel(config, chunk_size=chunk_size)
+        self.tables = self.model.outbound.tables
+        self.outbound = self.model.outbound.outbound
+        self.inbound = self.model.inbound.inbound
+        self.names = {kind: list(config[kind]) for kind in TARGETS[:-1]}
+        # The model only indexes the accepted VIPs
+        self.vips = np.array([p.ip_int(r.key['vip']) for r in config['vip_entry'].values()], dtype=np.uint64)
+        self.vip_index = ExactIndex([self.vips])
+        self.eni_macs = {}
+        for record in config['eni_ether_address_map_entry'].values():
+            self.eni_macs.setdefault(to_int(record.attrs.get('eni_id')), h.mac_to_int(record.key['address']))
+        self.result = None
+
+    def _base(self, direction, count, macs, v6=False):
+        """ Probes of one direction to the ENIs of macs """
+        matrix = np.zeros((count, len(COLUMNS)), dtype=np.uint64)
+        vips = [r for r in self.config['vip_entry'].values() if r.attrs.get('action') == 'accept']
+        vip = p.ip_int(vips[0].key['vip']) if vips else 0
+        matrix[:, _COLUMN['vip']] = vip if vip >> 32 == 0 else 0
+        matrix[:, _COLUMN['vni']] = self._vni(direction)
+        matrix[:, _COLUMN['underlay_sip']] = p.ip_int(UNDERLAY_SIP)
+        matrix[:, _COLUMN['smac' if direction == p.OUTBOUND else 'dmac']] = macs
+        matrix[:, _COLUMN['dmac' if direction == p.OUTBOUND else 'smac']] = h.mac_to_int(OVERLAY_MAC)
+        v6 = np.broadcast_to(np.asarray(v6, dtype=bool), (count,))
+        matrix[:, _COLUMN['is_v6']] = v6
+        for name, defaults in (('sip', OVERLAY_SIP), ('dip', OVERLAY_DIP)):
+            for family in (False, True):
+                _, high, low = h.ip_words(defaults[family])
+                matrix[v6 == family, _COLUMN[name + '_high']] = high
+                matrix[v6 == family, _COLUMN[name + '_low']] = low
+        matrix[:, _COLUMN['proto']] = h.UDP_PROTO
+        matrix[:, _COLUMN['sport']] = SPORT
+        matrix[:, _COLUMN['dport']] = DPORT
+        return matrix
+
+    def _vni(self, direction):
+        """ VNI of the probes of a direction: of its first direction lookup entry, else one missing the
+            table for the inbound probes """
+        action = 'set_outbound_direction' if direction == p.OUTBOUND else 'set_inbound_direction'
+        dles = list(self.config['direction_lookup_entry'].values())
+        vni = next((to_int(r.key['vni']) for r in dles if r.attrs.get('action') == action), None)
+        if vni is None and direction == p.INBOUND:
+            vni = max([to_int(r.key['vni']) for r in dles], default=0) + 1
+        return vni
+
+    def candidates(self):
+        """
+        Probes derived from the table entries.
+
+        Returns:
+            (probes, intent, fixed): (n, len(COLUMNS)) probe matrix, the target every probe is built
+            for (-1 for none) and the bitmask of the columns this target sets.
+        """
+        chunks = []
+
+        def add(matrix, intent=-1, fixed=0):
+            count = len(matrix)
+            chunks.append((matrix, np.broadcast_to(np.asarray(intent, dtype=np.int64), (count,)),
+                           np.broadcast_to(np.asarray(fixed, dtype=np.int64), (count,))))
+
+        outbound = self._vni(p.OUTBOUND) is not None
+        eams = list(self.config['eni_ether_address_map_entry'].values())
+        macs = np.array([h.mac_to_int(r.key['address']) for r in eams], dtype=np.uint64)
+        if outbound:
+            add(self._base(p.OUTBOUND, len(macs), macs))
+        add(self._base(p.INBOUND, len(macs), macs))
+
+        # Destinations of the ENIs, for the ACL rules without a DIP
+        destinations = {}
+        if outbound:
+            self._route_candidates(add, destinations)
+        self._acl_candidates(add, destinations, outbound)
+        self._inbound_candidates(add)
+        return tuple(np.concatenate([chunk[i] for chunk in chunks]) for i in range(3))
+
+    def _route_candidates(self, add, destinations):
+        """ Probes to the first and last address of every outbound route, to every CA to PA entry
+            reachable through a route_vnet route """
+        routes = list(self.config['outbound_routing_entry'].values())
+        route_eni = np.array([to_int(r.key['eni_id']) for r in routes], dtype=np.uint64)
+        v6, first, length = prefix_columns([r.key['destination'] for r in routes])
+        high, low = prefix_masks(length + np.where(v6 != 0, 0, 96))
+        last = first | np.stack([~high, ~low], axis=1)
+        known = np.array([int(eni) in self.eni_macs for eni in route_eni], dtype=bool)
+        rows = np.flatnonzero(known)
+        macs = np.array([self.eni_macs.get(int(eni), 0) for eni in route_eni], dtype=np.uint64)
+        for row in rows[::-1]:
+            destinations[(int(route_eni[row]), bool(v6[row]))] = first[row]
+
+        dip = _columns('dip_high', 'dip_low')
+        matrix = self._base(p.OUTBOUND, len(rows), macs[rows], v6[rows] != 0)
+        matrix[:, [_COLUMN['dip_high'], _COLUMN['dip_low']]] = first[rows]
+        add(matrix, _targets('outbound_routing_entry', rows), dip)
+        partial = rows[(first[rows] != last[rows]).any(axis=1)]
+        matrix = self._base(p.OUTBOUND, len(partial), macs[partial], v6[partial] != 0)
+        matrix[:, [_COLUMN['dip_high'], _COLUMN['dip_low']]] = last[partial]
+        add(matrix)
+
+        # CA to PA entries, each one through the first ENI routing its address to its VNET
+        mappings = list(self.config['outbound_ca_to_pa_entry'].values())
+        ca_vnet = np.array([to_int(r.key['dst_vnet_id']) for r in mappings], dtype=np.uint64)
+        ca_v6, ca_dip, _ = prefix_columns([r.key['dip'] for r in mappings])
+        pending = np.ones(len(mappings), dtype=bool)
+        action = self.outbound.route_action
+        for eni in np.unique(route_eni[rows]).tolist():
+            vnets = self.outbound.route_dst_vnet_id[(route_eni == eni) & (action == ROUTE_VNET)]
+            candidates = np.flatnonzero(pending & np.isin(ca_vnet, vnets))
+            if len(candidates) == 0:
+                continue
+            route = self.outbound.routing.lookup(np.full(len(candidates), eni, dtype=np.uint64), ca_v6[candidates],
+                                                 ca_dip[candidates])
+            hit = (route >= 0) & (p.take(action, route, _NO_ACTION) == ROUTE_VNET)
+            hit &= p.take(self.outbound.route_dst_vnet_id, route) == ca_vnet[candidates]
+            found = candidates[hit]
+            pending[found] = False
+            matrix = self._base(p.OUTBOUND, len(found), self.eni_macs[eni], ca_v6[found] != 0)
+            matrix[:, [_COLUMN['dip_high'], _COLUMN['dip_low']]] = ca_dip[found]
+            add(matrix, _targets('outbound_ca_to_pa_entry', found), dip)
+
+    def _acl_candidates(self, add, destinations, outbound):
+        """ Probes matching every ACL rule, through the first ENI using its group """
+        users = {}
+        directions = [p.OUTBOUND, p.INBOUND] if outbound else [p.INBOUND]
+        for direction in directions:
+            for v6 in (False, True):
+                groups = self.tables.eni_acl_groups[(direction, v6)]
+                for row, eni in enumerate(self.tables.eni_ids.tolist()):
+                    if eni not in self.eni_macs:
+                        continue
+                    for stage in range(ACL_STAGES):
+                        users.setdefault(int(groups[row, stage]), (eni, direction, v6, stage))
+
+        rules = self.tables.acl.rules
+        for direction in directions:
+            for v6 in (False, True):
+                rows = [row for row, rule in enumerate(rules)
+                        if users.get(rule.group, (0, 0, None))[1:3] == (direction, v6)]
+                if not rows:
+                    continue
+                macs = np.array([self.eni_macs[users[rules[row].group][0]] for row in rows], dtype=np.uint64)
+                matrix = self._base(direction, len(rows), macs, v6)
+                fixed = np.zeros(len(rows), dtype=np.int64)
+                for i, row in enumerate(rows):
+                    rule = rules[row]
+                    eni = users[rule.group][0]
+                    if len(rule.dips[1]):
+                        matrix[i, [_COLUMN['dip_high'], _COLUMN['dip_low']]] = rule.dips[0][0]
+                        fixed[i] |= _columns('dip_high', 'dip_low')
+                    elif direction == p.OUTBOUND and (eni, v6) in destinations:
+                        matrix[i, [_COLUMN['dip_high'], _COLUMN['dip_low']]] = destinations[(eni, v6)]
+                    if len(rule.sips[1]):
+                        matrix[i, [_COLUMN['sip_high'], _COLUMN['sip_low']]] = rule.sips[0][0]
+                        fixed[i] |= _columns('sip_high', 'sip_low')
+                    if len(rule.protocols):
+                        protocols = rule.protocols.tolist()
+                        matrix[i, _COLUMN['proto']] = next((v for v in (h.UDP_PROTO, h.TCP_PROTO) if v in protocols),
+                                                           protocols[0])
+                        fixed[i] |= _columns('proto')
+                    if len(rule.src_ports):
+                        matrix[i, _COLUMN['sport']] = rule.src_ports[0, 0]
+                        fixed[i] |= _columns('sport')
+                    if len(rule.dst_ports):
+                        matrix[i, _COLUMN['dport']] = rule.dst_ports[0, 0]
+                        fixed[i] |= _columns('dport')
+                add(matrix, _targets('dash_acl_rule', rows), fixed)
+
+    def _inbound_candidates(self, add):
+        """ Probes from the first and last address of every inbound route, from every PA validation
+            entry through a route validating its VNET """
+        routes = list(self.config['inbound_routing_entry'].values())
+        route_eni = [to_int(r.key['eni_id']) for r in routes]
+        rows = np.array([row for row, eni in enumerate(route_eni) if eni in self.eni_macs], dtype=np.int64)
+        if len(rows) == 0:
+            return
+        macs = np.array([self.eni_macs[route_eni[row]] for row in rows], dtype=np.uint64)
+        vni = np.array([to_int(routes[row].key['vni']) for row in rows], dtype=np.uint64)
+        sip = np.array([p.ip_int(routes[row].key['sip']) for row in rows], dtype=np.uint64)
+        mask = np.array([p.ip_int(routes[row].key.get('sip_mask', '255.255.255.255')) for row in rows],
+                        dtype=np.uint64)
+        first = sip & mask
+        last = first | (~mask & np.uint64(0xffffffff))
+        fixed = _columns('vni', 'underlay_sip')
+
+        matrix = self._base(p.INBOUND, len(rows), macs)
+        matrix[:, _COLUMN['vni']] = vni
+        matrix[:, _COLUMN['underlay_sip']] = first
+        add(matrix, _targets('inbound_routing_entry', rows), fixed)
+        partial = first != last
+        matrix = matrix[partial].copy()
+        matrix[:, _COLUMN['underlay_sip']] = last[partial]
+        add(matrix)
+
+        # PA validation entries, through the first route validating the VNET of the entry for its address
+        validating = {}
+        action = self.inbound.route_action[rows]
+        src_vnet = self.inbound.route_src_vnet_id[rows]
+        for i in np.flatnonzero(action == INBOUND_VXLAN_DECAP_PA_VALIDATE).tolist():
+            validating.setdefault(int(src_vnet[i]), {}).setdefault(int(mask[i]), {}).setdefault(int(first[i]), i)
+        entries = list(self.config['pa_validation_entry'].values())
+        found = []
+        for row, entry in enumerate(entries):
+            address = p.ip_int(entry.key['sip'])
+            for route_mask, firsts in validating.get(to_int(entry.key['vnet_id']), {}).items():
+                i = firsts.get(address & route_mask)
+                if i is not None:
+                    found.append((row, i, address))
+                    break
+        if found:
+            pa_rows, route, address = (np.array(column, dtype=np.uint64) for column in zip(*found))
+            matrix = self._base(p.INBOUND, len(found), macs[route.astype(np.int64)])
+            matrix[:, _COLUMN['vni']] = vni[route.astype(np.int64)]
+            matrix[:, _COLUMN['underlay_sip']] = address
+            add(matrix, _targets('pa_validation_entry', pa_rows.astype(np.int64)), fixed)
+
+    def cover(self, probes):
+        """
+        Targets hit by probes, an entry counting as hit when the probe went through its stage.
+
+        Parameters:
+            probes (array): PROBE_DTYPE probes.
+
+        Returns:
+            (probe, target, meta): probe and target of every hit, and the metadata of the probes.
+        """
+        _, meta = self.model.process(packets(probes))
+        direction = meta['direction'].astype(np.int64)
+        tables = self.tables
+        found = []
+
+        def hit(kind, rows, mask):
+            index = np.flatnonzero(mask & (rows >= 0))
+            found.append((index, _targets(kind, rows[index])))
+
+        hit('vip_entry', self.vip_index.lookup([probes['vip']]), _reached(meta, p.DROP_VIP))
+        hit('direction_lookup_entry', tables.direction.lookup([probes['vni']]), _reached(meta, p.DROP_DIRECTION))
+        eni_address = np.where(direction == p.OUTBOUND, probes['smac'], probes['dmac'])
+        hit('eni_ether_address_map_entry', tables.eni_address.lookup([eni_address]),
+            _reached(meta, p.DROP_ENI_ADDRESS))
+        hit('eni', meta['eni'], _reached(meta, p.DROP_ENI))
+        for stage in range(ACL_STAGES):
+            hit('dash_acl_rule', meta['acl_rule'][:, stage], _reached(meta, p.DROP_ACL))
+        routed = _reached(meta, p.DROP_ROUTING)
+        hit('outbound_routing_entry', meta['route'], routed)
+        hit('outbound_ca_to_pa_entry', meta['ca_to_pa'], _reached(meta, p.DROP_CA_TO_PA))
+        inbound_routed = _reached(meta, p.DROP_INBOUND_ROUTING)
+        hit('inbound_routing_entry', meta['inbound_route'], inbound_routed)
+        hit('pa_validation_entry', meta['pa_validation'], _reached(meta, p.DROP_PA_VALIDATION))
+
+        action = np.full(len(probes), _NO_ACTION, dtype=np.int64)
+        action[routed] = p.take(self.outbound.route_action, meta['route'], _NO_ACTION)[routed]
+        action[inbound_routed] = p.take(self.inbound.route_action, meta['inbound_route'], _NO_ACTION)[inbound_routed]
+        path = ((meta['is_v6'].astype(np.int64) << 24) | (direction << 16)
+                | (meta['drop_reason'].astype(np.int64) << 8) | action)
+        found.append((np.arange(len(probes)), _targets('path', path)))
+
+        probe = np.concatenate([index for index, _ in found])
+        target = np.concatenate([targets for _, targets in found])
+        if not self.drops:
+            forwarded = ~meta['dropped'][probe]
+            probe, target = probe[forwarded], target[forwarded]
+        return probe, target, meta
+
+    def _reaching(self, groups, fields, rule=None, through=None, count=None):
+        """ AclRules.reaching() sets of TCP or UDP tuples, else of other protocols on ports 0 """
+        for l4 in _L4_FIELDS:
+            found = self.tables.acl.reaching(groups, {**fields, **l4}, rule, through, count or self.attempts)
+            if found:
+                return found
+        return []
+
+    def _retries(self, probes, intent, fixed, target, meta):
+        """ Probes of the route, CA to PA and ACL rule targets their probe missed, on 5-tuples going
+            through the ACL stages of the ENI (AclRules.reaching()) with the values the target fixes.
+            The sets permitted to an ENI and family are solved once, and kept with the last ones solved
+            for fixed values, before solving for the values of a target """
+        kinds = [TARGETS.index(kind) for kind in ('dash_acl_rule', 'outbound_routing_entry', 'outbound_ca_to_pa_entry')]
+        missed = np.flatnonzero((intent >= 0) & np.isin(intent >> _KIND_SHIFT, kinds) & ~np.isin(intent, target))
+        permitted = {}
+        result = []
+        for row in missed.tolist():
+            groups = meta['acl_group'][row].tolist()
+            if not any(groups):
+                continue
+            v6 = bool(probes[row, _COLUMN['is_v6']])
+            family = [(0, _MAX_ADDRESS if v6 else 0xffffffff)]
+            fields = {'sip': family, 'dip': family}
+            values = {field: _tuple_value(probes[row], columns) for field, columns in _TUPLE_COLUMNS.items()}
+            through = {field: values[field] for field, columns in _TUPLE_COLUMNS.items()
+                       if fixed[row] & _columns(*columns)}
+            if intent[row] >> _KIND_SHIFT == kinds[0]:
+                # The rule fixes the values of its own fields, any of its tuples not taken before will do
+                found = self._reaching(groups, fields, int(intent[row] & _ROW_MASK))
+            else:
+                key = (tuple(groups), v6)
+                if key not in permitted:
+                    size = _PERMITTED * self.attempts
+                    permitted[key] = collections.deque(self._reaching(groups, fields, count=size), size)
+                if not permitted[key]:
+                    continue
+                found = [intervals for intervals in permitted[key]
+                         if all(_pick(intervals[field], [value]) == value for field, value in through.items())]
+                found = found[:self.attempts]
+                if not found:
+                    # Neighbour targets mostly share the sets solved for the last ones
+                    found = self._reaching(groups, fields, through=through)
+                    permitted[key].extendleft(found)
+            for intervals in found:
+                matrix = probes[row].copy()
+                for field, columns in _TUPLE_COLUMNS.items():
+                    preferred = [values[field]] + ([h.UDP_PROTO, h.TCP_PROTO] if field == 'protocol' else [])
+                    value = _pick(intervals[field], preferred)
+                    for shift, column in zip((64, 0) if len(columns) == 2 else (0,), columns):
+                        matrix[_COLUMN[column]] = (value >> shift) & 0xffffffffffffffff
+                result.append(matrix)
+        return np.array(result, dtype=np.uint64).reshape(-1, len(COLUMNS))
+
+    def _path_probes(self, probes, target, meta):
+        """ Probes of the VIPs and direction lookup entries not hit yet, and of the paths of a missing
+            VIP, ENI address, outbound route and inbound route, from forwarded probes """
+        result = []
+        direction = meta['direction']
+        forwarded = ~meta['dropped']
+        donors = {d: np.flatnonzero(forwarded & (direction == d))[:1] for d in (p.OUTBOUND, p.INBOUND)}
+        donor_rows = np.concatenate(list(donors.values()))
+
+        def variants(rows, column, values):
+            matrix = np.repeat(probes[rows], len(values), axis=0)
+            matrix[:, _COLUMN[column]] = np.tile(np.asarray(values, dtype=np.uint64), len(rows))
+            result.append(matrix)
+
+        vips = self.vips[~np.isin(_targets('vip_entry', np.arange(len(self.vips))), target)]
+        variants(donor_rows, 'vip', vips[vips >> np.uint64(32) == 0])
+        variants(donor_rows, 'vip', [_missing(self.vips, 1 << 32)])
+        dles = list(self.config['direction_lookup_entry'].values())
+        for row in np.flatnonzero(~np.isin(_targets('direction_lookup_entry', np.arange(len(dles))), target)):
+            outbound = dles[row].attrs.get('action') == 'set_outbound_direction'
+            variants(donors[p.OUTBOUND if outbound else p.INBOUND], 'vni', [to_int(dles[row].key['vni'])])
+        eni_macs = np.array([h.mac_to_int(r.key['address']) for r in self.config['eni_ether_address_map_entry'].values()],
+                            dtype=np.uint64)
+        variants(donors[p.OUTBOUND], 'smac', [_missing(eni_macs, 1 << 48)])
+        variants(donors[p.INBOUND], 'dmac', [_missing(eni_macs, 1 << 48)])
+        variants(donors[p.INBOUND], 'underlay_sip', [0, 0xffffffff])
+
+        # Lowest and highest address of the family, missing the routes of an ENI without a default route
+        routed = np.flatnonzero(_reached(meta, p.DROP_ROUTING))
+        _, first = np.unique(meta['eni'][routed] * 2 + meta['is_v6'][routed], return_index=True)
+        routed = routed[first]
+        v6 = probes[routed, _COLUMN['is_v6']] != 0
+        for highest in (False, True):
+            matrix = probes[routed].copy()
+            matrix[:, _COLUMN['dip_high']] = np.where(v6 & highest, 0xffffffffffffffff, 0)
+            matrix[:, _COLUMN['dip_low']] = np.where(highest, np.where(v6, 0xffffffffffffffff, 0xffffffff), 0)
+            result.append(matrix)
+        return np.concatenate(result)
+
+    def run(self):
+        """
+        Candidates, retries, coverage and selection.
+
+        Returns:
+            (probes, probe, target, selected): probe matrix, probe and target of every hit, and the
+            rows of the selected probes.
+        """
+        probes, intent, fixed = self.candidates()
+        hit_probe, target, meta = self.cover(_probes(probes))
+        extra = np.concatenate([self._retries(probes, intent, fixed, target, meta),
+                                self._path_probes(probes, target, meta)])
+        if len(extra):
+            extra_probe, extra_target, _ = self.cover(_probes(extra))
+            hit_probe = np.concatenate([hit_probe, extra_probe + len(probes)])
+            target = np.concatenate([target, extra_target])
+            probes = np.concatenate([probes, extra])
+        selected = select(hit_probe, target, len(probes))
+        self.result = (probes, hit_probe, target, selected)
+        return self.result
+
+    def templates(self):
+        """ TEMPLATE_DTYPE templates of the selected probes """
+        if self.result is None:
+            self.run()
+        probes, _, _, selected = self.result
+        return pack(_probes(probes[selected]))
+
+    def report(self, max_names=20):
+        """
+        Coverage of the last run, JSON friendly: entries and hit entries of every table, the names of
+        the entries not hit (max_names per table), the paths hit, and the number of candidate and
+        selected probes.
+        """
+        if self.result is None:
+            self.run()
+        probes, hit_probe, target, selected = self.result
+        kinds = target >> _KIND_SHIFT
+        rows = target & _ROW_MASK
+        report = {'tables': {}, 'missed': {}}
+        for kind, name in enumerate(TARGETS[:-1]):
+            hit = np.unique(rows[kinds == kind])
+            entries = len(self.names[name])
+            report['tables'][name] = {'entries': entries, 'hit': len(hit)}
+            missed = np.setdiff1d(np.arange(entries), hit)
+            if len(missed):
+                report['missed'][name] = [self.names[name][row] for row in missed[:max_names].tolist()]
+        report['paths'] = [path_name(path) for path in np.unique(rows[kinds == TARGETS.index('path')]).tolist()]
+        report['candidates'] = len(probes)
+        report['probes'] = len(selected)
+        return report
+
+
+def _reached(meta, reason):
+    """ Packets that went through the stage dropping for reason, dropped there or further or not dropped """
+    direction = meta['direction'].astype(np.int64)
+    return _RANKS[direction, meta['drop_reason']] >= _RANKS[direction, reason]
+
+
+def _tuple_value(probe, columns):
+    """ Value of a 5-tuple field of a probe row, an address being two columns """
+    value = 0
+    for column in columns:
+        value = (value << 64) | int(probe[_COLUMN[column]])
+    return value
+
+
+def _pick(intervals, preferred):
+    """ The first preferred value in the intervals, else the lowest one """
+    for value in preferred:
+        if any(first <= value <= last for first, last in intervals):
+            return value
+    return min(first for first, _ in intervals)
+
+
+def _missing(values, limit):
+    """ A value lower than limit missing from values, next to the highest ones """
+    present = set(np.asarray(values).tolist())
+    value = (max(present) + 1) % limit if present else 1
+    while value in present:
+        value = (value + 1) % limit
+    return value
@@ -0,0 +1,195 @@
+"""
+Batch match engines of the model's P4 tables. Keys are columns of uint64 values, an IPv4 or IPv6
+address being two columns (high and low word), and a lookup returns the matching row of every
+packet or -1 on a miss.
+"""
+
+import numpy as np
+
+_MULTIPLIER = np.uint64(0x9e3779b97f4a7c15)
+_FINALIZER = np.uint64(0xbf58476d1ce4e5b9)
+
+
+def hash_columns(columns, seed=0):
+    """ 64-bit hash of every row of a list of uint64 columns """
+    h = np.full(len(columns[0]), np.uint64(seed) * _MULTIPLIER + np.uint64(1), dtype=np.uint64)
+    for column in columns:
+        h ^= np.asarray(column, dtype=np.uint64)
+        h *= _MULTIPLIER
+        h ^= h >> np.uint64(31)
+    h *= _FINALIZER
+    h ^= h >> np.uint64(29)
+    return h
+
+
+def as_columns(columns):
+    return [np.ascontiguousarray(column, dtype=np.uint64) for column in columns]
+
+
+class ExactIndex:
+    """
+    Exact match over rows of uint64 key columns: the keys are hashed, sorted by hash, and a batch
+    lookup is a binary search of the hashes followed by a compare of the key columns.
+
+    Parameters:
+        columns (list): uint64 arrays of equal length, one per key field.
+    """
+
+    def __init__(self, columns):
+        self.columns = as_columns(columns)
+        self.size = len(self.columns[0]) if self.columns else 0
+        self.seed = 0
+        while True:
+            if self.size == 0:
+                self.hashes = np.zeros(0, dtype=np.uint64)
+                self.rows = np.zeros(0, dtype=np.int64)
+                break
+            hashes = hash_columns(self.columns, self.seed)
+            self.rows = np.argsort(hashes, kind='stable')
+            self.hashes = hashes[self.rows]
+            same = np.flatnonzero(self.hashes[1:] == self.hashes[:-1])
+            if not self._has_collision(same):
+                break
+            # Two different keys share a hash, rehash with another seed
+            self.seed += 1
+        self.sorted_columns = [column[self.rows] for column in self.columns]
+
+    def _has_collision(self, same):
+        if len(same) == 0:
+            return False
+        first, second = self.rows[same], self.rows[same + 1]
+        equal = np.ones(len(same), dtype=bool)
+        for column in self.columns:
+            equal &= column[first] == column[second]
+        if not equal.all():
+            return True
+        raise ValueError('duplicate key at rows %d and %d' % (first[0], second[0]))
+
+    def __len__(self):
+        return self.size
+
+    def lookup(self, columns):
+        """ Rows of the keys, -1 for the keys not in the index """
+        columns = as_columns(columns)
+        count = len(columns[0])
+        if self.size == 0:
+            return np.full(count, -1, dtype=np.int64)
+        hashes = hash_columns(columns, self.seed)
+        pos = np.searchsorted(self.hashes, hashes)
+        np.minimum(pos, self.size - 1, out=pos)
+        hit = self.hashes[pos] == hashes
+        for key, column in zip(self.sorted_columns, columns):
+            hit &= key[pos] == column
+        return np.where(hit, self.rows[pos], -1)
+
+
+# (high, low) words of the 128-bit prefix masks, indexed by prefix length
+_MASKS_HIGH = np.array([((1 << 128) - (1 << (128 - length))) >> 64 for length in range(129)], dtype=np.uint64)
+_MASKS_LOW = np.array([((1 << 128) - (1 << (128 - length))) & 0xffffffffffffffff for length in range(129)],
+                      dtype=np.uint64)
+
+
+def prefix_masks(length):
+    """ (high, low) uint64 masks of 128-bit prefixes of the given lengths """
+    return _MASKS_HIGH[length], _MASKS_LOW[length]
+
+
+class PrefixIndex:
+    """
+    Longest prefix match of 128-bit addresses, qualified by exact match columns (e.g. ENI and
+    address family like the outbound routing table). One ExactIndex per prefix length, probed
+    from the longest length down.
+
+    Parameters:
+        exact (list): uint64 arrays of the exact match fields of every prefix.
+        addresses (array): (n, 2) uint64 [high, low] words of the prefixes. IPv4 in the low word.
+        lengths (array): 128-bit prefix lengths, i.e. 96 + length for IPv4.
+    """
+
+    def __init__(self, exact, addresses, lengths):
+        self.exact = as_columns(exact)
+        addresses = np.asarray(addresses, dtype=np.uint64).reshape(-1, 2)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        high, low = prefix_masks(lengths)
+        self.levels = []
+        for length in np.unique(lengths)[::-1]:
+            rows = np.flatnonzero(lengths == length)
+            keys = [column[rows] for column in self.exact]
+            keys += [addresses[rows, 0] & high[rows], addresses[rows, 1] & low[rows]]
+            self.levels.append((int(length), rows, ExactIndex(keys)))
+
+    def lookup(self, exact, addresses):
+        """ Rows of the longest matching prefixes, -1 when no prefix matches """
+        exact = as_columns(exact)
+        addresses = np.asarray(addresses, dtype=np.uint64).reshape(-1, 2)
+        result = np.full(len(addresses), -1, dtype=np.int64)
+        pending = np.arange(len(addresses))
+        for length, rows, index in self.levels:
+            if len(pending) == 0:
+                break
+            high, low = prefix_masks(length)
+            keys = [column[pending] for column in exact]
+            keys += [addresses[pending, 0] & high, addresses[pending, 1] & low]
+            found = index.lookup(keys)
+            hit = found >= 0
+            result[pending[hit]] = rows[found[hit]]
+            pending = pending[~hit]
+        return result
+
+
+class TernaryIndex:
+    """
+    Ternary match with priorities, qualified by exact match columns (e.g. ENI and VNI like the
+    inbound routing table), by tuple space search: entries are grouped by mask, each group an
+    ExactIndex of the masked keys. Groups are probed by decreasing highest priority, a packet
+    leaving the search once its best match outranks the groups left. The highest priority wins,
+    the first entry between equal priorities.
+
+    Parameters:
+        exact (list): uint64 arrays of the exact match fields of every entry.
+        values, masks (list): uint64 arrays of the value and the mask of every ternary field.
+        priorities (array): priorities of the entries.
+    """
+
+    def __init__(self, exact, values, masks, priorities):
+        self.exact = as_columns(exact)
+        values, masks = as_columns(values), as_columns(masks)
+        self.priorities = np.asarray(priorities, dtype=np.int64)
+        mask_rows = np.stack(masks, axis=1) if masks else np.zeros((len(self.priorities), 0), dtype=np.uint64)
+        self.groups = []
+        unique_masks, group = np.unique(mask_rows, axis=0, return_inverse=True)
+        group = group.reshape(-1)
+        for i, group_masks in enumerate(unique_masks):
+            rows = np.flatnonzero(group == i)
+            # Highest priority first, so that the entries shadowed by an entry of the same key drop out
+            rows = rows[np.argsort(-self.priorities[rows], kind='stable')]
+            keys = [column[rows] for column in self.exact]
+            keys += [value[rows] & mask for value, mask in zip(values, group_masks)]
+            _, first = np.unique(np.stack(keys, axis=1), axis=0, return_index=True)
+            rows = rows[np.sort(first)]
+            keys = [key[np.sort(first)] for key in keys]
+            self.groups.append((int(self.priorities[rows[0]]), group_masks, rows, ExactIndex(keys)))
+        self.groups.sort(key=lambda g: -g[0])
+
+    def lookup(self, exact, values):
+        """ Rows of the highest priority matching entries, -1 when no entry matches """
+        exact, values = as_columns(exact), as_columns(values)
+        count = len(exact[0]) if exact else len(values[0])
+        result = np.full(count, -1, dtype=np.int64)
+        best = np.full(count, np.iinfo(np.int64).min, dtype=np.int64)
+        pending = np.arange(count)
+        for priority, masks, rows, index in self.groups:
+            # Packets whose match may still be outranked, or tied by an earlier entry
+            pending = pending[best[pending] <= priority]
+            if len(pending) == 0:
+                break
+            keys = [column[pending] for column in exact]
+            keys += [value[pending] & mask for value, mask in zip(values, masks)]
+            found = index.lookup(keys)
+            hit = found >= 0
+            row = rows[np.maximum(found, 0)]
+            better = hit & ((self.priorities[row] > best[pending])
+                            | ((self.priorities[row] == best[pending]) & (row < result[pending])))
+            result[pending[better]] = row[better]
+            best[pending[better]] = self.priorities[row[better]]
+        return result
@@ -0,0 +1,390 @@
+"""
+Differential verification of captures against the model: the frames the traffic generator sent are
+run through the model of the SAI configuration, and every frame the device sent back is matched to
+its expected frame.
+
+Frames are compared on their headers, once the fields the model does not predict (IGNORED_FIELDS)
+are masked. A received frame whose masked headers equal those of a pending expected frame matches
+it. One that does not is a mismatch when an expected frame of the same flow (the 5-tuple of the
+innermost IP header) is pending, the two are paired and their differing fields reported, and an
+extra frame otherwise. Expected frames that are still pending a window after they were sent are
+missed. The captures are read by chunks and only the expected frames of the window are kept, so
+the memory does not grow with the size of the captures, only with the number of flows.
+
+    config = SaiConfig.from_file('setup_commands.json')
+    verifier = PcapVerifier(DashModel(config))
+    report = verifier.run(read_pcap_chunks('sent.pcap'), read_pcap_chunks('received.pcap'))
+
+or, from test/test-cases/utils:
+
+    python -m dash_model.verify --config setup_commands.json --sent sent.pcap --received received.pcap
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from . import headers as h
+from .codec import decode
+from .inbound import InboundModel
+from .outbound import OutboundModel
+from .pcap import read_pcap_chunks
+from .pipeline import DROP_REASONS, INBOUND
+from .records import SaiConfig
+
+# Fields the model does not predict: the underlay MACs of the device, the outer IPv4 fields and
+# checksums it leaves at 0, the entropy of the VXLAN UDP source port and the VXLAN flags
+IGNORED_FIELDS = ['eth.dst', 'eth.src', 'ip.id', 'ip.frag', 'ip.ttl', 'ip.chksum', 'l4.sport', 'l4.chksum',
+                  'vxlan_flags']
+
+# Headers cleared when their valid bit is not set, so stale fields do not take part in the comparison
+_HEADER_BITS = {'eth': h.ETHERNET, 'ip': h.IPV4 | h.IPV6, 'l4': h.UDP | h.TCP,
+                'inner_eth': h.INNER_ETHERNET, 'inner_ip': h.INNER_IPV4 | h.INNER_IPV6,
+                'inner_l4': h.INNER_UDP | h.INNER_TCP, 'vxlan_flags': h.VXLAN, 'vni': h.VXLAN}
+
+# The 5-tuple of the innermost IP header, the flows of the report
+FLOW_DTYPE = np.dtype([('src', 'u8', (2,)), ('dst', 'u8', (2,)), ('proto', 'u1'), ('sport', 'u2'), ('dport', 'u2'),
+                       ('version', 'u1')])
+
+# Counters of a flow in the report
+_COUNTERS = ['expected', 'matched', 'mismatched', 'missed', 'extra']
+EXPECTED, MATCHED, MISMATCHED, MISSED, EXTRA = range(len(_COUNTERS))
+
+
+def _leaf_fields(dtype, prefix=''):
+    """ 'header.field' names of the leaf fields of a structured dtype """
+    names = []
+    for name in dtype.names:
+        if dtype[name].names:
+            names += _leaf_fields(dtype[name], prefix + name + '.')
+        else:
+            names.append(prefix + name)
+    return names
+
+
+FIELDS = _leaf_fields(h.HEADERS_DTYPE)
+
+
+def _column(pkts, field):
+    for name in field.split('.'):
+        pkts = pkts[name]
+    return pkts
+
+
+def hash_rows(rows):
+    """ 64 bits hash of the bytes of every row of a structured array """
+    raw = np.ascontiguousarray(rows).view(np.uint8).reshape(len(rows), rows.dtype.itemsize)
+    if raw.shape[1] % 8:
+        raw = np.concatenate([raw, np.zeros((len(rows), 8 - raw.shape[1] % 8), dtype=np.uint8)], axis=1)
+    words = raw.view('<u8')
+    # FNV-1a on 64 bits words, then a final avalanche
+    hashes = np.full(len(rows), 0xcbf29ce484222325, dtype=np.uint64)
+    for column in range(words.shape[1]):
+        hashes ^= words[:, column]
+        hashes *= np.uint64(0x100000001b3)
+    hashes ^= hashes >> np.uint64(33)
+    hashes *= np.uint64(0xff51afd7ed558ccd)
+    return hashes ^ (hashes >> np.uint64(33))
+
+
+def flows(pkts):
+    """ 5-tuples of the innermost IP and TCP or UDP headers of the packets, FLOW_DTYPE """
+    tuples = np.zeros(len(pkts), dtype=FLOW_DTYPE)
+    vxlan = (pkts['valid'] & h.VXLAN) != 0
+    for field in ('src', 'dst', 'proto', 'version'):
+        tuples[field] = pkts['ip'][field]
+        tuples[field][vxlan] = pkts['inner_ip'][field][vxlan]
+    for field in ('sport', 'dport'):
+        tuples[field] = np.where(vxlan, pkts['inner_l4'][field], pkts['l4'][field])
+    return tuples
+
+
+def pair(pending, keys):
+    """
+    Pair keys with equal pending keys, every pending key being paired once at most, in order: the
+    first keys of a value are paired with the first pending keys of the value.
+
+    Returns:
+        array: row of the pending key paired with every key, -1 for the keys left alone.
+    """
+    pending_order = np.argsort(pending, kind='stable')
+    pending_sorted = pending[pending_order]
+    order = np.argsort(keys, kind='stable')
+    keys_sorted = keys[order]
+    # Rank of every key among the keys of the same value, the rank-th pending key of the value is its pair
+    rank = np.arange(len(keys)) - np.searchsorted(keys_sorted, keys_sorted, side='left')
+    position = np.searchsorted(pending_sorted, keys_sorted, side='left') + rank
+    hit = position < len(pending_sorted)
+    hit[hit] = pending_sorted[position[hit]] == keys_sorted[hit]
+    rows = np.full(len(keys), -1, dtype=np.int64)
+    rows[order[hit]] = pending_order[position[hit]]
+    return rows
+
+
+class DashModel:
+    """
+    The outbound and the inbound model of a config, every packet going through the model of its
+    direction. Parameters are those of OutboundModel and InboundModel.
+    """
+
+    def __init__(self, config, underlay_dmac=0, underlay_smac=0, chunk_size=8192):
+        self.outbound = OutboundModel(config, underlay_dmac, underlay_smac, chunk_size)
+        self.inbound = InboundModel(config, underlay_dmac, underlay_smac, chunk_size)
+
+    def process(self, pkts):
+        hdrs, meta = self.outbound.process(pkts)
+        inbound_hdrs, inbound_meta = self.inbound.process(pkts)
+        inbound = inbound_meta['direction'] == INBOUND
+        hdrs[inbound] = inbound_hdrs[inbound]
+        meta[inbound] = inbound_meta[inbound]
+        return hdrs, meta
+
+
+class _FlowCounters:
+    """ Counters of the flows seen so far, sorted by flow hash """
+
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.tuples = np.zeros(0, dtype=FLOW_DTYPE)
+        self.counts = np.zeros((0, len(_COUNTERS)), dtype=np.int64)
+        # Bit i set when FIELDS[i] differed in a mismatch of the flow
+        self.fields = np.zeros(0, dtype=np.uint64)
+
+    def rows(self, keys, tuples):
+        """ Rows of the flows, added when new """
+        new, first = np.unique(keys, return_index=True)
+        missing = ~np.isin(new, self.keys)
+        if missing.any():
+            keys_all = np.concatenate([self.keys, new[missing]])
+            order = np.argsort(keys_all, kind='stable')
+            self.keys = keys_all[order]
+            self.tuples = np.concatenate([self.tuples, tuples[first[missing]]])[order]
+            self.counts = np.concatenate([self.counts, np.zeros((missing.sum(), len(_COUNTERS)), dtype=np.int64)])[order]
+            self.fields = np.concatenate([self.fields, np.zeros(missing.sum(), dtype=np.uint64)])[order]
+        return np.searchsorted(self.keys, keys)
+
+    def count(self, keys, tuples, counter):
+        if len(keys):
+            rows = self.rows(keys, tuples)
+            np.add.at(self.counts[:, counter], rows, 1)
+
+
+class PcapVerifier:
+    """
+    Streaming comparison of the frames a device sent with those the model expects.
+
+    Parameters:
+        model: OutboundModel, InboundModel or DashModel of the configuration of the device.
+        window (float): seconds after which an expected frame that was not received is missed.
+        ignore (list): 'header.field' names of FIELDS left out of the comparison.
+        max_flows (int): number of flows of the report, the ones with the most errors.
+        max_examples (int): number of mismatches whose fields are detailed in the report.
+    """
+
+    def __init__(self, model, window=1.0, ignore=IGNORED_FIELDS, max_flows=1000, max_examples=20):
+        unknown = set(ignore) - set(FIELDS)
+        if unknown:
+            raise ValueError('unknown fields %s' % sorted(unknown))
+        self.model = model
+        self.window = window
+        self.ignore = list(ignore)
+        self.max_flows = max_flows
+        self.max_examples = max_examples
+        self.reset()
+
+    def reset(self):
+        self.flows = _FlowCounters()
+        self.totals = dict.fromkeys(['sent', 'received', 'expected', 'dropped'] + _COUNTERS[1:], 0)
+        self.drop_reasons = np.zeros(len(DROP_REASONS), dtype=np.int64)
+        self.field_counts = np.zeros(len(FIELDS), dtype=np.int64)
+        self.examples = []
+        # Expected frames not received yet, in the order they were sent, with the hashes of their
+        # masked headers and of their flows
+        self.pending = h.zeros(0)
+        self.pending_time = np.zeros(0, dtype=np.float64)
+        self.pending_keys = np.zeros(0, dtype=np.uint64)
+        self.pending_flows = np.zeros(0, dtype=np.uint64)
+
+    def masked(self, pkts):
+        """ Copy of the headers of pkts without the ignored fields nor the fields of invalid headers """
+        masked = pkts.copy()
+        for name, bits in _HEADER_BITS.items():
+            absent = (masked['valid'] & bits) == 0
+            if masked.dtype[name].names:
+                for field in masked.dtype[name].names:
+                    masked[name][field][absent] = 0
+            else:
+                masked[name][absent] = 0
+        for field in self.ignore:
+            _column(masked, field)[...] = 0
+        return masked
+
+    def add_sent(self, times, pkts):
+        """ Run the packets the generator sent through the model and wait for their expected frames """
+        expected, meta = self.model.process(pkts)
+        sent = ~meta['dropped']
+        self.totals['sent'] += len(pkts)
+        self.totals['dropped'] += int(meta['dropped'].sum())
+        self.drop_reasons += np.bincount(meta['drop_reason'], minlength=len(DROP_REASONS))[:len(DROP_REASONS)]
+        expected = self.masked(expected[sent])
+        self.totals['expected'] += len(expected)
+        tuples = flows(expected)
+        flow_keys = hash_rows(tuples)
+        self.flows.count(flow_keys, tuples, EXPECTED)
+        self.pending = np.concatenate([self.pending, expected])
+        self.pending_time = np.concatenate([self.pending_time, np.asarray(times)[sent]])
+        self.pending_keys = np.concatenate([self.pending_keys, hash_rows(expected)])
+        self.pending_flows = np.concatenate([self.pending_flows, flow_keys])
+
+    def add_received(self, pkts):
+        """ Match the frames the device sent with the pending expected frames """
+        received = self.masked(pkts)
+        self.totals['received'] += len(received)
+        match = pair(self.pending_keys, hash_rows(received))
+        matched = match >= 0
+        self._count(received[matched], MATCHED)
+
+        # The frames left alone are paired by flow with the oldest expected frames of their flow
+        left = np.nonzero(~matched)[0]
+        unpaired = np.ones(len(self.pending), dtype=bool)
+        unpaired[match[matched]] = False
+        candidates = np.nonzero(unpaired)[0]
+        received_flows = hash_rows(flows(received[left]))
+        mismatch = pair(self.pending_flows[candidates], received_flows)
+        paired = mismatch >= 0
+        expected_rows = candidates[mismatch[paired]]
+        self._mismatches(self.pending[expected_rows], received[left[paired]])
+        self._count(received[left[~paired]], EXTRA)
+
+        unpaired[expected_rows] = False
+        self._keep(unpaired)
+
+    def expire(self, now):
+        """ Expected frames sent more than a window before now are missed """
+        missed = self.pending_time < now - self.window
+        self._count(self.pending[missed], MISSED)
+        self._keep(~missed)
+
+    def _keep(self, mask):
+        self.pending = self.pending[mask]
+        self.pending_time = self.pending_time[mask]
+        self.pending_keys = self.pending_keys[mask]
+        self.pending_flows = self.pending_flows[mask]
+
+    def _count(self, pkts, counter):
+        self.totals[_COUNTERS[counter]] += len(pkts)
+        tuples = flows(pkts)
+        self.flows.count(hash_rows(tuples), tuples, counter)
+
+    def _mismatches(self, expected, received):
+        self._count(received, MISMATCHED)
+        if not len(received):
+            return
+        differs = np.stack([_column(expected, field) != _column(received, field) if _column(expected, field).ndim == 1
+                            else (_column(expected, field) != _column(received, field)).any(axis=1)
+                            for field in FIELDS], axis=1)
+        self.field_counts += differs.sum(axis=0)
+        bits = (differs.astype(np.uint64) << np.arange(len(FIELDS), dtype=np.uint64)).sum(axis=1, dtype=np.uint64)
+        tuples = flows(received)
+        rows = self.flows.rows(hash_rows(tuples), tuples)
+        np.bitwise_or.at(self.flows.fields, rows, bits)
+        for row in range(min(len(received), self.max_examples - len(self.examples))):
+            self.examples.append({'flow': _flow_dict(tuples[row]),
+                                  'fields': {FIELDS[i]: [_value(expected[row], FIELDS[i]), _value(received[row], FIELDS[i])]
+                                             for i in np.nonzero(differs[row])[0]}})
+
+    def run(self, sent_chunks, received_chunks):
+        """
+        Verify a capture of the frames the device sent against a capture of the frames it received.
+
+        Parameters:
+            sent_chunks, received_chunks (iterables): (times, buffer, offsets, lengths) batches of
+                the frames sent to the device and of those it sent back, in capture order, as
+                read_pcap_chunks() yields them.
+
+        Returns:
+            dict: the report().
+        """
+        sent_chunks = iter(sent_chunks)
+        last_sent = -np.inf
+        for times, buffer, offsets, lengths in received_chunks:
+            # The expected frames of every packet sent before the last frame of the chunk
+            horizon = float(times.max())
+            while last_sent <= horizon:
+                chunk = next(sent_chunks, None)
+                if chunk is None:
+                    last_sent = np.inf
+                    break
+                sent_times, sent_buffer, sent_offsets, sent_lengths = chunk
+                self.add_sent(sent_times, decode(sent_buffer, sent_offsets, sent_lengths)[0])
+                last_sent = float(sent_times.max()) if len(sent_times) else last_sent
+            self.add_received(decode(buffer, offsets, lengths)[0])
+            self.expire(horizon)
+        for sent_times, sent_buffer, sent_offsets, sent_lengths in sent_chunks:
+            self.add_sent(sent_times, decode(sent_buffer, sent_offsets, sent_lengths)[0])
+            self.expire(np.inf)
+        self.expire(np.inf)
+        return self.report()
+
+    def report(self):
+        """
+        Totals, drop reasons of the model, counts of the differing fields, the flows with the most
+        errors (mismatched, missed or extra frames) and examples of mismatches.
+        """
+        counts = self.flows.counts
+        errors = counts[:, MISMATCHED] + counts[:, MISSED] + counts[:, EXTRA]
+        rows = np.argsort(-errors, kind='stable')[:self.max_flows]
+        rows = rows[errors[rows] > 0]
+        report = dict(self.totals)
+        report['drop_reasons'] = {DROP_REASONS[i]: int(n) for i, n in enumerate(self.drop_reasons) if n and i}
+        report['fields'] = {FIELDS[i]: int(n) for i, n in enumerate(self.field_counts) if n}
+        report['flows_seen'] = len(counts)
+        report['flows_with_errors'] = int((errors > 0).sum())
+        report['flows'] = []
+        for row in rows:
+            flow = _flow_dict(self.flows.tuples[row])
+            flow.update({name: int(counts[row, i]) for i, name in enumerate(_COUNTERS)})
+            flow['fields'] = [FIELDS[i] for i in range(len(FIELDS)) if (int(self.flows.fields[row]) >> i) & 1]
+            report['flows'].append(flow)
+        report['examples'] = self.examples
+        return report
+
+
+def _value(pkt, field):
+    """ Field of a packet, addresses as strings """
+    header, _, name = field.rpartition('.')
+    value = _column(pkt, field)
+    if name in ('src', 'dst') and header.endswith('eth'):
+        return h.int_to_mac(value)
+    if name in ('src', 'dst'):
+        return str(h.ip_from_words(int(pkt[header]['version']) or 4, *value))
+    return int(value)
+
+
+def _flow_dict(flow):
+    version = int(flow['version']) or 4
+    return {'src': str(h.ip_from_words(version, *flow['src'])), 'dst': str(h.ip_from_words(version, *flow['dst'])),
+            'proto': int(flow['proto']), 'sport': int(flow['sport']), 'dport': int(flow['dport'])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify the captured output of a DASH device against the reference model')
+    parser.add_argument('--config', required=True, help='SAI records of the configuration, JSON or NDJSON')
+    parser.add_argument('--sent', required=True, help='Capture of the frames sent to the device')
+    parser.add_argument('--received', required=True, help='Capture of the frames the device sent back')
+    parser.add_argument('--window', type=float, default=1.0, help='Seconds after which an expected frame is missed')
+    parser.add_argument('--underlay-dmac', type=str, default='0', help='Destination MAC of the encapsulated frames')
+    parser.add_argument('--underlay-smac', type=str, default='0', help='Source MAC of the encapsulated frames')
+    parser.add_argument('--ignore', type=str, default=','.join(IGNORED_FIELDS),
+                        help='Comma separated fields left out of the comparison')
+    parser.add_argument('--max-flows', type=int, default=1000, help='Number of flows of the report')
+    args = parser.parse_args()
+
+    model = DashModel(SaiConfig.from_file(args.config), h.mac_to_int(args.underlay_dmac), h.mac_to_int(args.underlay_smac))
+    verifier = PcapVerifier(model, args.window, [f for f in args.ignore.split(',') if f], args.max_flows)
+    print(json.dumps(verifier.run(read_pcap_chunks(args.sent), read_pcap_chunks(args.received)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Reverse-order iteration of SAI records in bounded memory, to generate the remove commands of a
+configuration in reverse dependency order (the entries referring to an object are removed before it)
+without keeping the whole configuration in memory.
+
+Sequences which can be reversed (lists, ReversibleRecords of a generator function able to generate
+its records last first, or any object with __reversed__) are iterated backwards directly. Other
+iterables, e.g. a generator expanding a configuration spec, are pushed to a RecordStack, which
+spills the records to a temporary file in chunks and pops them back chunk by chunk.
+
+    def make_remove_commands(self):
+        return remove_commands(self.make_create_commands())
+"""
+
+import pickle
+import tempfile
+
+CHUNK_SIZE = 65536
+
+
+class RecordStack:
+    """
+    Stack of records holding at most chunk_size records in memory, the others in chunks on disk.
+
+    Parameters:
+        chunk_size (int): records of a chunk. Default is CHUNK_SIZE.
+        directory (str): directory of the temporary file. Default is the system temporary directory.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, directory=None):
+        self.chunk_size = chunk_size
+        self.directory = directory
+        self.top = []
+        self.offsets = []
+        self.file = None
+
+    def __len__(self):
+        return len(self.offsets) * self.chunk_size + len(self.top)
+
+    def push(self, record):
+        """ Push a record, spilling the records in memory to disk when they fill a chunk """
+        if len(self.top) == self.chunk_size:
+            if self.file is None:
+                self.file = tempfile.TemporaryFile(dir=self.directory)
+            self.offsets.append(self.file.seek(0, 2))
+            pickle.dump(self.top, self.file, pickle.HIGHEST_PROTOCOL)
+            self.top = []
+        self.top.append(record)
+
+    def extend(self, records):
+        for record in records:
+            self.push(record)
+
+    def pop_all(self):
+        """ Generator popping all the records, the last pushed first """
+        while True:
+            while self.top:
+                yield self.top.pop()
+            if not self.offsets:
+                break
+            offset = self.offsets.pop()
+            self.file.seek(offset)
+            self.top = pickle.load(self.file)
+            self.file.truncate(offset)
+        self.close()
+
+    def close(self):
+        """ Drop the records and remove the temporary file """
+        self.top = []
+        self.offsets = []
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ReversibleRecords:
+    """
+    Records of a generator function which generates them last first when called with reverse=True,
+    e.g. by counting down the indexes of a count/start/step sequence.
+
+    Parameters:
+        generate (callable): generator function with a reverse keyword argument.
+        *args, **kwargs: other arguments of the generator function.
+    """
+
+    def __init__(self, generate, *args, **kwargs):
+        self.generate = generate
+        self.args = args
+        self.kwargs = kwargs
+
+    def __iter__(self):
+        return self.generate(*self.args, reverse=False, **self.kwargs)
+
+    def __reversed__(self):
+        return self.generate(*self.args, reverse=True, **self.kwargs)
+
+
+def reverse_records(records, chunk_size=CHUNK_SIZE):
+    """
+    Iterate records in reverse order.
+
+    Parameters:
+        records (iterable): records, iterated backwards if reversible, else through a RecordStack.
+        chunk_size (int): records of a chunk of the stack. Default is CHUNK_SIZE.
+
+    Returns:
+        iterator of the records, the last first.
+    """
+    try:
+        return reversed(records)
+    except TypeError:
+        pass
+
+    def spilled():
+        with RecordStack(chunk_size) as stack:
+            stack.extend(records)
+            yield from stack.pop_all()
+
+    return spilled()
+
+
+def remove_commands(records, chunk_size=CHUNK_SIZE):
+    """
+    Generate the remove commands of create commands, in reverse order.
+    Only the names of the records are kept, whether the records are spilled to disk or not.
+
+    Parameters:
+        records (iterable): create commands (SAI records).
+        chunk_size (int): records of a chunk of the stack. Default is CHUNK_SIZE.
+
+    Returns:
+        generator of the remove commands, for the last created record first.
+    """
+    try:
+        names = (record['name'] for record in reversed(records))
+    except TypeError:
+        names = reverse_records((record['name'] for record in records), chunk_size)
+    for name in names:
+        yield {'name': name, 'op': 'remove'}
@@ -0,0 +1,134 @@
+"""
+Streaming output of SAI records for the standalone modes of the test scripts, which dump the
+configuration they generate: records are written one at a time as a JSON array (the same text as
+json.dumps(records, indent=2)) or as NDJSON, optionally gzip or zstd compressed, so a dump of
+millions of records runs in constant memory.
+
+    parser = argparse.ArgumentParser()
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    with RecordWriter.from_args(args) as writer:
+        writer.write(make_create_commands())
+"""
+
+import gzip
+import io
+import json
+import sys
+import time
+
+FORMATS = ('json', 'ndjson')
+COMPRESSIONS = ('gzip', 'zstd')
+EXTENSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+
+
+def add_output_arguments(parser):
+    """ Add the output options of RecordWriter.from_args() to an argparse parser """
+    parser.add_argument('-o', '--output', type=str, default=None, help='Output file instead of stdout')
+    parser.add_argument('--format', choices=FORMATS, default='json',
+                        help='JSON array of every group of records, or a record per line (NDJSON)')
+    parser.add_argument('--compress', choices=COMPRESSIONS, default=None,
+                        help='Compression, by default after the output file extension (.gz, .zst)')
+    parser.add_argument('--progress', action='store_true', help='Print the records written per second to stderr')
+
+
+def _open_binary(path):
+    """ Binary stream of a file, or of stdout for None or '-', and whether to close it """
+    if path in (None, '-'):
+        return sys.stdout.buffer, False
+    return open(path, 'wb'), True
+
+
+class RecordWriter:
+    """
+    Writes SAI records to a file or stdout as they are generated.
+
+    Parameters:
+        path (str): output file, None or '-' for stdout.
+        fmt (str): 'json' for a JSON array of every write(), 'ndjson' for a record per line.
+        compress (str): 'gzip' or 'zstd', None for the compression of the path extension (.gz, .zst),
+            if any.
+        progress (bool): print the number of records written and their rate to stderr every second.
+    """
+
+    def __init__(self, path=None, fmt='json', compress=None, progress=False):
+        if fmt not in FORMATS:
+            raise ValueError(f"Format {fmt} not in {FORMATS}")
+        if compress is None and path:
+            compress = next((name for ext, name in EXTENSIONS.items() if path.endswith(ext)), None)
+        if compress is not None and compress not in COMPRESSIONS:
+            raise ValueError(f"Compression {compress} not in {COMPRESSIONS}")
+        self.fmt = fmt
+        self.progress = progress
+        self.count = 0
+        self.start = self.last_report = time.monotonic()
+
+        if compress == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError("zstd compression needs the zstandard package (pip install zstandard)")
+
+        self.raw, self.close_raw = _open_binary(path)
+        if compress == 'gzip':
+            self.compressed = gzip.GzipFile(fileobj=self.raw, mode='wb')
+        elif compress == 'zstd':
+            self.compressed = zstandard.ZstdCompressor().stream_writer(self.raw, closefd=False)
+        else:
+            self.compressed = None
+        self.out = io.TextIOWrapper(self.compressed or self.raw, encoding='utf-8', write_through=False)
+
+    @classmethod
+    def from_args(cls, args):
+        """ Writer of the options add_output_arguments() adds """
+        return cls(args.output, args.format, args.compress, args.progress)
+
+    def write(self, records):
+        """ Write the records of an iterable, as a JSON array of their own in the json format """
+        if self.fmt == 'ndjson':
+            for record in records:
+                self.out.write(json.dumps(record))
+                self.out.write('\n')
+                self._written()
+            return
+
+        separator = '[\n'
+        for record in records:
+            self.out.write(separator)
+            # json.dumps(records, indent=2) indents the records of the array by 2 spaces
+            self.out.write(json.dumps(record, indent=2).replace('\n', '\n  ').join(('  ', '')))
+            separator = ',\n'
+            self._written()
+        self.out.write('[]\n' if separator == '[\n' else '\n]\n')
+
+    def _written(self):
+        self.count += 1
+        if self.progress and not self.count & 0x3ff:
+            now = time.monotonic()
+            if now - self.last_report >= 1.0:
+                self.last_report = now
+                self._report(now, '\r')
+
+    def _report(self, now, end):
+        elapsed = now - self.start
+        rate = self.count / elapsed if elapsed else 0.0
+        print(f"{self.count} records, {rate:.0f} records/s", end=end, file=sys.stderr, flush=True)
+
+    def close(self):
+        """ Flush the records, end the compressed stream and close the file """
+        self.out.flush()
+        self.out.detach()
+        if self.compressed is not None:
+            self.compressed.close()
+        if self.close_raw:
+            self.raw.close()
+        else:
+            self.raw.flush()
+        if self.progress:
+            self._report(time.monotonic(), '\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
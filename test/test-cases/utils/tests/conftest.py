@@ -0,0 +1,5 @@
+import os
+import sys
+
+# dash_model is imported from the utils directory, as the scale tests do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,87 @@
+import ipaddress
+
+import numpy as np
+import pytest
+
+from dash_model import SaiConfig
+from dash_model.acl import ACL_STAGES, AclClassifier, AclRules
+from dash_model.bench import acl_records
+
+
+@pytest.fixture(scope='module')
+def config():
+    return SaiConfig(acl_records(60, seed=3))
+
+
+@pytest.fixture(scope='module')
+def flows(config):
+    """ Random 5-tuples of 10.0.0.0/12 through the 3 groups of the config """
+    rng = np.random.default_rng(4)
+    count = 3000
+    groups = np.tile(np.array([config.oid_of('acl_group_%d' % stage) for stage in range(1, 4)], dtype=np.uint64),
+                     (count, 1))
+    sip = np.zeros((count, 2), dtype=np.uint64)
+    dip = np.zeros((count, 2), dtype=np.uint64)
+    sip[:, 1] = np.uint64(0x0a000000) | rng.integers(0, 1 << 20, count).astype(np.uint64)
+    dip[:, 1] = np.uint64(0x0a000000) | rng.integers(0, 1 << 20, count).astype(np.uint64)
+    protocol = rng.choice(np.array([1, 6, 17], dtype=np.uint8), count)
+    src_port = rng.integers(0, 1 << 16, count).astype(np.uint16)
+    dst_port = rng.integers(0, 1 << 16, count).astype(np.uint16)
+    return groups, sip, dip, protocol, src_port, dst_port
+
+
+def brute_force(rules, group, sip, dip, protocol, src_port, dst_port):
+    """ Row of the first rule of the group matching the packet, highest priority first """
+
+    def in_prefixes(address, prefixes):
+        items = [item for item in str(prefixes or '').split(',') if item]
+        return not items or any(address in ipaddress.ip_network(item, strict=False) for item in items)
+
+    def in_ranges(port, ranges):
+        items = [item.partition('-') for item in str(ranges or '').split(',') if item]
+        return not items or any(int(low) <= port <= int(high or low) for low, _, high in items)
+
+    sip = ipaddress.IPv4Address(int(sip[1]))
+    dip = ipaddress.IPv4Address(int(dip[1]))
+    for row, record in sorted(enumerate(rules), key=lambda item: -int(item[1].attrs['priority'])):
+        attrs = record.attrs
+        protocols = [int(value) for value in str(attrs.get('protocol') or '').split(',') if value]
+        if (record.attrs['dash_acl_group_id'] == group and in_prefixes(sip, attrs.get('sip'))
+                and in_prefixes(dip, attrs.get('dip')) and (not protocols or protocol in protocols)
+                and in_ranges(src_port, attrs.get('src_port')) and in_ranges(dst_port, attrs.get('dst_port'))):
+            return row
+    return -1
+
+
+def test_lookup_matches_brute_force(config, flows):
+    groups, sip, dip, protocol, src_port, dst_port = flows
+    rules = list(config['dash_acl_rule'].values())
+    sample = slice(0, 300)
+    for stage in range(ACL_STAGES):
+        group = groups[sample, stage]
+        rows = AclRules(config).lookup(group, sip[sample], dip[sample], protocol[sample], src_port[sample],
+                                       dst_port[sample])
+        expected = [brute_force(rules, int(g), s, d, int(p), int(sp), int(dp))
+                    for g, s, d, p, sp, dp in zip(group, sip[sample], dip[sample], protocol[sample],
+                                                  src_port[sample], dst_port[sample])]
+        assert rows.tolist() == expected
+
+
+def test_classifier_matches_linear_rules(config, flows):
+    denied, rules = AclClassifier(config).classify(*flows)
+    expected_denied, expected_rules = AclRules(config).classify(*flows)
+    assert (rules == expected_rules).all()
+    assert (denied == expected_denied).all()
+    # The flows go through every stage, some of them hitting rules
+    assert ((rules >= 0).sum(axis=0) > 0).all()
+
+
+def test_classify_skips_stages_without_group(config, flows):
+    groups, sip, dip, protocol, src_port, dst_port = flows
+    groups = groups.copy()
+    groups[:, 1] = 0
+    denied, rules = AclClassifier(config).classify(groups, sip, dip, protocol, src_port, dst_port)
+    assert (rules[:, 1] == -1).all()
+    expected_denied, expected_rules = AclRules(config).classify(groups, sip, dip, protocol, src_port, dst_port)
+    assert (rules == expected_rules).all()
+    assert (denied == expected_denied).all()
@@ -0,0 +1,151 @@
+import struct
+
+import numpy as np
+import pytest
+
+from dash_model import headers as h
+from dash_model.codec import decode, encode
+from dash_model.pcap import read_pcap, read_pcap_chunks, write_pcap, write_pcap_chunks
+
+
+@pytest.fixture(scope='module')
+def pkts():
+    """ VXLAN packets of random headers: inner IPv4 and IPv6, TCP, UDP and ICMP, payloads of various sizes """
+    rng = np.random.default_rng(5)
+    count = 500
+    v6 = rng.random(count) < 0.5
+    proto = rng.choice(np.array([1, h.TCP_PROTO, h.UDP_PROTO], dtype=np.uint8), count)
+    tcp, udp = proto == h.TCP_PROTO, proto == h.UDP_PROTO
+    payload_len = rng.integers(0, 200, count)
+
+    pkts = h.zeros(count)
+    pkts['valid'] = (h.ETHERNET | h.IPV4 | h.UDP | h.VXLAN | h.INNER_ETHERNET | np.where(v6, h.INNER_IPV6, h.INNER_IPV4)
+                     | np.where(tcp, h.INNER_TCP, 0) | np.where(udp, h.INNER_UDP, 0))
+    for eth in (pkts['eth'], pkts['inner_eth']):
+        eth['dst'] = rng.integers(0, 1 << 48, count).astype(np.uint64)
+        eth['src'] = rng.integers(0, 1 << 48, count).astype(np.uint64)
+    pkts['eth']['type'] = h.IPV4_ETHTYPE
+    pkts['inner_eth']['type'] = np.where(v6, h.IPV6_ETHTYPE, h.IPV4_ETHTYPE)
+    ip, inner = pkts['ip'], pkts['inner_ip']
+    ip['version'] = 4
+    ip['proto'] = h.UDP_PROTO
+    ip['ttl'] = 64
+    ip['id'] = rng.integers(0, 1 << 16, count)
+    for field in ('src', 'dst'):
+        ip[field][:, 1] = rng.integers(0, 1 << 32, count).astype(np.uint64)
+        inner[field][:, 1] = rng.integers(0, 1 << 32, count).astype(np.uint64)
+        inner[field][v6, 0] = rng.integers(0, 1 << 63, int(v6.sum())).astype(np.uint64)
+        inner[field][v6, 1] |= rng.integers(0, 1 << 32, int(v6.sum())).astype(np.uint64) << np.uint64(32)
+    pkts['l4']['sport'] = rng.integers(0, 1 << 16, count)
+    pkts['l4']['dport'] = h.UDP_PORT_VXLAN
+    pkts['vni'] = rng.integers(0, 1 << 24, count)
+
+    l4_len = np.where(tcp, h.TCP_HDR_SIZE, np.where(udp, h.UDP_HDR_SIZE, 0)) + payload_len
+    inner['version'] = np.where(v6, 6, 4)
+    inner['proto'] = proto
+    inner['ttl'] = 64
+    inner['len'] = np.where(v6, l4_len, l4_len + h.IPV4_HDR_SIZE)
+    inner_l4 = pkts['inner_l4']
+    inner_l4['sport'] = np.where(tcp | udp, rng.integers(0, 1 << 16, count), 0)
+    inner_l4['dport'] = np.where(tcp | udp, rng.integers(0, 1 << 16, count), 0)
+    inner_l4['len'] = np.where(udp, l4_len, 0)
+    inner_l4['seq'] = np.where(tcp, rng.integers(0, 1 << 32, count), 0)
+    inner_l4['flags'] = np.where(tcp, h.TCP_SYN | h.TCP_ACK, 0)
+    inner_l4['data_offset'] = np.where(tcp, h.TCP_HDR_SIZE // 4, 0)
+    pkts['payload_len'] = payload_len
+
+    ip['len'] = h.IPV4_HDR_SIZE + h.UDP_HDR_SIZE + h.VXLAN_HDR_SIZE + h.ETHER_HDR_SIZE + h.ip_packet_len(inner)
+    pkts['l4']['len'] = ip['len'] - h.IPV4_HDR_SIZE
+    return pkts
+
+
+def fold(data):
+    """ RFC 1071 ones' complement sum of data """
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return total
+
+
+def check_ip(frame, pos, ethertype):
+    """ Verify the checksums of the IP packet at pos and of the VXLAN packet it carries, if any """
+    if ethertype == h.IPV4_ETHTYPE:
+        size = (frame[pos] & 0xf) * 4
+        assert fold(frame[pos:pos + size]) == 0xffff
+        proto = frame[pos + 9]
+        length = struct.unpack('!H', frame[pos + 2:pos + 4])[0] - size
+        pseudo = frame[pos + 12:pos + 20]
+    else:
+        size = 40
+        proto = frame[pos + 6]
+        length = struct.unpack('!H', frame[pos + 4:pos + 6])[0]
+        pseudo = frame[pos + 8:pos + 40]
+    pos += size
+    segment = frame[pos:pos + length]
+    pseudo += struct.pack('!HH', proto, length)
+    if proto == h.TCP_PROTO:
+        assert fold(pseudo + segment) == 0xffff
+    elif proto == h.UDP_PROTO:
+        if struct.unpack('!H', segment[6:8])[0]:
+            assert fold(pseudo + segment) == 0xffff
+        if struct.unpack('!H', segment[2:4])[0] == h.UDP_PORT_VXLAN:
+            inner = pos + h.UDP_HDR_SIZE + h.VXLAN_HDR_SIZE
+            check_ip(frame, inner + h.ETHER_HDR_SIZE, struct.unpack('!H', frame[inner + 12:inner + 14])[0])
+            return 2
+    return 1
+
+
+def test_checksums(pkts):
+    buffer, offsets, lengths = encode(pkts)
+    assert lengths.tolist() == h.frame_len(pkts).tolist()
+    for offset, length in zip(offsets, lengths):
+        frame = bytes(buffer[offset:offset + length])
+        assert check_ip(frame, h.ETHER_HDR_SIZE, struct.unpack('!H', frame[12:14])[0]) == 2
+
+
+def test_decode_encode_round_trip(pkts):
+    buffer, offsets, lengths = encode(pkts)
+    decoded, payload = decode(buffer, offsets, lengths)
+    assert (decoded['valid'] == pkts['valid']).all()
+    assert (decoded['inner_ip']['src'] == pkts['inner_ip']['src']).all()
+    assert (decoded['inner_l4']['dport'] == pkts['inner_l4']['dport']).all()
+    assert (decoded['vni'] == pkts['vni']).all()
+    again, again_offsets, again_lengths = encode(decoded, buffer, payload, checksums=False)
+    assert (again_offsets == offsets).all() and (again_lengths == lengths).all()
+    assert (again == buffer).all()
+
+
+@pytest.mark.parametrize('name, nanoseconds', [('trace.pcap', False), ('trace.pcap.gz', True)])
+def test_pcap_chunks_round_trip(tmp_path, pkts, name, nanoseconds):
+    buffer, offsets, lengths = encode(pkts)
+    times = 1.5 + np.arange(len(pkts)) * 1e-6
+    path = str(tmp_path / name)
+    half = len(pkts) // 2
+    write_pcap_chunks(path, [(times[:half], buffer, offsets[:half], lengths[:half]),
+                             (times[half:], buffer, offsets[half:], lengths[half:])], nanoseconds)
+
+    frames, read_times = [], []
+    # Reads smaller than the frames, for the records to span several of them
+    for chunk_times, chunk, chunk_offsets, chunk_lengths in read_pcap_chunks(path, chunk_bytes=100):
+        read_times.extend(chunk_times)
+        frames.extend(bytes(chunk[o:o + n]) for o, n in zip(chunk_offsets, chunk_lengths))
+    assert frames == [bytes(buffer[o:o + n]) for o, n in zip(offsets, lengths)]
+    assert np.allclose(read_times, times, rtol=0, atol=1e-9 if nanoseconds else 1e-6)
+
+    assert [(round(t, 6), f) for t, f in read_pcap(path)] == [(round(t, 6), f) for t, f in zip(read_times, frames)]
+
+
+def test_pcap_round_trip(tmp_path):
+    frames = [(0.25, b'\x01' * 60), (1.000001, bytes(range(256)) * 4)]
+    path = str(tmp_path / 'frames.pcap')
+    write_pcap(path, frames)
+    assert [(round(t, 6), f) for t, f in read_pcap(path)] == frames
+
+
+def test_pcap_rejects_other_files(tmp_path):
+    path = tmp_path / 'trace.pcapng'
+    path.write_bytes(b'\x0a\x0d\x0d\x0a' + b'\0' * 28)
+    with pytest.raises(ValueError):
+        list(read_pcap(str(path)))
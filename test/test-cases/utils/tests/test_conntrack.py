@@ -0,0 +1,169 @@
+import numpy as np
+import pytest
+
+from dash_model import ConntrackSimulator, SaiConfig
+from dash_model import headers as h
+from dash_model.conntrack import TRACE_DTYPE, FlowTable, TimerWheel, synthetic_trace
+from dash_model.pipeline import INBOUND, OUTBOUND
+
+VM = 0x0a000001
+REMOTE = 0x0b000001
+ENI = 7
+
+
+def eni_records(cps, flows):
+    return [{'name': 'vnet', 'op': 'create', 'type': 'SAI_OBJECT_TYPE_VNET', 'attributes': ['SAI_VNET_ATTR_VNI', 1000]},
+            {'name': 'eni', 'op': 'create', 'type': 'SAI_OBJECT_TYPE_ENI',
+             'attributes': ['SAI_ENI_ATTR_CPS', cps, 'SAI_ENI_ATTR_FLOWS', flows, 'SAI_ENI_ATTR_ADMIN_STATE', True,
+                            'SAI_ENI_ATTR_VNET_ID', '$vnet']}]
+
+
+def trace(*packets):
+    """ Packets (time, direction, sport, flags) of connections between VM:sport and REMOTE:80 """
+    result = np.zeros(len(packets), dtype=TRACE_DTYPE)
+    for row, (time, direction, sport, flags) in zip(result, packets):
+        outbound = direction == OUTBOUND
+        row['time'] = time
+        row['eni_id'] = ENI
+        row['direction'] = direction
+        row['src'], row['dst'] = (VM, REMOTE) if outbound else (REMOTE, VM)
+        row['sport'], row['dport'] = (sport, 80) if outbound else (80, sport)
+        row['proto'] = h.TCP_PROTO
+        row['flags'] = flags
+    return result
+
+
+def connection(start, sport, direction=OUTBOUND):
+    """ SYN, SYN-ACK, data, FIN and FIN-ACK of a connection opened from direction, the FIN-ACK in the
+        tick of the FIN, before the entry expires """
+    other = INBOUND if direction == OUTBOUND else OUTBOUND
+    return [(start, direction, sport, h.TCP_SYN), (start + 0.01, other, sport, h.TCP_SYN | h.TCP_ACK),
+            (start + 0.02, direction, sport, h.TCP_ACK), (start + 0.0301, direction, sport, h.TCP_FIN | h.TCP_ACK),
+            (start + 0.0305, other, sport, h.TCP_FIN | h.TCP_ACK)]
+
+
+def test_timer_wheel_fires_in_deadline_order():
+    rng = np.random.default_rng(6)
+    wheel = TimerWheel(levels=3, bits=3)
+    deadlines = rng.integers(1, 2000, 500).tolist()
+    for item, deadline in enumerate(deadlines):
+        wheel.schedule(deadline, item)
+    assert len(wheel) == len(deadlines)
+    now = 0
+    while now < 2000:
+        to = now + int(rng.integers(1, 100))
+        fired = wheel.advance(to)
+        assert sorted(item for _, item in fired) == sorted(i for i, d in enumerate(deadlines) if now < d <= to)
+        now = to
+    assert len(wheel) == 0
+
+
+def test_timer_wheel_pop_earliest():
+    wheel = TimerWheel(levels=2, bits=2)
+    for deadline in (40, 3, 17, 9):
+        wheel.schedule(deadline, deadline)
+    assert [wheel.pop_earliest()[1] for _ in range(4)] == [3, 9, 17, 40]
+    assert wheel.pop_earliest() is None
+
+
+def test_flow_table_matches_a_dict():
+    rng = np.random.default_rng(7)
+    table = FlowTable(capacity=1000, timeout=100)
+    flows = set()
+    for _ in range(5000):
+        key = int(rng.integers(0, 300))
+        slot = table.find(key)
+        assert (slot >= 0) == (key in flows)
+        if slot >= 0 and rng.random() < 0.5:
+            table.remove(slot)
+            flows.discard(key)
+        elif slot < 0:
+            table.add(key, 0)
+            flows.add(key)
+    assert table.count == len(flows)
+    assert sorted(key for key in table.keys if key is not None) == sorted(flows)
+
+
+def test_flow_table_evicts_the_least_recently_used():
+    table = FlowTable(capacity=2, timeout=100)
+    table.add('a', 0)
+    table.add('b', 1)
+    table.touch(table.find('a'), 2)
+    table.add('c', 3)
+    assert table.evictions == 1 and table.removed == ['b']
+    assert table.find('a') >= 0 and table.find('b') < 0 and table.find('c') >= 0
+
+
+def test_connection_is_tracked_and_closed():
+    sim = ConntrackSimulator(timeout=10.0)
+    # A later SYN moves the time past the close of the first connection
+    report = sim.replay(trace(*connection(0.0, 1000), (1.0, OUTBOUND, 1001, h.TCP_SYN)))
+    assert report['inserts'] == 2
+    # Every packet of the connection after the SYN hits the ConntrackIn entry
+    assert report['hits'] == 4
+    assert report['closes'] == 2
+    assert report['expirations'] == 1
+    assert report['flows'] == 1
+    assert report['peak_flows'] == 1
+    assert report['enis'][str(ENI)]['flows'] == 1
+
+
+def test_closed_flow_expires_at_the_next_tick():
+    sim = ConntrackSimulator(timeout=10.0)
+    report = sim.replay(trace((0.0, OUTBOUND, 1000, h.TCP_SYN), (0.0101, OUTBOUND, 1000, h.TCP_RST),
+                              (0.0125, INBOUND, 1000, h.TCP_ACK)))
+    assert report['hits'] == 1
+    assert report['expirations'] == 1
+    assert report['flows'] == 0
+
+
+def test_only_syns_add_flows():
+    sim = ConntrackSimulator(timeout=10.0)
+    report = sim.replay(trace((0.0, OUTBOUND, 1000, h.TCP_ACK), (0.1, INBOUND, 1000, h.TCP_SYN | h.TCP_ACK),
+                              (0.2, INBOUND, 1001, h.TCP_SYN)))
+    # The inbound SYN adds to ConntrackOut
+    assert report['inserts'] == 1
+    assert sim.conntrack_out.count == 1 and sim.conntrack_in.count == 0
+
+
+def test_open_flows_expire():
+    sim = ConntrackSimulator(timeout=0.5)
+    report = sim.replay(trace((0.0, OUTBOUND, 1000, h.TCP_SYN), (0.4, OUTBOUND, 1000, h.TCP_ACK),
+                              (0.8, OUTBOUND, 1001, h.TCP_SYN), (1.0, OUTBOUND, 1002, h.TCP_SYN)))
+    # The ACK restarted the timer of the first flow, it expires at 0.9
+    assert report['expirations'] == 1
+    assert report['flows'] == 2
+
+
+def test_capacity_evicts():
+    sim = ConntrackSimulator(capacity=2, timeout=10.0)
+    report = sim.replay(trace(*[(i * 0.1, OUTBOUND, 1000 + i, h.TCP_SYN) for i in range(5)]))
+    assert report['evictions'] == 3
+    assert report['flows'] == 2
+
+
+def test_eni_limits():
+    config = SaiConfig(eni_records(cps=100, flows=50))
+    eni_id = next(iter(ConntrackSimulator(config).limits))
+    report = ConntrackSimulator(config, timeout=60.0).replay(synthetic_trace([eni_id], cps=150, duration=2.0))
+    eni = report['enis'][str(eni_id)]
+    assert (eni['cps_limit'], eni['flows_limit']) == (100, 50)
+    assert eni['over_cps'] and eni['over_flows']
+    assert report['inserts'] == 300
+    assert 100 < eni['peak_cps'] <= 300
+
+    report = ConntrackSimulator(config, timeout=60.0).replay(synthetic_trace([eni_id], cps=10, duration=2.0,
+                                                                            lifetime=0.5))
+    eni = report['enis'][str(eni_id)]
+    assert not eni['over_cps'] and not eni['over_flows']
+
+
+@pytest.mark.parametrize('open_ratio', [0.0, 1.0])
+def test_synthetic_trace(open_ratio):
+    packets = synthetic_trace([1, 2], cps=50, duration=1.0, packets=4, open_ratio=open_ratio)
+    assert (np.diff(packets['time']) >= 0).all()
+    syns = packets[packets['flags'] == h.TCP_SYN]
+    assert len(syns) == 100 and (syns['direction'] == OUTBOUND).all()
+    closes = (packets['flags'] & h.TCP_FIN) != 0
+    assert closes.sum() == (0 if open_ratio else 200)
+    assert len(packets) == 100 * (6 if open_ratio else 8)
@@ -0,0 +1,127 @@
+import os
+
+import pytest
+
+from dash_model import DROP_REASONS, InboundModel, SaiConfig, read_records
+from dash_model import headers as h
+
+INBOUND_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'scale', 'saic',
+                              'vnet_inbound_setup_commands.json')
+
+# Packet of vnet_inbound_setup_commands.json from the PA of its pa_validation entry to the VM of the ENI
+VIP = '192.168.0.1'
+VNI = 1000
+PA = '10.10.2.10'
+ENI_MAC = '00:aa:aa:aa:aa:00'
+
+PERMIT_ALL = {'name': 'acl_in_rule', 'op': 'create', 'type': 'SAI_OBJECT_TYPE_DASH_ACL_RULE',
+              'attributes': ['SAI_DASH_ACL_RULE_ATTR_DASH_ACL_GROUP_ID', '$acl_in_1', 'SAI_DASH_ACL_RULE_ATTR_PRIORITY', 1,
+                             'SAI_DASH_ACL_RULE_ATTR_ACTION', 'SAI_DASH_ACL_RULE_ACTION_PERMIT_AND_CONTINUE']}
+
+
+def vxlan_packets(count, vip=VIP, vni=VNI, sip=PA, dmac=ENI_MAC):
+    """ VXLAN packets from a remote host to a VM, IPv4 over IPv4 """
+    pkts = h.zeros(count)
+    pkts['valid'] = h.ETHERNET | h.IPV4 | h.UDP | h.VXLAN | h.INNER_ETHERNET | h.INNER_IPV4 | h.INNER_TCP
+    pkts['eth']['type'] = h.IPV4_ETHTYPE
+    pkts['ip']['version'] = 4
+    pkts['ip']['proto'] = h.UDP_PROTO
+    pkts['ip']['ttl'] = 64
+    h.set_ip(pkts['ip']['src'], slice(None), sip)
+    h.set_ip(pkts['ip']['dst'], slice(None), vip)
+    pkts['l4']['dport'] = h.UDP_PORT_VXLAN
+    pkts['vni'] = vni
+    pkts['inner_eth']['src'] = h.mac_to_int('02:02:02:02:02:02')
+    pkts['inner_eth']['dst'] = h.mac_to_int(dmac)
+    pkts['inner_eth']['type'] = h.IPV4_ETHTYPE
+    inner = pkts['inner_ip']
+    inner['version'] = 4
+    inner['proto'] = h.TCP_PROTO
+    inner['ttl'] = 64
+    inner['len'] = h.IPV4_HDR_SIZE + h.TCP_HDR_SIZE
+    h.set_ip(inner['src'], slice(None), '20.0.0.1')
+    h.set_ip(inner['dst'], slice(None), '10.1.1.1')
+    pkts['inner_l4']['sport'] = 80
+    pkts['inner_l4']['dport'] = 40000
+    pkts['inner_l4']['data_offset'] = h.TCP_HDR_SIZE // 4
+    pkts['ip']['len'] = h.IPV4_HDR_SIZE + h.UDP_HDR_SIZE + h.VXLAN_HDR_SIZE + h.ETHER_HDR_SIZE + inner['len']
+    pkts['l4']['len'] = pkts['ip']['len'] - h.IPV4_HDR_SIZE
+    return pkts
+
+
+def model(*extra):
+    """ InboundModel of the inbound setup commands and extra records """
+    return InboundModel(SaiConfig(list(read_records(INBOUND_CONFIG)) + list(extra)))
+
+
+def drop_reason(meta):
+    return DROP_REASONS[meta['drop_reason'][0]]
+
+
+def test_decap_and_encap_to_the_vm():
+    pkts = vxlan_packets(1)
+    expected, meta = model(PERMIT_ALL).process(pkts)
+    assert not meta['dropped'][0]
+    assert (meta['inbound_route'][0], meta['pa_validation'][0], meta['eni'][0]) == (0, 0, 0)
+    out = expected[0]
+    # Sent to the underlay address and the VNI of the VM, from the VIP
+    assert str(h.ip_from_words(4, *out['ip']['src'])) == VIP
+    assert str(h.ip_from_words(4, *out['ip']['dst'])) == PA
+    assert out['vni'] == 9
+    assert h.int_to_mac(out['inner_eth']['dst']) == ENI_MAC
+    assert out['valid'] == pkts['valid'][0]
+    for field in ('src', 'dst', 'proto', 'len'):
+        assert (out['inner_ip'][field] == pkts['inner_ip'][field][0]).all()
+    assert out['inner_l4']['dport'] == 40000
+
+
+def test_acl_without_rules_denies():
+    _, meta = model().process(vxlan_packets(1))
+    assert drop_reason(meta) == 'acl'
+    # Up to the ACL stages the packet went through every table
+    assert (meta['inbound_route'][0], meta['pa_validation'][0], meta['eni'][0]) == (0, 0, 0)
+
+
+@pytest.mark.parametrize('fields, reason', [
+    ({'vip': '192.168.0.2'}, 'vip'),
+    # VNI 2000 is looked up as outbound
+    ({'vni': 2000}, 'direction'),
+    ({'vni': 1001}, 'inbound_routing'),
+    ({'sip': '10.10.3.10'}, 'inbound_routing'),
+    ({'dmac': '00:aa:aa:aa:aa:01'}, 'inbound_routing'),
+    ({'sip': '10.10.2.11'}, 'pa_validation'),
+])
+def test_drops(fields, reason):
+    _, meta = model(PERMIT_ALL).process(vxlan_packets(1, **fields))
+    assert meta['dropped'][0]
+    assert drop_reason(meta) == reason
+
+
+def test_routing_priorities():
+    """ A /32 route of a higher priority without PA validation lets 10.10.2.11 in, a deny route of
+        an even higher priority stops 10.10.2.12 """
+    decap = {'name': 'decap', 'op': 'create', 'type': 'SAI_OBJECT_TYPE_INBOUND_ROUTING_ENTRY',
+             'key': {'switch_id': '$SWITCH_ID', 'eni_id': '$eni_id', 'vni': '1000', 'sip': '10.10.2.11',
+                     'sip_mask': '255.255.255.255', 'priority': 1},
+             'attributes': ['SAI_INBOUND_ROUTING_ENTRY_ATTR_ACTION', 'SAI_INBOUND_ROUTING_ENTRY_ACTION_VXLAN_DECAP']}
+    deny = {'name': 'deny', 'op': 'create', 'type': 'SAI_OBJECT_TYPE_INBOUND_ROUTING_ENTRY',
+            'key': {'switch_id': '$SWITCH_ID', 'eni_id': '$eni_id', 'vni': '1000', 'sip': '10.10.2.12',
+                    'sip_mask': '255.255.255.254', 'priority': 2},
+            'attributes': ['SAI_INBOUND_ROUTING_ENTRY_ATTR_ACTION', 'SAI_INBOUND_ROUTING_ENTRY_ACTION_DENY']}
+    inbound = model(PERMIT_ALL, decap, deny)
+    _, meta = inbound.process(vxlan_packets(1, sip='10.10.2.11'))
+    assert not meta['dropped'][0]
+    assert (meta['inbound_route'][0], meta['pa_validation'][0]) == (1, -1)
+    _, meta = inbound.process(vxlan_packets(1, sip='10.10.2.13'))
+    assert drop_reason(meta) == 'inbound_routing'
+    assert meta['inbound_route'][0] == 2
+    _, meta = inbound.process(vxlan_packets(1))
+    assert not meta['dropped'][0]
+
+
+def test_pa_validation_deny():
+    records = list(read_records(INBOUND_CONFIG))
+    entry = next(record for record in records if record['type'] == 'SAI_OBJECT_TYPE_PA_VALIDATION_ENTRY')
+    entry['attributes'] = ['SAI_PA_VALIDATION_ENTRY_ATTR_ACTION', 'SAI_PA_VALIDATION_ENTRY_ACTION_DENY']
+    _, meta = InboundModel(SaiConfig(records + [PERMIT_ALL])).process(vxlan_packets(1))
+    assert drop_reason(meta) == 'pa_validation'
@@ -0,0 +1,95 @@
+import ipaddress
+
+import numpy as np
+import pytest
+
+from dash_model.lpm import RouteIndex
+
+
+def random_routes(rng, count, v6):
+    """ Routes of 3 ENIs on nested prefixes, for the lookups to have covering routes to fall back on """
+    bits = 128 if v6 else 32
+    base = int(ipaddress.ip_address('fd00::' if v6 else '10.0.0.0'))
+    lengths = [0, 8, 16, 24, 28, 32] + ([48, 64, 96, 120, 128] if v6 else [])
+    routes = {}
+    while len(routes) < count:
+        eni = int(rng.integers(1, 4))
+        length = int(rng.choice(lengths))
+        address = base | (int(rng.integers(0, 1 << 20)) << (bits - 24 if v6 else 0))
+        address &= ((1 << bits) - 1) ^ ((1 << (bits - length)) - 1)
+        routes.setdefault((eni, address, length), len(routes))
+    return routes
+
+
+def brute_force(routes, eni, address, v6):
+    """ Row of the longest prefix of the ENI holding address, -1 for none """
+    bits = 128 if v6 else 32
+    best, row = -1, -1
+    for (route_eni, prefix, length), route_row in routes.items():
+        mask = ((1 << bits) - 1) ^ ((1 << (bits - length)) - 1)
+        if route_eni == eni and address & mask == prefix and length > best:
+            best, row = length, route_row
+    return row
+
+
+def words(addresses):
+    return np.array([(a >> 64, a & 0xffffffffffffffff) for a in addresses], dtype=np.uint64).reshape(-1, 2)
+
+
+def build(routes, v6):
+    keys = list(routes)
+    return RouteIndex([eni for eni, _, _ in keys], [v6] * len(keys), words([a for _, a, _ in keys]),
+                      [length for _, _, length in keys])
+
+
+def queries(rng, routes, count, v6):
+    """ Addresses of the routes with random host bits, on ENIs with and without routes """
+    bits = 128 if v6 else 32
+    keys = list(routes)
+    enis, addresses = [], []
+    for _ in range(count):
+        eni, address, length = keys[int(rng.integers(0, len(keys)))]
+        host = int(rng.integers(0, 1 << 62)) & ((1 << min(bits - length, 62)) - 1)
+        enis.append(eni if rng.random() < 0.9 else 9)
+        addresses.append(address | host)
+    return enis, addresses
+
+
+@pytest.mark.parametrize('v6', [False, True])
+def test_lookup_matches_brute_force(v6):
+    rng = np.random.default_rng(1)
+    routes = random_routes(rng, 300, v6)
+    index = build(routes, v6)
+    enis, addresses = queries(rng, routes, 2000, v6)
+    rows = index.lookup(np.array(enis, dtype=np.uint64), np.full(len(enis), v6, dtype=np.uint8), words(addresses))
+    expected = [brute_force(routes, eni, address, v6) for eni, address in zip(enis, addresses)]
+    assert rows.tolist() == expected
+
+
+@pytest.mark.parametrize('v6', [False, True])
+def test_delete_restores_covering_routes(v6):
+    rng = np.random.default_rng(2)
+    routes = random_routes(rng, 200, v6)
+    index = build(routes, v6)
+    removed = list(routes)[::3]
+    for eni, address, length in removed:
+        index.delete(eni, v6, address, length)
+        del routes[(eni, address, length)]
+    assert len(index) == len(routes)
+
+    enis, addresses = queries(rng, {key: 0 for key in removed}, 1000, v6)
+    rows = index.lookup(np.array(enis, dtype=np.uint64), np.full(len(enis), v6, dtype=np.uint8), words(addresses))
+    assert rows.tolist() == [brute_force(routes, eni, address, v6) for eni, address in zip(enis, addresses)]
+
+    # Put back, the removed routes are found again
+    for row, (eni, address, length) in enumerate(removed):
+        index.insert(eni, v6, address, length, 1000 + row)
+        routes[(eni, address, length)] = 1000 + row
+    rows = index.lookup(np.array(enis, dtype=np.uint64), np.full(len(enis), v6, dtype=np.uint8), words(addresses))
+    assert rows.tolist() == [brute_force(routes, eni, address, v6) for eni, address in zip(enis, addresses)]
+
+
+def test_delete_missing_route():
+    index = RouteIndex([1], [0], words([0x0a000000]), [8])
+    with pytest.raises(KeyError):
+        index.delete(1, False, 0x0a000000, 16)
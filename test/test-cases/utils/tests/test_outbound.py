@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pytest
+
+from dash_model import DROP_REASONS, OutboundModel, SaiConfig, read_records
+from dash_model import headers as h
+
+SIMPLE_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'scale', 'saic',
+                             'vnet_outbound_setup_commands_simple.json')
+
+# Packet of vnet_outbound_setup_commands_simple.json the pipeline encapsulates to its CA to PA entry
+VIP = '172.16.1.100'
+VNI = 100
+ENI_MAC = '00:cc:cc:cc:00:00'
+CA_DIP = '10.1.2.50'
+
+
+def vxlan_packets(count, vip=VIP, vni=VNI, smac=ENI_MAC, dip=CA_DIP, sip='10.1.1.10'):
+    """ VXLAN packets from a VM to the appliance, IPv4 over IPv4 """
+    pkts = h.zeros(count)
+    pkts['valid'] = h.ETHERNET | h.IPV4 | h.UDP | h.VXLAN | h.INNER_ETHERNET | h.INNER_IPV4 | h.INNER_UDP
+    pkts['eth']['type'] = h.IPV4_ETHTYPE
+    pkts['ip']['version'] = 4
+    pkts['ip']['proto'] = h.UDP_PROTO
+    pkts['ip']['ttl'] = 64
+    h.set_ip(pkts['ip']['src'], slice(None), '172.16.1.1')
+    h.set_ip(pkts['ip']['dst'], slice(None), vip)
+    pkts['l4']['dport'] = h.UDP_PORT_VXLAN
+    pkts['vni'] = vni
+    pkts['inner_eth']['src'] = h.mac_to_int(smac)
+    pkts['inner_eth']['dst'] = h.mac_to_int('02:02:02:02:02:02')
+    pkts['inner_eth']['type'] = h.IPV4_ETHTYPE
+    inner = pkts['inner_ip']
+    inner['version'] = 4
+    inner['proto'] = h.UDP_PROTO
+    inner['ttl'] = 64
+    inner['len'] = h.IPV4_HDR_SIZE + h.UDP_HDR_SIZE
+    h.set_ip(inner['src'], slice(None), sip)
+    h.set_ip(inner['dst'], slice(None), dip)
+    pkts['inner_l4']['sport'] = 1234
+    pkts['inner_l4']['dport'] = 80
+    pkts['inner_l4']['len'] = h.UDP_HDR_SIZE
+    pkts['ip']['len'] = h.IPV4_HDR_SIZE + h.UDP_HDR_SIZE + h.VXLAN_HDR_SIZE + h.ETHER_HDR_SIZE + inner['len']
+    pkts['l4']['len'] = pkts['ip']['len'] - h.IPV4_HDR_SIZE
+    return pkts
+
+
+@pytest.fixture(scope='module')
+def config():
+    return SaiConfig.from_file(SIMPLE_CONFIG)
+
+
+def test_encap_to_ca_to_pa_entry(config):
+    pkts = vxlan_packets(1)
+    expected, meta = OutboundModel(config).process(pkts)
+    assert not meta['dropped'][0]
+    assert (meta['eni'][0], meta['route'][0], meta['ca_to_pa'][0]) == (0, 0, 0)
+    out = expected[0]
+    assert out['valid'] == pkts['valid'][0]
+    # Outer header from the VIP to the PA of the entry, VNI of the destination VNET
+    assert str(h.ip_from_words(4, *out['ip']['src'])) == VIP
+    assert str(h.ip_from_words(4, *out['ip']['dst'])) == '172.16.1.20'
+    assert out['l4']['dport'] == h.UDP_PORT_VXLAN
+    assert out['vni'] == 1000
+    assert h.int_to_mac(out['inner_eth']['dst']) == '00:dd:dd:dd:00:00'
+    assert h.int_to_mac(out['inner_eth']['src']) == ENI_MAC
+    # The overlay packet is kept
+    for field in ('src', 'dst', 'proto', 'len'):
+        assert (out['inner_ip'][field] == pkts['inner_ip'][field][0]).all()
+    assert out['ip']['len'] == pkts['ip']['len'][0]
+
+
+@pytest.mark.parametrize('fields, reason', [
+    ({'vip': '172.16.1.101'}, 'vip'),
+    ({'vni': 101}, 'direction'),
+    ({'smac': '00:cc:cc:cc:00:01'}, 'eni_address'),
+    ({'dip': '10.2.0.1'}, 'routing'),
+    ({'dip': '10.1.2.51'}, 'ca_to_pa'),
+])
+def test_drops(config, fields, reason):
+    expected, meta = OutboundModel(config).process(vxlan_packets(1, **fields))
+    assert meta['dropped'][0]
+    assert DROP_REASONS[meta['drop_reason'][0]] == reason
+
+
+def test_first_drop_reason_is_kept(config):
+    _, meta = OutboundModel(config).process(vxlan_packets(1, vip='172.16.1.101', dip='10.2.0.1'))
+    assert DROP_REASONS[meta['drop_reason'][0]] == 'vip'
+
+
+def test_admin_state():
+    records = list(read_records(SIMPLE_CONFIG))
+    eni = next(record for record in records if record['type'] == 'SAI_OBJECT_TYPE_ENI')
+    attrs = eni['attributes']
+    attrs[attrs.index('SAI_ENI_ATTR_ADMIN_STATE') + 1] = 'False'
+    _, meta = OutboundModel(SaiConfig(records)).process(vxlan_packets(1))
+    assert DROP_REASONS[meta['drop_reason'][0]] == 'admin_state'
+
+
+def test_chunks(config):
+    """ A batch larger than a chunk gives the same result as its packets one by one """
+    pkts = np.concatenate([vxlan_packets(3), vxlan_packets(3, dip='10.1.2.51'), vxlan_packets(3, vni=101)])
+    expected, meta = OutboundModel(config, chunk_size=2).process(pkts)
+    for i in range(len(pkts)):
+        one, one_meta = OutboundModel(config).process(pkts[i:i + 1])
+        assert expected[i].tobytes() == one[0].tobytes()
+        assert meta[i].tobytes() == one_meta[0].tobytes()
+    assert meta['dropped'].tolist() == [False] * 3 + [True] * 6
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from dash_model import EniPolicer, SaiConfig
+from dash_model.bench import policer_records
+from dash_model.policer import uniform_profile
+
+BURST = 0.1
+DURATION = 2.0
+
+
+@pytest.fixture(scope='module')
+def policer():
+    """ 2 ENIs, limited to half and all of 1000 CPS, 10000 PPS and 500 FLOWS """
+    return EniPolicer(SaiConfig(policer_records(2, 1000, 10000, 500)), burst=BURST, tick=0.001)
+
+
+def limits(policer, name):
+    return dict(zip(map(str, policer.eni_ids), getattr(policer, name).tolist()))
+
+
+def test_under_the_limits(policer):
+    report = policer.predict(uniform_profile(policer.eni_ids, flows=10, cps=100, lifetime=0.5, pps=10), DURATION)
+    assert report['dropped_connections'] == 0
+    assert report['dropped_packets'] == 0
+    for eni in report['enis'].values():
+        assert eni['accepted_connections'] == eni['offered_connections'] == 200
+
+
+def test_cps_limit(policer):
+    report = policer.predict(uniform_profile(policer.eni_ids, cps=2000, lifetime=0.01, pps=1), DURATION)
+    for eni_id, cps in limits(policer, 'cps').items():
+        eni = report['enis'][eni_id]
+        # The rate of the limit, and the full bucket of the start
+        assert eni['accepted_connections'] == pytest.approx(cps * (DURATION + BURST), rel=0.01)
+        assert eni['dropped_connections'] == eni['offered_connections'] - eni['accepted_connections'] > 0
+
+
+def test_flows_limit(policer):
+    report = policer.predict(uniform_profile(policer.eni_ids, cps=2000, lifetime=10, pps=1), DURATION)
+    for eni_id, flows in limits(policer, 'flows').items():
+        eni = report['enis'][eni_id]
+        assert eni['peak_flows'] == flows
+        # No connection ends, the budget is spent once
+        assert eni['accepted_connections'] == flows
+
+
+def test_open_flows_take_the_budget_first(policer):
+    report = policer.predict(uniform_profile(policer.eni_ids, flows=1000, cps=100, lifetime=1, pps=1), DURATION)
+    for eni_id, flows in limits(policer, 'flows').items():
+        eni = report['enis'][eni_id]
+        assert eni['peak_flows'] == flows
+        assert eni['accepted_connections'] == 0
+
+
+def test_pps_limit(policer):
+    report = policer.predict(uniform_profile(policer.eni_ids, flows=100, pps=200), DURATION)
+    for eni_id, pps in limits(policer, 'pps').items():
+        eni = report['enis'][eni_id]
+        assert eni['accepted_packets'] == pytest.approx(pps * (DURATION + BURST), rel=0.01)
+        assert eni['policed_packets'] == eni['offered_packets'] - eni['accepted_packets'] > 0
+        assert eni['meter']['outbound']['accepted'] == eni['accepted_packets']
+        assert eni['meter']['inbound'] == {'accepted': 0, 'dropped': 0}
+
+
+def test_no_limits():
+    policer = EniPolicer(SaiConfig(policer_records(2, 0, 0, 0)), burst=BURST)
+    report = policer.predict(uniform_profile(policer.eni_ids, flows=1000, cps=5000, lifetime=1, pps=100), 1.0)
+    assert report['dropped_connections'] == 0
+    assert report['dropped_packets'] == 0
+    ceiling = policer.ceiling(uniform_profile(policer.eni_ids, cps=100, lifetime=0.1), 'cps', 1.0, limit=64)
+    assert all(eni['scale'] is None and eni['bound'] is None for eni in ceiling['enis'].values())
+
+
+@pytest.mark.parametrize('rate, profile', [('cps', {'cps': 100, 'lifetime': 0.1}), ('pps', {'flows': 10, 'pps': 10})])
+def test_ceiling(policer, rate, profile):
+    result = policer.ceiling(uniform_profile(policer.eni_ids, **profile), rate, DURATION)
+    for eni_id, limit in limits(policer, rate).items():
+        eni = result['enis'][eni_id]
+        assert eni['bound'] == limit
+        # The full buckets of the start let the ceiling pass the bound by about burst / duration
+        assert limit * 0.98 <= eni['ceiling'] <= limit * (1 + BURST / DURATION) * 1.02
+
+
+def test_unknown_eni(policer):
+    with pytest.raises(ValueError):
+        policer.predict(uniform_profile([12345], cps=1), DURATION)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from dash_model import SaiConfig
+from dash_model.bench import synth_records
+from dash_model.synth import FlowSynthesizer, expand, pack, template_dicts
+
+
+@pytest.fixture(scope='module', params=[(0, True), (0, False), (50, True)], ids=['drops', 'forwarded', 'acl'])
+def synth(request):
+    """ 4 ENIs of 8 routes of 8 CA to PA entries, behind 3 ACL stages of the rules of the param """
+    rules, drops = request.param
+    synth = FlowSynthesizer(SaiConfig(synth_records(4, 8, 8, rules)), drops=drops)
+    synth.templates()
+    return synth
+
+
+def test_templates_keep_the_coverage(synth):
+    """ The packets of the templates hit every target the selected probes hit """
+    templates = synth.templates()
+    probe, target, meta = synth.cover(expand(templates))
+    _, hit_probe, selected_target, selected = synth.result
+    assert set(selected_target[np.isin(hit_probe, selected)].tolist()) <= set(target.tolist())
+    if not synth.drops:
+        assert not meta['dropped'].any()
+
+
+def test_selection_hits_every_target_hit(synth):
+    _, hit_probe, target, selected = synth.result
+    assert set(target[np.isin(hit_probe, selected)].tolist()) == set(target.tolist())
+    assert len(selected) < len(synth.result[0])
+
+
+def test_every_entry_is_hit(synth):
+    report = synth.report()
+    for kind, table in report['tables'].items():
+        if kind != 'dash_acl_rule':
+            assert table['hit'] == table['entries'], kind
+    assert report['tables']['outbound_ca_to_pa_entry']['entries'] == 256
+    if report['tables']['dash_acl_rule']['entries']:
+        assert report['tables']['dash_acl_rule']['hit'] > 0
+    assert report['probes'] == int(synth.templates()['count'].sum())
+    if synth.drops:
+        assert any(path.endswith('/none') for path in report['paths'])
+        assert any(not path.endswith('/none') for path in report['paths'])
+    else:
+        assert all(path.endswith('/none') for path in report['paths'])
+
+
+def test_pack_expand_round_trip(synth):
+    templates = synth.templates()
+    packed = pack(expand(templates))
+    assert len(packed) <= len(templates)
+    assert sorted(map(bytes, expand(packed))) == sorted(map(bytes, expand(templates)))
+    assert len(template_dicts(templates)) == len(templates)
+
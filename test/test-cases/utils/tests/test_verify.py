@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+import pytest
+
+from dash_model import InboundModel, OutboundModel, SaiConfig, read_records
+from dash_model import headers as h
+from dash_model.bench import outbound_packets
+from dash_model.codec import encode
+from dash_model.verify import DashModel, PcapVerifier, pair
+
+SCALE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'scale', 'saic')
+PACKETS = 100
+
+
+@pytest.fixture(scope='module')
+def config():
+    return SaiConfig.from_file(os.path.join(SCALE_DIR, 'vnet_outbound_setup_commands_simple.json'))
+
+
+@pytest.fixture(scope='module')
+def sent(config):
+    """ Packets the simple config encapsulates, the last 10 to a VIP it does not accept """
+    pkts = outbound_packets(config, PACKETS)
+    h.set_ip(pkts['ip']['dst'], slice(PACKETS - 10, None), '172.16.1.101')
+    return pkts
+
+
+@pytest.fixture(scope='module')
+def expected(config, sent):
+    """ The frames of the device: the expected ones, with the fields the model does not predict set """
+    out, meta = OutboundModel(config).process(sent)
+    out = out[~meta['dropped']]
+    out['eth']['dst'] = h.mac_to_int('00:00:02:03:04:05')
+    out['ip']['ttl'] = 63
+    out['ip']['id'] = np.arange(len(out))
+    out['l4']['sport'] = 49152 + np.arange(len(out))
+    return out
+
+
+def chunks(pkts, start=0.0):
+    """ One read_pcap_chunks() batch of the frames of pkts, a microsecond apart """
+    buffer, offsets, lengths = encode(pkts)
+    return [(start + np.arange(len(pkts)) * 1e-6, buffer, offsets, lengths)]
+
+
+def verify(config, sent, received):
+    return PcapVerifier(OutboundModel(config)).run(chunks(sent), chunks(received, 1e-3))
+
+
+def test_pair():
+    pending = np.array([5, 3, 5], dtype=np.uint64)
+    assert pair(pending, np.array([5, 5, 5, 7, 3], dtype=np.uint64)).tolist() == [0, 2, -1, -1, 1]
+
+
+def test_all_matched(config, sent, expected):
+    report = verify(config, sent, expected)
+    assert report['sent'] == PACKETS
+    assert report['dropped'] == 10 and report['drop_reasons'] == {'vip': 10}
+    assert report['expected'] == report['received'] == report['matched'] == PACKETS - 10
+    assert report['mismatched'] == report['missed'] == report['extra'] == 0
+    assert report['flows_with_errors'] == 0 and report['flows'] == []
+
+
+def test_mismatch_missed_and_extra(config, sent, expected):
+    received = expected.copy()
+    received['inner_eth']['dst'][0] = h.mac_to_int('00:dd:dd:dd:00:01')
+    # The last frame is lost, a frame of a flow never sent comes instead
+    received[-1]['inner_ip']['dst'][1] += 1
+    received[-1]['inner_l4']['dport'] += 1
+    report = verify(config, sent, received)
+    assert (report['matched'], report['mismatched'], report['missed'], report['extra']) == (PACKETS - 12, 1, 1, 1)
+    assert report['fields'] == {'inner_eth.dst': 1}
+    assert report['flows_with_errors'] == 3
+    example, = report['examples']
+    assert example['fields'] == {'inner_eth.dst': ['00:dd:dd:dd:00:00', '00:dd:dd:dd:00:01']}
+    assert example['flow']['dst'] == '10.1.2.50'
+
+
+def test_late_frames_are_missed(config, sent, expected):
+    """ The frames of a received chunk are matched before the expiry of the chunk: the first frame
+        comes alone 2 s later, the others after it are too late """
+    verifier = PcapVerifier(OutboundModel(config), window=0.5)
+    report = verifier.run(chunks(sent), chunks(expected[:1], 2.0) + chunks(expected[1:], 2.1))
+    assert report['matched'] == 1
+    assert report['missed'] == report['extra'] == PACKETS - 11
+
+
+def test_ignored_fields(config, sent, expected):
+    verifier = PcapVerifier(OutboundModel(config), ignore=[])
+    report = verifier.run(chunks(sent), chunks(expected, 1e-3))
+    assert report['mismatched'] == PACKETS - 10
+    assert set(report['fields']) == {'eth.dst', 'ip.ttl', 'ip.id', 'ip.chksum', 'l4.sport'}
+    with pytest.raises(ValueError):
+        PcapVerifier(OutboundModel(config), ignore=['ip.nope'])
+
+
+def test_dash_model_follows_the_direction():
+    """ Outbound packets go through the outbound model and inbound ones through the inbound model """
+    records = list(read_records(os.path.join(SCALE_DIR, 'vnet_inbound_setup_commands.json')))
+    config = SaiConfig(records)
+    pkts = outbound_packets(SaiConfig.from_file(os.path.join(SCALE_DIR, 'vnet_outbound_setup_commands_simple.json')), 4)
+    h.set_ip(pkts['ip']['dst'], slice(None), '192.168.0.1')
+    pkts['vni'][:2] = 2000
+    pkts['vni'][2:] = 1000
+    out, meta = DashModel(config).process(pkts)
+    outbound, outbound_meta = OutboundModel(config).process(pkts[:2])
+    inbound, inbound_meta = InboundModel(config).process(pkts[2:])
+    assert out.tobytes() == np.concatenate([outbound, inbound]).tobytes()
+    assert meta.tobytes() == np.concatenate([outbound_meta, inbound_meta]).tobytes()
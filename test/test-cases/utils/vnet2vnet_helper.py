@@ -94,6 +94,90 @@ def scale_vnet_outbound_flows(sai_dp, test_conf: dict, packets_per_flow=1, pps_p
                                          pkt_count=packets_per_flow, pps=pps_per_flow, duration=flow_duration)
 
 
+def set_flow_pattern(pattern, value, step=None, count=1):
+    """
+    Set a snappi header field to a value, or to an increment when step is given.
+
+    Parameters:
+        pattern: snappi pattern of the field.
+        value: first value.
+        step: increment between packets. Default is None, a fixed value.
+        count (int): number of values of the increment. Default is 1.
+    """
+
+    if step is None:
+        pattern.value = value
+    else:
+        pattern.increment.start = value
+        pattern.increment.step = step
+        pattern.increment.count = count
+
+
+def configure_synthesized_packet_flows(sai_dp, records, pkt_count=1, pps=50, duration=0):
+    """
+    Define the flows of the templates synthesized from a configuration: the fewest packets, sent
+    with incremented fields, going through every table entry and action path of the configuration
+    the DPU forwards (see dash_model/synth.py).
+
+    Parameters:
+        sai_dp: sai_dataplane.
+        records (iterable): SAI records of the configuration.
+        pkt_count (int): count of packets to send per each packet of a template. Default is 1.
+        pps (int): packet per second for each flow. Default is 50.
+        duration (int): count in seconds to generate traffic for each flow. Default is 0.
+
+    Return:
+        list of dict: templates of the flows, as given by dash_model.synth.template_dicts().
+    """
+    # The reference model needs numpy, only the tests using synthesized flows import it
+    from dash_model import SaiConfig
+    from dash_model.headers import TCP_PROTO, UDP_PROTO
+    from dash_model.synth import FlowSynthesizer, template_dicts
+
+    synthesizer = FlowSynthesizer(SaiConfig(records), drops=False)
+    templates = template_dicts(synthesizer.templates())
+    report = synthesizer.report()
+    print("\nSynthesized templates: {}, entries hit:".format(len(templates)))
+    for table, counts in report['tables'].items():
+        print(f"\t{table}: {counts['hit']}/{counts['entries']}")
+
+    print("Adding flows {} > {}:".format(sai_dp.configuration.ports[0].name, sai_dp.configuration.ports[1].name))
+    for number, template in enumerate(templates):
+        count = template['count']
+        steps = template['steps']
+        print(f"\t{template}")
+        flow = sai_dp.add_flow("flow {} > {} |template#{}".format(
+                                    sai_dp.configuration.ports[0].name, sai_dp.configuration.ports[1].name, number),
+                               packet_count=count * pkt_count, pps=pps, seconds_count=duration)
+
+        headers = flow.packet.ethernet().ipv4().udp().vxlan().ethernet()
+        headers = headers.ipv6() if template['is_v6'] else headers.ipv4()
+        if template['proto'] == TCP_PROTO:
+            headers = headers.tcp()
+        elif template['proto'] == UDP_PROTO:
+            headers = headers.udp()
+        outer_eth, outer_ip, outer_udp, vxlan, inner_eth, inner_ip, *inner_l4 = headers
+
+        outer_eth.dst.value = "00:00:02:03:04:05"
+        outer_eth.src.value = "00:00:05:06:06:06"
+        outer_udp.src_port.value = 11638
+        outer_udp.dst_port.value = 4789
+        if template['is_v6']:
+            inner_ip.next_header.value = template['proto']
+        else:
+            inner_ip.protocol.value = template['proto']
+
+        patterns = {'vip': outer_ip.dst, 'underlay_sip': outer_ip.src, 'vni': vxlan.vni,
+                    'dmac': inner_eth.dst, 'smac': inner_eth.src, 'dip': inner_ip.dst, 'sip': inner_ip.src}
+        if inner_l4:
+            patterns.update(sport=inner_l4[0].src_port, dport=inner_l4[0].dst_port)
+        for field, pattern in patterns.items():
+            set_flow_pattern(pattern, template[field], steps.get(field), count)
+
+    print(f">>> FLOWS: {len(sai_dp.flows)}")
+    return templates
+
+
 def check_flows_all_packets_metrics(sai_dp, flows, name="Flow group", exp_tx=None, exp_rx=None, show=False):
     """
     Get packet count metrics on list of flows.